@@ -0,0 +1,233 @@
+import re
+from typing import NamedTuple
+
+# Parser for the vision model's answer. The prompt asks for
+#     🍽️Recognized: Nasi Lemak with fried chicken, cucumber, egg & sambal
+#     💪Protein: 38g 🥔Carbs: 92g 🧈Fat: 45g 🍬Sugar: 10g
+#     🔥Calories: 850 kcal
+#     [tips...]
+# but the model drifts: calories on the macro line, "1,200 kcal", bold
+# markdown, "Carbohydrates", ranges, a per-item breakdown with a total line.
+#
+# Every answer goes through the same line scan with one precompiled pattern
+# for labelled values: the dish name line, then the values from the top down
+# (the first of each field wins), "Total" lines correcting the values above
+# them, and the tips from the first line without values below the calories.
+# Each line is matched once, so the time is linear in the answer's length.
+#
+# Album answers have a "📷N dish: values" line per photo. Unless a "Total" line
+# has all five values, the photos' values are added up: the model sometimes
+# leaves the total out or puts "**Total:**" on a line of its own.
+
+
+class ParsedMeal(NamedTuple):
+    recognized: str = "Unknown"
+    calories: float = 0.0
+    protein: float = 0.0
+    carbs: float = 0.0
+    fat: float = 0.0
+    sugar: float = 0.0
+    tips: str = ""
+
+
+# emoji, variation selectors, zero-width characters and markdown emphasis.
+# The patterns skip over these, so only the extracted name and tips get cleaned.
+_NOISE = "\U0001F300-\U0001FAFF\u2600-\u27BF\uFE0F\u200B-\u200D*`"
+_NOISE_RE = re.compile(f"[{_NOISE}]")
+
+# "1,280" and "34.5"; _value() drops the commas. Optional parts are written as alternatives
+# with an empty one, which the regex engine runs much faster than (?:...)? around a group.
+_NUMBER = r"\d[\d,]*(?:\.\d+|)"
+_RANGE = rf"(?:[ \t]*(?:[-–]|to)[ \t]*({_NUMBER})|)"
+
+_NAME_LABELS = "|".join(spelling for label in ("Recogni[sz]ed", "Identified", "Dish")
+                        for spelling in (label, label.upper(), label.lower()))
+_RECOGNIZED_RE = re.compile(rf"[ \t#>\-•{_NOISE}]*(?:{_NAME_LABELS})[ \t{_NOISE}]*[:：](.*)")
+
+_FIELD_BY_LABEL = {}
+for _case in (str.capitalize, str.upper):
+    for _label, _field in (("protein", "protein"), ("carb", "carbs"), ("fat", "fat"), ("sugar", "sugar"),
+                           ("calor", "calories"), ("kcal", "calories"), ("energy", "calories")):
+        _FIELD_BY_LABEL[_case(_label)] = _field
+# "Saturated fat: 9g", "of which sugars: 5g" or "net carbs: 20g" are part of another value, not
+# the value, and "nonfat" is not a label
+_QUALIFIERS = {"carbs": ("net ",), "fat": ("saturated ", r"sat\. ", "sat ", "trans "),
+               "sugar": ("added ", "which ", "free ")}
+_SEPARATORS = "[ \t:：=~≈*\u200b-\u200d\ufe0f]*"
+# "Protein: 38g", "Carbohydrates: ~92 g", "Calories (approx): 800-900 kcal", "ENERGY = 1,200kcal".
+# The labels are spelled capitalised and upper case, as the model writes them, instead of using
+# re.I, which is much slower. The qualifiers are lookbehinds after the label, so the engine still
+# skips ahead to the labels' first letters and only checks them where a label is. The repeats
+# that could run along a line of letters are bounded.
+_LABELLED_RE = re.compile(
+    "(" + "|".join(spelling + f"(?<![a-zA-Z]{spelling})"
+                   + "".join(f"(?<!(?i:{q}){spelling})" for q in _QUALIFIERS.get(field, ()))
+                   for spelling, field in _FIELD_BY_LABEL.items())
+    + rf")[a-zA-Z]{{0,12}}{_SEPARATORS}(?:\([^)\d\n]{{0,40}}\){_SEPARATORS}|)"
+    rf"(?:[aA](?:bout|pprox\.?|round)[ \t]*|)({_NUMBER}){_RANGE}"
+)
+# bare "850 kcal" without a label; the number is bounded so a run of digits stays linear
+_KCAL_RE = re.compile(r"(\d[\d,]{0,8}(?:\.\d{1,3}|))" + _RANGE + r"[ \t]*(?i:kcal|calories)\b")
+
+# the start of an album answer's line for one photo
+_PHOTO_RE = re.compile(r"[ \t>\-•*]*📷")
+
+_FIELDS = ("calories", "protein", "carbs", "fat", "sugar")
+_ZEROS = dict.fromkeys(_FIELDS, 0.0)
+_EMPTY_RESULT = {"recognized": "Unknown", **_ZEROS, "tips": ""}
+
+
+def _value(low: str, high: str) -> float:
+    low = float(low.replace(",", "") if "," in low else low)
+    if not high:
+        return low
+    # a range: use the middle of it
+    return (low + float(high.replace(",", ""))) / 2
+
+
+def _strip_noise(text: str) -> str:
+    if text.isascii():  # O(1) for str; then only the markdown characters can be there
+        if "*" in text or "`" in text:
+            text = text.replace("*", "").replace("`", "")
+        return text
+    return _NOISE_RE.sub("", text)
+
+
+def _tips(lines: list) -> str:
+    tips = lines[0] if len(lines) == 1 else " ".join(lines)
+    if not tips.isascii():  # O(1) for str
+        tips = _NOISE_RE.sub("", tips)
+    elif "*" in tips or "`" in tips:
+        tips = tips.replace("*", "").replace("`", "")
+    # single-spaced printable text only needs the ends trimmed
+    if "  " in tips or not tips.isprintable():
+        return " ".join(tips.split())
+    return tips.strip()
+
+
+def _read(lines: list, number: int, values: dict) -> int:
+    """Labelled values from lines[number] down into values; returns the line the tips start at."""
+    corrected = ()
+    complete = len(values) == 5
+    for number in range(number, len(lines)):
+        line = lines[number]
+        if complete:
+            # only a "Total" line can follow complete values
+            if not line or line.isspace():
+                continue
+            if "otal" not in line and "OTAL" not in line:
+                return number
+        tokens = _LABELLED_RE.findall(line)
+        if tokens:
+            if values and ("otal" in line or "OTAL" in line):
+                # a "Total" line corrects the values above it, once per field
+                for label, first, second in tokens:
+                    field = _FIELD_BY_LABEL[label]
+                    if field not in corrected:
+                        values[field] = _value(first, second)
+                        corrected += (field,)
+            else:
+                for label, first, second in tokens:
+                    field = _FIELD_BY_LABEL[label]
+                    if field not in values:
+                        values[field] = float(first) if not second and "," not in first else _value(first, second)
+            complete = len(values) == 5
+        elif "calories" in values and line and not line.isspace():
+            return number  # the first line without values below the calories
+    return len(lines)
+
+
+def _album(lines: list, start: int) -> tuple:
+    """The model's own total line if it has every value, else the photos added up; None if no photos."""
+    photos = []
+    tips_start = total_line = None
+    for number in range(start, len(lines)):
+        line = lines[number]
+        if "📷" in line and _PHOTO_RE.match(line) is not None:
+            current = {}
+            photos.append(current)
+        elif not photos:
+            continue
+        elif "otal" in line or "OTAL" in line:
+            total_line = number
+            break
+        tokens = _LABELLED_RE.findall(line)
+        if tokens:
+            for label, first, second in tokens:
+                field = _FIELD_BY_LABEL[label]
+                if field not in current:
+                    current[field] = float(first) if not second and "," not in first else _value(first, second)
+        elif current and line and not line.isspace():
+            tips_start = number  # the first line without values below the photos
+            break
+    if not any(photos):
+        return None, len(lines)
+    if total_line is not None:
+        values = {}
+        for label, first, second in _LABELLED_RE.findall(lines[total_line]):
+            values.setdefault(_FIELD_BY_LABEL[label], _value(first, second))
+        if len(values) == 5:
+            return values, _read(lines, total_line + 1, values)
+        # "**Total:**" on a line of its own with the values below it; the tips start after them
+        for tips_start in range(total_line + 1, len(lines)):
+            line = lines[tips_start]
+            if line and not line.isspace() and _LABELLED_RE.search(line) is None:
+                break
+        else:
+            tips_start = None
+    values = _ZEROS.copy()
+    for current in photos:
+        for field, value in current.items():
+            values[field] += value
+    return values, len(lines) if tips_start is None else tips_start
+
+
+def _parse(text: str) -> tuple:
+    recognized = "Unknown"
+    lines = text.split("\n")
+    end = len(lines)
+    # the dish name comes before the values; values in it ("Protein bar") are not macros
+    start = end
+    for number, line in enumerate(lines):
+        match = _RECOGNIZED_RE.match(line) if ":" in line or "：" in line else None
+        if match is not None:
+            recognized = _strip_noise(match.group(1)).strip() or "Unknown"
+            start = number + 1
+            break
+        if _LABELLED_RE.search(line) is not None:
+            start = number
+            break
+
+    values = None
+    if "📷" in text:
+        values, tips_start = _album(lines, start)
+    if values is None:
+        values = {}
+        tips_start = _read(lines, start, values)
+        if "calories" not in values:
+            # no "Calories:" label; the first bare "N kcal" below the last labelled line is the
+            # total, earlier ones are usually an item breakdown
+            below = end
+            while below > start and _LABELLED_RE.search(lines[below - 1]) is None:
+                below -= 1
+            for number in (*range(below, end), *range(start, below)):
+                match = _KCAL_RE.search(lines[number])
+                if match is not None:
+                    values["calories"] = _value(*match.groups())
+                    tips_start = number + 1
+                    break
+    return recognized, values, "" if tips_start >= end else _tips(lines[tips_start:])
+
+
+def parse_meal(text: str) -> ParsedMeal:
+    recognized, values, tips = _parse(text)
+    return ParsedMeal(recognized, tips=tips, **values)
+
+
+def parse_ai_result(text: str) -> dict:
+    """Same dict shape the bot has always stored: recognized, calories, protein, carbs, fat, sugar, tips."""
+    recognized, values, tips = _parse(text)
+    result = {**_EMPTY_RESULT, **values}
+    result["recognized"] = recognized
+    result["tips"] = tips
+    return result
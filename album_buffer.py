@@ -0,0 +1,163 @@
+import json
+import threading
+import time
+
+import db
+
+# Collects the photos of a Telegram album (messages sharing a media_group_id).
+# Telegram delivers every photo of an album as its own update, a few
+# milliseconds apart. Each photo is added to the buffer and the group is
+# handed to on_ready(messages) once no new photo has arrived for `window`
+# seconds (or the album is full), so the bot can answer it with one model
+# call instead of one per photo.
+# AlbumBuffer keeps the photos in this process; SQLiteAlbumBuffer keeps them
+# in the bot database, so an album whose photos reach different worker
+# processes is still answered once, by whichever worker's timer claims it.
+
+MAX_ALBUM_PHOTOS = 10  # Telegram's limit
+STALE_AFTER = 3600.0
+
+
+class _AlbumBufferBase:
+    def __init__(self, on_ready, window: float = 1.0, max_photos: int = MAX_ALBUM_PHOTOS):
+        self.on_ready = on_ready
+        self.window = window
+        self.max_photos = max_photos
+        self._due = {}  # group key -> monotonic time to look at it again
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self.albums = 0
+        self.photos = 0
+
+    @staticmethod
+    def group_key(message) -> str:
+        return f"{message.chat.id}:{message.media_group_id}"
+
+    def start(self):
+        # one thread for all albums (and one database connection for the SQLite buffer)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="album-flush", daemon=True)
+            self._thread.start()
+        return self
+
+    def add(self, message):
+        key = self.group_key(message)
+        count = self._append(key, message)
+        with self._wakeup:
+            self.photos += 1
+        self._schedule(key, 0.0 if count >= self.max_photos else self.window)
+
+    def _schedule(self, key: str, delay: float):
+        with self._wakeup:
+            self._due[key] = time.monotonic() + delay
+            self._wakeup.notify()
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while True:
+                    now = time.monotonic()
+                    ready = [key for key, due in self._due.items() if due <= now]
+                    if ready:
+                        break
+                    self._wakeup.wait(min(self._due.values()) - now if self._due else None)
+                for key in ready:
+                    del self._due[key]
+            for key in ready:
+                self._flush(key)
+
+    def _flush(self, key: str):
+        try:
+            messages = self._take(key, 0.0 if self._full(key) else self.window)
+            if isinstance(messages, float):  # photos still arriving
+                self._schedule(key, messages)
+                return
+            if not messages:  # claimed by another process
+                return
+            with self._wakeup:
+                self.albums += 1
+            self.on_ready(messages)
+        except Exception as e:
+            print(f"Album flush ({key}) failed:", str(e))
+
+    def stats(self) -> dict:
+        with self._wakeup:
+            return {"albums": self.albums, "photos": self.photos, "waiting": len(self._due)}
+
+
+class AlbumBuffer(_AlbumBufferBase):
+    def __init__(self, on_ready, window: float = 1.0, max_photos: int = MAX_ALBUM_PHOTOS):
+        super().__init__(on_ready, window, max_photos)
+        self._groups = {}  # group key -> (last arrival, [messages])
+        self._lock = threading.Lock()
+
+    def _append(self, key: str, message) -> int:
+        with self._lock:
+            _, messages = self._groups.get(key, (0.0, []))
+            messages.append(message)
+            self._groups[key] = (time.monotonic(), messages)
+            return len(messages)
+
+    def _full(self, key: str) -> bool:
+        with self._lock:
+            return len(self._groups.get(key, (0.0, []))[1]) >= self.max_photos
+
+    def _take(self, key: str, quiet: float):
+        """The album's messages in order, seconds still to wait, or None when it is gone."""
+        with self._lock:
+            entry = self._groups.get(key)
+            if entry is None:
+                return None
+            remaining = entry[0] + quiet - time.monotonic()
+            if remaining > 0:
+                return remaining
+            del self._groups[key]
+        return sorted(entry[1], key=lambda m: m.message_id)
+
+
+class SQLiteAlbumBuffer(_AlbumBufferBase):
+    """Messages are stored as the update JSON telebot parsed them from."""
+
+    def __init__(self, on_ready, window: float = 1.0, max_photos: int = MAX_ALBUM_PHOTOS):
+        super().__init__(on_ready, window, max_photos)
+        from telebot.types import Message
+        self._message_type = Message
+
+    @staticmethod
+    def create_table(cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS album_photos (
+                group_key TEXT NOT NULL,
+                message_id INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                received_at REAL NOT NULL,
+                PRIMARY KEY (group_key, message_id)
+            )
+        """)
+
+    def _append(self, key: str, message) -> int:
+        now = time.time()  # wall clock, not monotonic: other processes compare these timestamps
+        with db.transaction() as conn:
+            # photos of a process that stopped before its timer fired
+            conn.execute("DELETE FROM album_photos WHERE received_at < ?", (now - STALE_AFTER,))
+            conn.execute("INSERT OR REPLACE INTO album_photos VALUES (?, ?, ?, ?)",
+                         (key, message.message_id, json.dumps(message.json), now))
+            return conn.execute("SELECT COUNT(*) FROM album_photos WHERE group_key = ?", (key,)).fetchone()[0]
+
+    def _full(self, key: str) -> bool:
+        return db.query_one("SELECT COUNT(*) FROM album_photos WHERE group_key = ?",
+                            (key,))[0] >= self.max_photos
+
+    def _take(self, key: str, quiet: float):
+        with db.transaction() as conn:
+            last = conn.execute("SELECT MAX(received_at) FROM album_photos WHERE group_key = ?",
+                                (key,)).fetchone()[0]
+            if last is None:
+                return None
+            remaining = last + quiet - time.time()
+            if remaining > 0:
+                return remaining
+            # one statement, so only one process ever gets the photos
+            rows = conn.execute("DELETE FROM album_photos WHERE group_key = ? RETURNING message_id, message",
+                                (key,)).fetchall()
+        return [self._message_type.de_json(json.loads(message)) for _, message in sorted(rows)]
@@ -0,0 +1,121 @@
+# Storage of the model answers: inline text vs compressed history_text.
+#
+#   python benchmarks/bench_compression.py [--rows 50000]
+#
+# 1. Bytes per answer for the recorded answers in model_responses.json: plain
+#    zlib, zlib with text_codec's built-in dictionary, and with a dictionary
+#    trained by text_codec.train_dictionary on the other half of the answers.
+# 2. Two throwaway databases with --rows meals, one keeping full_text/tips in
+#    history (the old layout), one with the compressed side table: file size,
+#    /history page latency and the cost of reading one answer back.
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import text_codec  # noqa: E402
+from ai_parser import parse_meal  # noqa: E402
+from fake_inference_server import CANNED_ANSWER  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PAGE_SQL = """SELECT id, timestamp, recognized, calories, protein, carbs, fat, sugar
+              FROM history WHERE user_id = ? ORDER BY id DESC LIMIT 10"""
+
+
+def load_answers() -> list:
+    with open(os.path.join(HERE, "model_responses.json"), encoding="utf-8") as f:
+        return [case["text"] for case in json.load(f)] + [CANNED_ANSWER]
+
+
+def ratio_table(answers: list):
+    train, test = answers[::2], answers[1::2]
+    trained = text_codec.train_dictionary(train)
+    text_codec.DICTIONARIES[99] = trained
+
+    raw = sum(len(a.encode("utf-8")) for a in test)
+    plain = sum(len(zlib.compress(a.encode("utf-8"), 9)) for a in test)
+    builtin = sum(len(text_codec.compress(a)) for a in test)
+    custom = sum(len(text_codec.compress(a, version=99)) for a in test)
+    n = len(test)
+    print(f"answers: {n} held out, dictionary trained on {len(train)} ({len(trained)} bytes)")
+    print(f"    raw                {raw / n:7.0f} B")
+    print(f"    zlib               {plain / n:7.0f} B  ({plain / raw:.0%})")
+    print(f"    built-in dict      {builtin / n:7.0f} B  ({builtin / raw:.0%})")
+    print(f"    trained dict       {custom / n:7.0f} B  ({custom / raw:.0%})")
+    del text_codec.DICTIONARIES[99]
+
+
+def build(path: str, rows: int, answers: list, compressed: bool):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("""CREATE TABLE history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, timestamp TEXT NOT NULL,
+        recognized TEXT, calories REAL, protein REAL, carbs REAL, fat REAL, sugar REAL,
+        tips TEXT, full_text TEXT)""")
+    conn.execute("CREATE INDEX idx_history_user_id ON history (user_id, id)")
+    conn.execute("CREATE TABLE history_text (history_id INTEGER PRIMARY KEY, full_text BLOB, tips BLOB)")
+    parsed = [parse_meal(a) for a in answers]
+    encoded = [(text_codec.compress(a), text_codec.compress(p.tips)) for a, p in zip(answers, parsed)]
+    rng = random.Random(1)
+    conn.execute("BEGIN")
+    for i in range(rows):
+        k = rng.randrange(len(answers))
+        p = parsed[k]
+        values = (i % 500, f"2026-01-01 {i % 24:02d}:00:00", p.recognized, p.calories, p.protein,
+                  p.carbs, p.fat, p.sugar)
+        if compressed:
+            row_id = conn.execute("""INSERT INTO history (user_id, timestamp, recognized, calories, protein,
+                                     carbs, fat, sugar) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", values).lastrowid
+            conn.execute("INSERT INTO history_text VALUES (?, ?, ?)", (row_id, *encoded[k]))
+        else:
+            conn.execute("""INSERT INTO history (user_id, timestamp, recognized, calories, protein, carbs,
+                            fat, sugar, tips, full_text) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                         values + (p.tips, answers[k]))
+    conn.execute("COMMIT")
+    conn.execute("VACUUM")
+    return conn
+
+
+def per_call_us(fn, repeat: int = 2000) -> float:
+    start = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    args = parser.parse_args()
+
+    answers = load_answers()
+    ratio_table(answers)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"\n{args.rows} meals{'':<10}{'file MB':>9}{'page µs':>10}{'answer µs':>11}")
+        for name, compressed in (("inline text", False), ("history_text", True)):
+            path = os.path.join(tmp, f"{name.replace(' ', '_')}.db")
+            conn = build(path, args.rows, answers, compressed)
+            page_us = per_call_us(lambda i: conn.execute(PAGE_SQL, (i % 500,)).fetchall())
+            if compressed:
+                def read_answer(i):
+                    row = conn.execute("SELECT full_text FROM history_text WHERE history_id = ?",
+                                       (1 + i * 7 % args.rows,)).fetchone()
+                    return text_codec.decompress(row[0])
+            else:
+                def read_answer(i):
+                    return conn.execute("SELECT full_text FROM history WHERE id = ?",
+                                        (1 + i * 7 % args.rows,)).fetchone()[0]
+            answer_us = per_call_us(read_answer)
+            conn.close()
+            print(f"{name:<20}{os.path.getsize(path) / 1e6:>9.1f}{page_us:>10.1f}{answer_us:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# Micro-benchmark: per-call sqlite3.connect (the old helpers) vs the shared db module.
+#
+#   python benchmarks/bench_db.py [--seconds 2] [--threads 4]
+#
+# Runs the bot's real queries (profile lookup, recent history + total, insert)
+# against a throwaway database and prints queries per second for both.
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db  # noqa: E402
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, timestamp TEXT NOT NULL,
+        recognized TEXT, calories REAL, protein REAL, carbs REAL, fat REAL, sugar REAL,
+        tips TEXT, full_text TEXT)""",
+    """CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY, sex TEXT, age INTEGER, height_cm REAL,
+        weight_kg REAL, updated_at TEXT)""",
+]
+PROFILE_SQL = "SELECT sex, age, height_cm, weight_kg FROM users WHERE user_id = ?"
+RECENT_SQL = """SELECT timestamp, recognized, calories, protein, carbs, fat, sugar
+                FROM history WHERE user_id = ? ORDER BY id DESC LIMIT ?"""
+TOTAL_SQL = "SELECT SUM(calories) FROM history WHERE user_id = ?"
+INSERT_SQL = """INSERT INTO history (user_id, timestamp, recognized, calories, protein, carbs, fat, sugar, tips, full_text)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+USERS = 200
+
+
+def setup(path):
+    conn = sqlite3.connect(path)
+    for sql in SCHEMA:
+        conn.execute(sql)
+    conn.executemany("INSERT INTO users VALUES (?, 'male', 30, 175, 70, '')", [(u,) for u in range(USERS)])
+    rows = [(random.randrange(USERS), "2026-01-01 12:00:00", "Rice", 500, 20, 80, 10, 5, "tip", "text")
+            for _ in range(5000)]
+    conn.executemany(INSERT_SQL, rows)
+    conn.commit()
+    conn.close()
+
+
+def op_mix(run_query, run_write):
+    # 8 reads per write, roughly /start + /history traffic vs saves
+    user = random.randrange(USERS)
+    run_query(PROFILE_SQL, (user,))
+    run_query(RECENT_SQL, (user, 10))
+    run_query(TOTAL_SQL, (user,))
+    if random.random() < 0.125:
+        run_write(INSERT_SQL, (user, "2026-01-01 12:00:00", "Rice", 500, 20, 80, 10, 5, "tip", "text"))
+        return 4
+    return 3
+
+
+def per_call_connect(path):
+    def run_query(sql, params):
+        conn = sqlite3.connect(path)
+        conn.execute(sql, params).fetchall()
+        conn.close()
+
+    def run_write(sql, params):
+        conn = sqlite3.connect(path)
+        conn.execute(sql, params)
+        conn.commit()
+        conn.close()
+    return run_query, run_write
+
+
+def shared_db():
+    def run_write(sql, params):
+        with db.transaction() as conn:
+            conn.execute(sql, params)
+    return db.query_all, run_write
+
+
+def run(make_ops, seconds, threads):
+    total = [0]
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        run_query, run_write = make_ops()
+        done = 0
+        failed = 0
+        while time.perf_counter() < deadline:
+            try:
+                done += op_mix(run_query, run_write)
+            except sqlite3.OperationalError:
+                failed += 1
+        with lock:
+            total[0] += done
+            errors[0] += failed
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return total[0] / (time.perf_counter() - start), errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        old_path = os.path.join(tmp, "old.db")
+        new_path = os.path.join(tmp, "new.db")
+        setup(old_path)
+        setup(new_path)
+        db.configure(new_path)
+
+        for threads in sorted({1, args.threads}):
+            qps_old, err_old = run(lambda: per_call_connect(old_path), args.seconds, threads)
+            qps_new, err_new = run(shared_db, args.seconds, threads)
+            print(f"threads={threads}")
+            print(f"  per-call connect : {qps_old:10.0f} queries/s  ({err_old} locked errors)")
+            print(f"  shared db module : {qps_new:10.0f} queries/s  ({err_new} locked errors)")
+            print(f"  speed-up         : {qps_new / qps_old:10.1f}x")
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# /export memory and speed on a very long history.
+#
+#   python benchmarks/bench_export.py [--rows 1000000]
+#
+# Gives one user --rows meals in a throwaway database, then exports them with
+# history_export (streamed from a cursor into a file) and, for comparison, the
+# old way of building the whole text from fetchall(). Peak Python memory is
+# measured with tracemalloc; the streamed export should stay flat as --rows grows.
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db  # noqa: E402
+import history_export  # noqa: E402
+import migrations  # noqa: E402
+import text_codec  # noqa: E402
+
+USER = 7
+
+
+def fill(rows: int):
+    tips = text_codec.compress("Swap the fried chicken for grilled to save about 200 kcal.")
+    with db.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO history (user_id, timestamp, recognized, calories, protein, carbs, fat, sugar)
+            VALUES (?, ?, 'Nasi lemak with fried chicken, cucumber, egg & sambal', 850, 38, 92, 45, 10)
+        """, ((USER, f"2026-01-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00") for i in range(rows)))
+        conn.execute("INSERT INTO history_text (history_id, tips) SELECT id, ? FROM history", (tips,))
+
+
+def materialized(fmt: str) -> int:
+    rows = [row[:-1] + (text_codec.decompress(row[-1]),) for row in db.query_all("""
+        SELECT h.timestamp, h.recognized, h.calories, h.protein, h.carbs, h.fat, h.sugar, t.tips
+        FROM history h LEFT JOIN history_text t ON t.history_id = h.id
+        WHERE h.user_id = ? ORDER BY h.id
+    """, (USER,))]
+    encode = history_export.iter_ndjson if fmt == "json" else history_export.iter_csv
+    return len("".join(encode(rows)))
+
+
+def measure(name: str, fn, cleanup=lambda result: None):
+    # timed without tracemalloc (it slows Python code down several times), then run again for the peak
+    start = time.perf_counter()
+    cleanup(fn())
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{name:<22}{elapsed:>8.2f}s{peak / 1e6:>12.1f} MB peak")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(os.path.join(tmp, "bench.db"))
+        migrations.migrate()
+        fill(args.rows)
+        print(f"{args.rows} rows\n{'':<22}{'time':>9}{'memory':>17}")
+
+        for fmt in history_export.FORMATS:
+            path, name, rows = measure(f"streamed {fmt}", lambda: history_export.write_export(USER, fmt, tmp),
+                                       lambda result: os.remove(result[0]))
+            print(f"{'':<22}{rows} rows, {os.path.getsize(path) / 1e6:.1f} MB file ({name})")
+            os.remove(path)
+            measure(f"materialized {fmt}", lambda: materialized(fmt))
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
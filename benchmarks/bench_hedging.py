@@ -0,0 +1,214 @@
+# Tail latency of model requests with hedging and route demotion (inference_router).
+#
+#   python benchmarks/bench_hedging.py [--requests 400] [--concurrency 8] [--latency lognormal:0.2:0.8]
+#
+# Every route is its own fake_inference_server.py with the same heavy-tailed
+# latency. Each scenario warms the routes up with --warmup requests (so they
+# have p95s to hedge at), then sends --requests through the router,
+# --concurrency at a time, and prints p50/p95/p99 of the whole request, how
+# many were hedged and how many requests the endpoints received in total.
+#   single       one route
+#   unhedged     two routes, hedging off (a slow answer is waited for)
+#   hedged       two routes, the request is also sent to the second after the first's p95
+#   failing      the first route answers 500 to everything, no demotion: every request fails over
+#   demoted      same, but the first route is demoted after 3 failures in a row
+#
+# Fails unless, against the fake endpoints:
+#   - a hedge goes out once the first route's p95 has passed, not before;
+#   - the losing request's socket is aborted, so its attempt ends with the answer;
+#   - a failing route is demoted, skipped, and asked first again after its cooldown,
+#     while a route answering 503 (throttling) is not demoted;
+#   - hedging lowers the p99 latency compared with the unhedged scenario.
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import vision_client  # noqa: E402
+from fake_inference_server import start_server  # noqa: E402
+from inference_router import InferenceRouter, Route  # noqa: E402
+
+PROMPT = "I ate a bowl of tonkotsu ramen with an egg."
+
+
+def send(route, body, on_partial, on_connect):
+    return vision_client.complete(route.url, None, route.model, body, on_partial, timeout=30, on_connect=on_connect)
+
+
+def check_hedge(body) -> list:
+    """The hedge goes out after the first route's p95, and the request that lost is aborted."""
+    (slow, slow_state), (fast, fast_state) = start_server(latency="0.1"), start_server(latency="0.05")
+    routes = [Route(name, vision_client.chat_url(f"http://127.0.0.1:{server.server_port}"), "fake")
+              for name, server in (("slow", slow), ("fast", fast))]
+    ended = {}
+
+    def send_logged(route, body, on_partial, on_connect):
+        try:
+            return send(route, body, on_partial, on_connect)
+        finally:
+            ended[route.name] = time.monotonic()
+
+    router = InferenceRouter(routes, send_logged, hedge_delay=5.0, min_samples=20)
+    for _ in range(20):
+        router.complete(body)
+    p95 = router.hedge_after(routes[0])
+    slow_state.latency = lambda: 2.0
+    arrived = []
+    fast_state.latency = lambda: arrived.append(time.monotonic()) or 0.05
+    ended.clear()
+    start = time.monotonic()
+    router.complete(body)
+    answered = time.monotonic()
+    time.sleep(0.5)
+    for server in (slow, fast):
+        server.shutdown()
+
+    failures = []
+    hedge_at = arrived[0] - start if arrived else None
+    print(f"hedge: first route p95 {p95 * 1000:.0f} ms, hedge arrived after "
+          + (f"{hedge_at * 1000:.0f} ms" if hedge_at is not None else "never"))
+    if hedge_at is None or not p95 <= hedge_at < p95 + 0.25:
+        failures.append("the hedge did not go out right after the first route's p95")
+    loser = ended.get("slow")
+    print("loser: " + (f"its attempt ended {(loser - answered) * 1000:.0f} ms after the answer"
+                       if loser is not None else "its attempt had not ended 500 ms after the answer"))
+    if loser is None or loser - answered > 0.25:
+        failures.append("the losing request was not aborted")
+    return failures
+
+
+def check_demotion(body) -> list:
+    """A failing route is demoted, skipped and back after its cooldown; a throttled one stays."""
+    (broken, broken_state), (healthy, _), (busy, busy_state) = (
+        start_server(latency="0.01", fail_rate=1.0, fail_status=500), start_server(latency="0.01"),
+        start_server(latency="0.01", fail_rate=1.0))
+    routes = [Route(name, vision_client.chat_url(f"http://127.0.0.1:{server.server_port}"), "fake")
+              for name, server in (("broken", broken), ("healthy", healthy))]
+    router = InferenceRouter(routes, send, max_hedges=0, demote_after=3, cooldown=0.5)
+    failures = []
+    for _ in range(3):
+        router.complete(body)
+    if not router.route_stats()["broken"]["demoted"]:
+        failures.append("a route failing 3 times in a row was not demoted")
+    failed = broken_state.counts["500"]
+    router.complete(body)
+    if broken_state.counts["500"] != failed:
+        failures.append("a demoted route was still asked first")
+    broken_state.fail_rate = 0.0
+    time.sleep(0.6)
+    router.complete(body)
+    if broken_state.counts["ok"] != 1 or router.route_stats()["broken"]["demoted"]:
+        failures.append("a demoted route that works again was not asked first after its cooldown")
+
+    throttled = InferenceRouter([Route("busy", vision_client.chat_url(f"http://127.0.0.1:{busy.server_port}"),
+                                       "fake"), routes[1]], send, max_hedges=0, demote_after=3)
+    for _ in range(5):
+        throttled.complete(body)
+    if throttled.route_stats()["busy"]["demoted"] or busy_state.counts["503"] != 5:
+        failures.append("a route answering 503 was demoted")
+    print(f"demotion: broken route sent {failed} requests before it was skipped, "
+          f"{broken_state.counts['ok']} after its cooldown; 503 route asked {busy_state.counts['503']} of 5 times")
+    for server in (broken, healthy, busy):
+        server.shutdown()
+    return failures
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def run(router, body, n: int, concurrency: int, on_partial=None) -> list:
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    todo = iter(range(n))
+
+    def worker():
+        while True:
+            with lock:
+                if next(todo, None) is None:
+                    return
+            start = time.perf_counter()
+            try:
+                router.complete(body, on_partial)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        print(f"  {len(errors)} errors, e.g. {errors[0]}")
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--warmup", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", default="lognormal:0.2:0.8", help="see fake_inference_server.py")
+    parser.add_argument("--stream", action="store_true", help="stream the answers (latency = whole answer)")
+    args = parser.parse_args()
+
+    body = vision_client.chat_body(PROMPT, [], 300, 0.35, stream=args.stream)
+    on_partial = (lambda text: None) if args.stream else None
+
+    def servers(*fail_rates):
+        started = [start_server(latency=args.latency, fail_rate=rate, fail_status=500, chunk_delay=0.002)
+                   for rate in fail_rates]
+        routes = [Route(f"provider-{i}", vision_client.chat_url(f"http://127.0.0.1:{server.server_port}"), "fake")
+                  for i, (server, _) in enumerate(started)]
+        return started, routes
+
+    scenarios = [
+        ("single", (0.0,), {}),
+        ("unhedged", (0.0, 0.0), {"max_hedges": 0}),
+        ("hedged", (0.0, 0.0), {}),
+        ("failing", (1.0, 0.0), {"max_hedges": 0, "demote_after": 10 ** 9}),
+        ("demoted", (1.0, 0.0), {"max_hedges": 0}),
+    ]
+    print(f"\n{args.requests} requests, {args.concurrency} at a time, model latency {args.latency}"
+          + (", streamed" if args.stream else ""))
+    print(f"{'scenario':<10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+          f"{'hedged':>8}{'hedge wins':>12}{'failovers':>11}{'sent':>7}")
+    p99 = {}
+    for name, fail_rates, options in scenarios:
+        started, routes = servers(*fail_rates)
+        router = InferenceRouter(routes, send, hedge_delay=5.0, min_samples=20, max_workers=4 * args.concurrency,
+                                 **options)
+        run(router, body, args.warmup, args.concurrency, on_partial)
+        before = router.stats()
+        sent_before = sum(sum(state.counts.values()) for _, state in started)
+        latencies = run(router, body, args.requests, args.concurrency, on_partial)
+        after = router.stats()
+        sent = sum(sum(state.counts.values()) for _, state in started) - sent_before
+        ms = [latency * 1000 for latency in latencies]
+        p99[name] = percentile(ms, 0.99)
+        print(f"{name:<10}{statistics.median(ms):>9.0f}{percentile(ms, 0.95):>9.0f}{p99[name]:>9.0f}"
+              f"{max(ms):>9.0f}{after['hedged'] - before['hedged']:>8}"
+              f"{after['hedge_wins'] - before['hedge_wins']:>12}{after['failovers'] - before['failovers']:>11}"
+              f"{sent:>7}")
+        for server, _ in started:
+            server.shutdown()
+
+    print()
+    failures = check_hedge(body) + check_demotion(body)
+    if p99["hedged"] >= p99["unhedged"]:
+        failures.append(f"hedging did not lower p99 ({p99['hedged']:.0f} ms vs {p99['unhedged']:.0f} ms unhedged)")
+    if failures:
+        sys.exit("FAIL: " + "; ".join(failures))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# /history paging: OFFSET vs keyset (id cursor) as a user's history grows.
+#
+#   python benchmarks/bench_history.py [--rows 100000] [--page-size 10]
+#
+# Builds the bot schema with migrations.py in a throwaway database, gives one
+# user --rows meals and times fetching a page at increasing depths. Keyset
+# pages should cost the same at any depth; OFFSET pages grow with the depth.
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db  # noqa: E402
+import migrations  # noqa: E402
+
+COLUMNS = "id, timestamp, recognized, calories, protein, carbs, fat, sugar"
+OFFSET_SQL = f"SELECT {COLUMNS} FROM history WHERE user_id = ? ORDER BY id DESC LIMIT ? OFFSET ?"
+KEYSET_SQL = f"SELECT {COLUMNS} FROM history WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?"
+USER = 42
+
+
+def fill(rows: int):
+    with db.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO history (user_id, timestamp, recognized, calories, protein, carbs, fat, sugar, tips, full_text)
+            VALUES (?, ?, 'Chicken rice', 610, 32, 78, 18, 4, '', '')
+        """, ((USER if i % 4 == 0 else i % 97, f"2026-01-01 {i % 24:02d}:00:00") for i in range(rows * 4)))
+
+
+def per_query_us(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000, help="meals of the measured user")
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(os.path.join(tmp, "bench.db"))
+        migrations.migrate()
+        fill(args.rows)
+        ids = [row[0] for row in db.query_all("SELECT id FROM history WHERE user_id = ? ORDER BY id DESC", (USER,))]
+
+        print(f"{'page':>8}{'OFFSET µs':>12}{'keyset µs':>12}")
+        page = 1
+        while (page - 1) * args.page_size < len(ids):
+            offset = (page - 1) * args.page_size
+            cursor = ids[offset - 1] if offset else ids[0] + 1
+            offset_us = per_query_us(lambda: db.query_all(OFFSET_SQL, (USER, args.page_size, offset)), args.repeat)
+            keyset_us = per_query_us(lambda: db.query_all(KEYSET_SQL, (USER, cursor, args.page_size)), args.repeat)
+            print(f"{page:>8}{offset_us:>12.1f}{keyset_us:>12.1f}")
+            page *= 10
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
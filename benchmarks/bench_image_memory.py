@@ -0,0 +1,137 @@
+# Memory of concurrent photo analyses: request bodies built like huggingface_hub
+# did vs vision_client's single buffer, with and without the image byte budget.
+#
+#   python benchmarks/bench_image_memory.py [--photos 50] [--photo-kb 1500] [--budget-mb 32]
+#
+# --photos threads each "download" a photo (random bytes of --photo-kb), build
+# the request and send it to fake_inference_server.py, which answers after
+# --latency seconds, all at the same time. Every scenario runs in its own
+# process and reports the peak of Python allocations (tracemalloc) and the
+# process's peak RSS. The fake server runs in this process, so it counts for neither.
+#   hf-style   base64 str in the message dict, json.dumps(...).encode() as the body
+#   buffer     vision_client.chat_body(): base64 written straight into one bytearray
+#   budget     buffer, and each photo reserves its bytes in a ByteBudget of --budget-mb
+import argparse
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import vision_client  # noqa: E402
+from byte_budget import ByteBudget  # noqa: E402
+
+SCENARIOS = ("hf-style", "buffer", "budget")
+PROMPT = "Analyze this food image carefully and estimate total calories."
+
+
+def hf_style_request(url: str, image: bytes) -> str:
+    # what ask_vision_model + huggingface_hub did: base64 str in the message, then requests' json=
+    base64_image = base64.b64encode(image).decode("utf-8")
+    content = [{"type": "text", "text": PROMPT},
+               {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}]
+    payload = {"model": "fake", "messages": [{"role": "user", "content": content}],
+               "max_tokens": 450, "temperature": 0.35, "stream": False}
+    body = json.dumps(payload).encode("utf-8")
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return json.load(response)["choices"][0]["message"]["content"]
+
+
+def buffer_request(url: str, image: bytes) -> str:
+    body = vision_client.chat_body(PROMPT, [image], 450, 0.35, stream=False)
+    return vision_client.complete(url, None, "fake", body)
+
+
+def peak_rss() -> int:
+    # ru_maxrss survives exec, so a child would report the parent's peak; VmHWM starts fresh
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_scenario(args):
+    """One scenario in this process; prints a JSON line with the measurements."""
+    url = vision_client.chat_url(args.url)
+    size = args.photo_kb * 1024
+    budget = ByteBudget(args.budget_mb * 1024 * 1024, max_wait=600) if args.scenario == "budget" else None
+    send = hf_style_request if args.scenario == "hf-style" else buffer_request
+    start_line = threading.Barrier(args.photos)
+    errors = []
+
+    def one_photo():
+        start_line.wait()
+        try:
+            if budget is None:
+                send(url, os.urandom(size))  # the download
+            else:
+                with budget.reserve(vision_client.request_bytes([size])):
+                    send(url, os.urandom(size))
+        except Exception as e:
+            errors.append(repr(e))
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=one_photo) for _ in range(args.photos)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    print(json.dumps({
+        "elapsed": elapsed,
+        "traced_peak": peak,
+        "max_rss": peak_rss(),
+        "budget_peak": budget.stats()["peak"] if budget else None,
+        "errors": errors[:3],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--photos", type=int, default=50)
+    parser.add_argument("--photo-kb", type=int, default=1500)
+    parser.add_argument("--budget-mb", type=int, default=32)
+    parser.add_argument("--latency", default="0.5", help="fake model latency, see fake_inference_server.py")
+    parser.add_argument("--scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.scenario:
+        return run_scenario(args)
+
+    from fake_inference_server import start_server
+    server, state = start_server(latency=args.latency)
+    url = f"http://127.0.0.1:{server.server_port}"
+    size = args.photo_kb * 1024
+    print(f"\n{args.photos} concurrent photos of {args.photo_kb} KiB, model latency {args.latency}s, "
+          f"budget {args.budget_mb} MiB (one photo reserves {vision_client.request_bytes([size]) / 2 ** 20:.1f} MiB)")
+    print(f"{'scenario':<10}{'seconds':>9}{'python peak MiB':>17}{'peak RSS MiB':>14}{'budget peak MiB':>17}")
+    for scenario in SCENARIOS:
+        out = subprocess.run(
+            [sys.executable, __file__, "--scenario", scenario, "--url", url, "--photos", str(args.photos),
+             "--photo-kb", str(args.photo_kb), "--budget-mb", str(args.budget_mb)],
+            capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        budget_peak = f"{result['budget_peak'] / 2 ** 20:.1f}" if result["budget_peak"] is not None else "–"
+        print(f"{scenario:<10}{result['elapsed']:>9.2f}{result['traced_peak'] / 2 ** 20:>17.1f}"
+              f"{result['max_rss'] / 2 ** 20:>14.1f}{budget_peak:>17}"
+              + (f"  errors: {result['errors']}" if result["errors"] else ""))
+    print(f"model endpoint: {state.counts['ok']} requests, {state.request_bytes / 2 ** 20:.0f} MiB received")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
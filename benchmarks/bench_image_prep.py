@@ -0,0 +1,114 @@
+# Latency and payload size of the image preparation stage per pixel budget.
+#
+#   python benchmarks/bench_image_prep.py [photo.jpg] [--runs 20]
+#
+# Without a photo a synthetic 2560x1920 "food-like" JPEG is generated. For each
+# budget it prints the re-encode time, the base64 payload that would be uploaded
+# and the number of Qwen2.5-VL visual tokens that payload costs. A second table
+# shows which of Telegram's sizes (longest side 320, 800, 1280) the bot downloads
+# per budget for 4:3, 16:9 and square photos, and whether it still re-encodes it.
+import argparse
+import base64
+import io
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_prep import choose_photo_size, estimated_visual_tokens, fit_to_budget  # noqa: E402
+
+try:
+    from PIL import Image, ImageDraw, ImageFilter
+except ImportError:
+    sys.exit("Pillow is required: pip install Pillow")
+
+BUDGETS = [0, 2_000_000, 1_000_000, 640_000, 480_000, 400_000, 250_000]
+TELEGRAM_SIDES = [320, 800, 1280]
+ASPECTS = [("4:3", 4 / 3), ("16:9", 16 / 9), ("1:1", 1.0)]
+
+
+def synthetic_photo(width=2560, height=1920) -> bytes:
+    rng = random.Random(42)
+    img = Image.new("RGB", (width, height), (235, 225, 210))
+    draw = ImageDraw.Draw(img)
+    for _ in range(120):
+        x, y = rng.randrange(width), rng.randrange(height)
+        r = rng.randrange(40, 400)
+        colour = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=colour)
+    # some texture so the JPEG doesn't compress unrealistically well
+    noise = Image.effect_noise((width, height), 40).convert("RGB")
+    img = Image.blend(img.filter(ImageFilter.GaussianBlur(3)), noise, 0.15)
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+def resized(original: bytes, width: int, height: int) -> bytes:
+    with Image.open(io.BytesIO(original)) as img:
+        out = io.BytesIO()
+        img.convert("RGB").resize((width, height), Image.BICUBIC).save(out, format="JPEG", quality=87)
+    return out.getvalue()
+
+
+def median_ms(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def telegram_sizes(original: bytes, runs: int):
+    """What the bot downloads and uploads per budget, given Telegram's own sizes of the photo."""
+    print(f"\n{'budget px':>10} {'aspect':>6} {'download':>11} {'KB':>5} {'re-encode ms':>13} {'upload':>11}")
+    for budget in BUDGETS[1:]:
+        for name, ratio in ASPECTS:
+            sizes = [SimpleNamespace(width=side, height=round(side / ratio)) for side in TELEGRAM_SIDES]
+            size = choose_photo_size(sizes, budget)
+            data = resized(original, size.width, size.height)
+            prepared = fit_to_budget(data, budget)
+            took = median_ms(lambda: fit_to_budget(data, budget), runs) if prepared is not data else 0.0
+            with Image.open(io.BytesIO(prepared)) as img:
+                width, height = img.size
+            print(f"{budget:>10} {name:>6} {size.width:>5}x{size.height:<5} {len(data) / 1024:5.0f} "
+                  f"{took:13.1f} {width:>5}x{height:<5}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("photo", nargs="?")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.photo:
+        with open(args.photo, "rb") as f:
+            original = f.read()
+    else:
+        original = synthetic_photo()
+
+    print(f"{'budget px':>10} {'size':>11} {'p50 ms':>8} {'p95 ms':>8} {'base64 KB':>10} {'tokens':>7}")
+    for budget in BUDGETS:
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            prepared = fit_to_budget(original, budget)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        with Image.open(io.BytesIO(prepared)) as img:
+            width, height = img.size
+        payload = len(base64.b64encode(prepared))
+        label = budget or "original"
+        print(f"{label:>10} {width:>5}x{height:<5} {statistics.median(timings):8.1f} "
+              f"{timings[int(len(timings) * 0.95) - 1]:8.1f} {payload / 1024:10.0f} "
+              f"{estimated_visual_tokens(width, height):7d}")
+
+    telegram_sizes(original, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Typed-meal lookup in the local nutrition table (nutrition.py).
+#
+#   python benchmarks/bench_nutrition.py [--repeat 200] [--threshold 0.75]
+#
+# Resolves a set of typed meals against a throwaway database built by the
+# migrations: per-message latency (p50/p95 over --repeat rounds) and, per
+# message, the matched foods and whether the bot would answer it locally, ask
+# the model (confidence below --threshold, see TEXT_MATCH_CONFIDENCE) or reply
+# with the usage hint (no food of the table and no amount with a unit).
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db  # noqa: E402
+import migrations  # noqa: E402
+import nutrition  # noqa: E402
+
+MEALS = [
+    "2 boiled eggs and toast",
+    "I had 200g rice, chicken curry",
+    "half an avocado",
+    "a bowl of ramne",
+    "ham and cheese sandwich",
+    "2 slices of wholemeal toast with peanut butter",
+    "a couple of eggs",
+    "bubble tea",
+    "1/2 cup greek yogurt with strawberries",
+    "nasi lemak",
+    "char siu bao x2",
+    "3 siu mai + 2 har gow",
+    "oatmeal with banana and almonds",
+    "latte and a croissant",
+    "big mac",
+    "fish and chips",
+    # a typed word inside a longer name is not that food
+    "ice",
+    "pineapple",
+    "noodles",
+    "hello there",
+    "300g grandma's stew",
+    "thanks!",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--threshold", type=float, default=0.75)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(os.path.join(tmp, "nutrition.db"))
+        migrations.migrate()
+        count = db.query_one("SELECT COUNT(*) FROM foods")[0]
+        print(f"\n{count} foods, {len(MEALS)} messages x {args.repeat}")
+
+        timings = {meal: [] for meal in MEALS}
+        for _ in range(args.repeat):
+            for meal in MEALS:
+                start = time.perf_counter()
+                nutrition.resolve_meal(meal)
+                timings[meal].append(time.perf_counter() - start)
+
+        print(f"{'message':<48}{'p50 ms':>8}{'p95 ms':>8}{'conf':>6}  answer")
+        for meal in MEALS:
+            values = sorted(timings[meal])
+            items, unmatched = nutrition.resolve_meal(meal)
+            confidence = nutrition.confidence(items, unmatched)
+            foods = ", ".join(f"{item.quantity:g} {item.food}" for item in items)
+            if confidence >= args.threshold:
+                route = "local"
+            else:
+                route = "model" if nutrition.has_food_signal(meal, items) else "hint"
+            print(f"{meal:<48}{statistics.median(values) * 1000:>8.2f}"
+                  f"{values[int(len(values) * 0.95) - 1] * 1000:>8.2f}{confidence:>6.2f}  {route}: {foods}"
+                  + (f" (unknown: {', '.join(unmatched)})" if unmatched else ""))
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
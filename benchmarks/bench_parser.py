@@ -0,0 +1,154 @@
+# Speed and extraction accuracy of ai_parser on recorded model responses.
+#
+#   python benchmarks/bench_parser.py [--runs 50] [--rounds 30]
+#
+# model_responses.json holds real-world shaped answers (exact format plus the
+# variants the model drifts into) with the values a human would read off them.
+# The parser the bot shipped before ai_parser is kept below as a baseline.
+#
+# Fails if ai_parser misses a value of the corpus, or if it is not faster than
+# the baseline on the single-meal answers the baseline reads correctly. The two
+# are timed in alternating rounds and the best round of each counts, so a busy
+# machine slows both. The whole corpus is timed and printed too, but not gated:
+# the baseline gives up early on half the shapes (pipes, no food, the macros
+# over several lines) and returns zeros, and it has no album handling at all,
+# so it does less work than reading the values would take.
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+from ai_parser import parse_ai_result  # noqa: E402
+
+FIELDS = ("recognized", "calories", "protein", "carbs", "fat", "sugar")
+
+
+def legacy_parse(text: str) -> dict:
+    # verbatim behaviour of the original parse_ai_result (including its lazy `import re`)
+    result = {"recognized": "Unknown", "calories": 0.0, "protein": 0.0, "carbs": 0.0,
+              "fat": 0.0, "sugar": 0.0, "tips": ""}
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    if not lines:
+        return result
+    if "Recognized:" in lines[0]:
+        result["recognized"] = lines[0].split("Recognized:", 1)[1].strip()
+    macro_line = None
+    calories_line = None
+    for line in lines:
+        if "Protein:" in line and ("Carbs:" in line or "Fat:" in line):
+            macro_line = line
+        if "Calories:" in line:
+            calories_line = line
+    if macro_line:
+        clean = macro_line
+        for char in ['💪', '🥔', '🧈', '🍬', '🔥', '​']:
+            clean = clean.replace(char, '')
+        matches = re.findall(r'(\w+):\s*([\d.]+)g?', clean)
+        for key, value in matches:
+            try:
+                num = float(value)
+                key_lower = key.lower()
+                if "protein" in key_lower:
+                    result["protein"] = num
+                elif "carb" in key_lower:
+                    result["carbs"] = num
+                elif "fat" in key_lower:
+                    result["fat"] = num
+                elif "sugar" in key_lower:
+                    result["sugar"] = num
+            except ValueError:
+                pass
+    if calories_line:
+        try:
+            after = calories_line.split("Calories:", 1)[1].strip()
+            num_match = re.search(r'\d+\.?\d*', after)
+            if num_match:
+                result["calories"] = float(num_match.group())
+        except Exception:
+            pass
+    tips = []
+    tips_started = False
+    for line in lines:
+        if "Calories:" in line:
+            tips_started = True
+            continue
+        if tips_started:
+            tips.append(line.strip())
+    result["tips"] = ' '.join(tips).strip() if tips else ""
+    return result
+
+
+def accuracy(parse, corpus):
+    correct = total = 0
+    failures = []
+    for case in corpus:
+        parsed = parse(case["text"])
+        for field in FIELDS:
+            total += 1
+            if parsed[field] == case["expected"][field]:
+                correct += 1
+            else:
+                failures.append(f"{case['name']}.{field}: got {parsed[field]!r}, want {case['expected'][field]!r}")
+    return correct / total, failures
+
+
+def speed(parse, texts, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        for text in texts:
+            parse(text)
+    return (time.perf_counter() - start) / (runs * len(texts)) * 1e6
+
+
+def best_speeds(parsers, texts, runs, rounds):
+    """Best µs/response of each parser over alternating rounds."""
+    best = [float("inf")] * len(parsers)
+    for _ in range(rounds):
+        for i, parse in enumerate(parsers):
+            best[i] = min(best[i], speed(parse, texts, runs))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=50, help="passes over the corpus per round")
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    with open(os.path.join(HERE, "model_responses.json"), encoding="utf-8") as f:
+        corpus = json.load(f)
+    texts = [case["text"] for case in corpus]
+    # the baseline only gets an album right when the model's total is the last macro line
+    readable = [case["text"] for case in corpus
+                if "📷" not in case["text"] and accuracy(legacy_parse, [case])[0] == 1.0]
+
+    parsers = (legacy_parse, parse_ai_result)
+    corpus_speeds = best_speeds(parsers, texts, args.runs, args.rounds)
+    readable_speeds = best_speeds(parsers, readable, args.runs, args.rounds)
+    results = {}
+    for name, parse, us, readable_us in zip(("legacy", "ai_parser"), parsers, corpus_speeds, readable_speeds):
+        acc, failures = accuracy(parse, corpus)
+        results[name] = acc
+        print(f"{name:10s} accuracy {acc:6.1%}   {us:6.1f} µs/response"
+              f"   {readable_us:6.1f} µs on the {len(readable)} single meals the baseline reads")
+        if args.verbose:
+            for line in failures:
+                print("    " + line)
+
+    if results["ai_parser"] < 1.0:
+        sys.exit("FAIL: ai_parser no longer extracts every field of the corpus")
+    ratio = readable_speeds[1] / readable_speeds[0]
+    print(f"ai_parser/legacy time: {corpus_speeds[1] / corpus_speeds[0]:.2f} on the corpus, "
+          f"{ratio:.2f} on the single meals the baseline reads")
+    if ratio >= 1.0:
+        sys.exit(f"FAIL: ai_parser is not faster than the baseline ({ratio:.2f}x its time) "
+                 "on the single meals the baseline reads")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# Burst test of rate_limiter.RateLimiter against the local fake inference server.
+#
+#   python benchmarks/bench_rate_limiter.py [--burst 40] [--server-rps 4]
+#
+# The fake server accepts --server-rps requests/s and answers 429 above that,
+# plus a few random 503s. The same burst is sent once without the limiter and
+# once through it. Fails unless:
+#   - the limiter run finishes with zero failed requests, and neither it nor a
+#     burst against a server without a rate limit has more than
+#     max_concurrency requests in flight;
+#   - callers queued behind a busy slot are admitted interactive before background;
+#   - a route answering only 503 is retried exactly max_retries times, then the
+#     error is raised, and the backoff delays are full jitter (uniform between
+#     0 and the exponential cap).
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_inference_server import start_server  # noqa: E402
+from rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RateLimiter  # noqa: E402
+
+
+def post_chat(url: str):
+    body = json.dumps({"model": "fake", "messages": [{"role": "user", "content": "hi"}]}).encode()
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        return json.loads(resp.read())
+
+
+def burst(url: str, n: int, limiter: RateLimiter | None):
+    """(ok, latency, priority) of each request, the time taken and the peak number in flight."""
+    results = []
+    lock = threading.Lock()
+    in_flight = peak = 0
+
+    def counted_post(url):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        try:
+            return post_chat(url)
+        finally:
+            with lock:
+                in_flight -= 1
+
+    def one(i):
+        # every 4th request is background work, it should tend to finish last
+        priority = PRIORITY_BACKGROUND if i % 4 == 3 else PRIORITY_INTERACTIVE
+        start = time.perf_counter()
+        try:
+            if limiter:
+                limiter.call(counted_post, url, priority=priority)
+            else:
+                counted_post(url)
+            ok = True
+        except urllib.error.HTTPError:
+            ok = False
+        with lock:
+            results.append((ok, time.perf_counter() - start, priority))
+
+    threads = [threading.Thread(target=one, args=(i,)) for i in range(n)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - start, peak
+
+
+def check_admission_order() -> list:
+    """Callers queued behind a busy slot start interactive first, background last."""
+    limiter = RateLimiter(rate=1000, burst=1000, max_concurrency=1)
+    started = []
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        held.set()
+        release.wait()
+
+    holder = threading.Thread(target=limiter.call, args=(hold,))
+    holder.start()
+    held.wait()
+    # background callers queue up first, so arrival order alone would admit them first
+    priorities = [PRIORITY_BACKGROUND] * 4 + [PRIORITY_INTERACTIVE] * 4
+    threads = [threading.Thread(target=limiter.call, args=(started.append, priority), kwargs={"priority": priority})
+               for priority in priorities]
+    for queued, t in enumerate(threads, 1):
+        t.start()
+        while limiter.stats()["waiting"] < queued:
+            time.sleep(0.001)
+    release.set()
+    for t in (holder, *threads):
+        t.join()
+    print("admission order:", started)
+    if started != sorted(priorities):
+        return ["queued callers were not admitted interactive before background"]
+    return []
+
+
+def check_retries(url: str, state) -> list:
+    """A route that only answers 503 is retried max_retries times, with full-jitter delays."""
+    failures = []
+    limiter = RateLimiter(rate=1000, burst=1000, max_retries=3, base_delay=0.01, max_delay=0.05)
+    before = state.counts["503"]
+    try:
+        limiter.call(post_chat, url)
+        failures.append("a request answered only with 503 did not fail")
+    except urllib.error.HTTPError as e:
+        if e.code != 503:
+            failures.append(f"a request answered only with 503 failed with {e.code}")
+    attempts = state.counts["503"] - before
+    print(f"retries: {attempts} attempts, {limiter.retries} retries for max_retries {limiter.max_retries}")
+    if attempts != limiter.max_retries + 1 or limiter.retries != limiter.max_retries:
+        failures.append(f"{attempts} attempts for max_retries {limiter.max_retries}")
+
+    # full jitter: uniform over [0, min(max_delay, base_delay * 2**attempt)]
+    limiter = RateLimiter(base_delay=1.0, max_delay=8.0)
+    for attempt in (0, 2, 5):
+        cap = min(limiter.max_delay, limiter.base_delay * 2 ** attempt)
+        delays = [limiter.backoff_delay(attempt) for _ in range(2000)]
+        print(f"backoff attempt {attempt}: cap {cap:g}s, min {min(delays):.2f}s, "
+              f"mean {statistics.mean(delays):.2f}s, max {max(delays):.2f}s")
+        if min(delays) < 0 or max(delays) > cap or not 0.4 * cap < statistics.mean(delays) < 0.6 * cap \
+                or min(delays) > 0.1 * cap or max(delays) < 0.9 * cap:
+            failures.append(f"backoff delays of attempt {attempt} are not uniform over [0, {cap:g}s]")
+    return failures
+
+
+def report(name, results, elapsed):
+    ok = [r for r in results if r[0]]
+    latencies = sorted(r[1] for r in ok) or [0.0]
+    by_priority = {}
+    for _, latency, priority in ok:
+        by_priority.setdefault(priority, []).append(latency)
+    print(f"{name}: {len(ok)}/{len(results)} succeeded in {elapsed:.1f}s, "
+          f"p50 {statistics.median(latencies):.2f}s, max {latencies[-1]:.2f}s")
+    for priority, values in sorted(by_priority.items()):
+        print(f"    priority {priority:2d}: mean latency {statistics.mean(values):.2f}s")
+    return len(ok)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst", type=int, default=40)
+    parser.add_argument("--server-rps", type=float, default=4.0)
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server, state = start_server(latency="uniform:0.05:0.2", rate_limit=args.server_rps, fail_rate=args.fail_rate)
+    url = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+    results, elapsed, peak = burst(url, args.burst, None)
+    report("no limiter  ", results, elapsed)
+    print(f"    peak in flight {peak}")
+
+    limiter = RateLimiter(rate=args.server_rps * 0.9, burst=2, max_concurrency=4,
+                          max_retries=6, base_delay=0.25, max_delay=4.0)
+    results, elapsed, peak = burst(url, args.burst, limiter)
+    succeeded = report("with limiter", results, elapsed)
+    print(f"    peak in flight {peak} (cap {limiter.max_concurrency})")
+    print("limiter stats:", limiter.stats())
+    print("server counts:", state.counts)
+    server.shutdown()
+
+    failures = []
+    if succeeded != args.burst:
+        failures.append("some requests still failed behind the limiter")
+    if peak > limiter.max_concurrency:
+        failures.append(f"{peak} requests in flight, above the cap of {limiter.max_concurrency}")
+    # without a server rate limit only the concurrency cap holds the burst back
+    server, state = start_server(latency="0.1")
+    capped = RateLimiter(rate=1000, burst=1000, max_concurrency=4)
+    _, _, peak = burst(f"http://127.0.0.1:{server.server_port}/v1/chat/completions", args.burst, capped)
+    server.shutdown()
+    print(f"no rate limit: peak in flight {peak} (cap {capped.max_concurrency})")
+    if peak > capped.max_concurrency:
+        failures.append(f"{peak} requests in flight, above the cap of {capped.max_concurrency}")
+    failures += check_admission_order()
+    server, state = start_server(latency="0.01", fail_rate=1.0)
+    failures += check_retries(f"http://127.0.0.1:{server.server_port}/v1/chat/completions", state)
+    server.shutdown()
+    if failures:
+        sys.exit("FAIL: " + "; ".join(failures))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# /search latency on a large history: FTS5 (history_search) vs a LIKE scan.
+#
+#   python benchmarks/bench_search.py [--rows 1000000] [--user-rows 50000]
+#
+# Fills a throwaway database (built by migrations.py) with --rows meals spread
+# over many users, --user-rows of them belonging to the measured user, indexes
+# them with history_search.backfill (the terms add_history_record writes), then times
+# history_search.search() for rare, common and multi-word queries. The LIKE
+# column scans the user's recognized names only (no tips) for comparison.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db  # noqa: E402
+import history_search  # noqa: E402
+import migrations  # noqa: E402
+import text_codec  # noqa: E402
+
+USER = 42
+DISHES = ["Tonkotsu ramen with egg", "Hainanese chicken rice", "Nasi lemak with fried chicken", "Beef pho",
+          "Char siu rice", "Wonton noodles", "Caesar salad", "Margherita pizza", "Salmon sushi set",
+          "Chicken curry with naan", "Pad thai with prawns", "Spaghetti bolognese", "Oatmeal with banana",
+          "Scrambled eggs on toast", "Laksa", "Fried rice with egg", "Dim sum: har gow and siu mai",
+          "Greek yogurt with granola", "Cheeseburger and fries", "Bubble tea"]
+TIPS = ["Choose grilled instead of fried to save about 150 kcal.", "Ask for less oil and sauce.",
+        "Add a side of vegetables for fibre.", "The broth is salty; leave some of it.",
+        "A good source of protein; balance it with a lighter dinner.", "Swap the sugary drink for water."]
+QUERIES = ["ramen", "rice", "chicken", "tonkotsu ramen", "broth salty", "bubble", "nonexistentdish"]
+LIKE_SQL = """SELECT COUNT(*), TOTAL(calories) FROM history WHERE user_id = ? AND recognized LIKE ?"""
+
+
+def fill(rows: int, user_rows: int, seed: int = 1):
+    rng = random.Random(seed)
+    tips = [text_codec.compress(t) for t in TIPS]
+    every = max(1, rows // user_rows)
+    batch = 20_000
+    for start in range(0, rows, batch):
+        meals = []
+        for i in range(start, min(rows, start + batch)):
+            user = USER if i % every == 0 else 1000 + i % 5000
+            meals.append((user, f"2026-{1 + i * 12 // rows:02d}-{1 + i % 28:02d} {i % 24:02d}:00:00",
+                          rng.choice(DISHES), rng.randint(250, 1100)))
+        with db.transaction() as conn:
+            first = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM history").fetchone()[0]
+            conn.executemany("INSERT INTO history (user_id, timestamp, recognized, calories) VALUES (?, ?, ?, ?)",
+                             meals)
+            conn.executemany("INSERT INTO history_text (history_id, tips) VALUES (?, ?)",
+                             ((first + k, rng.choice(tips)) for k in range(len(meals))))
+    with db.transaction() as conn:
+        history_search.backfill(conn.cursor())
+
+
+def per_call_ms(fn, repeat: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000, help="meals of all users")
+    parser.add_argument("--user-rows", type=int, default=50_000, help="meals of the measured user")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(os.path.join(tmp, "bench.db"))
+        migrations.migrate()
+        start = time.perf_counter()
+        fill(args.rows, args.user_rows)
+        user_rows = db.query_one("SELECT COUNT(*) FROM history WHERE user_id = ?", (USER,))[0]
+        print(f"\n{args.rows} meals ({user_rows} of the measured user) inserted and indexed "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'query':<18}{'matches':>9}{'search ms':>11}{'LIKE ms':>9}")
+        for query in QUERIES:
+            result = history_search.search(USER, query, since="2026-10-01")
+            search_ms = per_call_ms(lambda: history_search.search(USER, query, since="2026-10-01"), args.repeat)
+            like_ms = per_call_ms(lambda: db.query_one(LIKE_SQL, (USER, f"%{query}%")), args.repeat)
+            print(f"{query:<18}{result['matches']:>9}{search_ms:>11.2f}{like_ms:>9.2f}")
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
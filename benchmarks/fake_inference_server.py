@@ -0,0 +1,166 @@
+# Local stand-in for an OpenAI-compatible vision endpoint (the Hugging Face router).
+#
+#   python benchmarks/fake_inference_server.py --port 8081 --latency lognormal:1.5:0.4
+#
+# POST /v1/chat/completions answers with a canned meal analysis in the format
+# the bot's prompt asks for, either as one JSON body or as an SSE stream when
+# "stream": true. Latency, server-side rate limiting (429) and random 503s (or
+# another error status) are configurable, so the limiter, load test and
+# routing code can be exercised offline. Other scripts import start_server() directly.
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_ANSWER = """🍽️Recognized: Chicken rice with cucumber and chilli sauce
+💪Protein: 32g 🥔Carbs: 78g 🧈Fat: 18g 🍬Sugar: 4g
+🔥Calories: 610 kcal
+Tips: ask for less oil on the rice and add a side of greens for more fibre."""
+
+
+def parse_latency(spec: str):
+    """'0.5' | 'uniform:0.2:1.0' | 'lognormal:<median>:<sigma>' -> callable returning seconds."""
+    parts = spec.split(":")
+    if parts[0] == "uniform":
+        low, high = float(parts[1]), float(parts[2])
+        return lambda: random.uniform(low, high)
+    if parts[0] == "lognormal":
+        median, sigma = float(parts[1]), float(parts[2])
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    fixed = float(parts[0])
+    return lambda: fixed
+
+
+class FakeInferenceState:
+    def __init__(self, latency="0.5", rate_limit: float = 0.0, fail_rate: float = 0.0,
+                 answer: str = CANNED_ANSWER, chunk_delay: float = 0.02, fail_status: int = 503):
+        self.latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.rate_limit = rate_limit  # requests/s accepted before answering 429, 0 = unlimited
+        self.fail_rate = fail_rate    # fraction of requests answered fail_status
+        self.fail_status = fail_status
+        self.answer = answer
+        self.chunk_delay = chunk_delay
+        self.lock = threading.Lock()
+        self.tokens = max(1.0, rate_limit)
+        self.last = time.monotonic()
+        self.counts = {"ok": 0, "429": 0, "503": 0, str(fail_status): 0}
+        self.request_bytes = 0
+        self.images = 0  # images received, several per request for albums
+
+    def admit(self) -> int:
+        with self.lock:
+            if self.fail_rate and random.random() < self.fail_rate:
+                self.counts[str(self.fail_status)] += 1
+                return self.fail_status
+            if self.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(max(1.0, self.rate_limit), self.tokens + (now - self.last) * self.rate_limit)
+                self.last = now
+                if self.tokens < 1:
+                    self.counts["429"] += 1
+                    return 429
+                self.tokens -= 1
+            self.counts["ok"] += 1
+            return 200
+
+
+def make_handler(state: FakeInferenceState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            images = sum(1 for message in body.get("messages", []) if isinstance(message.get("content"), list)
+                         for part in message["content"] if part.get("type") == "image_url")
+            with state.lock:
+                state.request_bytes += length
+                state.images += images
+
+            status = state.admit()
+            if status == 429:
+                return self._json(429, {"error": "rate limit reached"}, {"Retry-After": "1"})
+            if status != 200:
+                return self._json(status, {"error": "model temporarily unavailable"})
+
+            time.sleep(state.latency())
+            model = body.get("model", "fake-model")
+            if not body.get("stream"):
+                return self._json(200, {
+                    "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": state.answer}}],
+                })
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            words = state.answer.split(" ")
+            for i, word in enumerate(words):
+                chunk = {"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model,
+                         "choices": [{"index": 0, "delta": {"content": word + (" " if i < len(words) - 1 else "")},
+                                      "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(state.chunk_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default listen backlog (5) resets connections when a burst of clients connects at once
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # clients abort requests they no longer need (hedging); that isn't an error here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_server(port: int = 0, **kwargs):
+    """Start in a background thread. Returns (server, state); the URL base is http://127.0.0.1:<port>/v1."""
+    state = FakeInferenceState(**kwargs)
+    server = _Server(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", default="0.5")
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server, _ = start_server(args.port, latency=args.latency, rate_limit=args.rate_limit, fail_rate=args.fail_rate)
+    print(f"Fake inference endpoint on http://127.0.0.1:{server.server_port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
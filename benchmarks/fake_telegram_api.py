@@ -0,0 +1,208 @@
+# Local stand-in for the Telegram Bot API, enough for the bot's handlers.
+#
+#   python benchmarks/fake_telegram_api.py --port 8082
+#
+# Point telebot at it with
+#   telebot.apihelper.API_URL = "http://127.0.0.1:8082/bot{0}/{1}"
+#   telebot.apihelper.FILE_URL = "http://127.0.0.1:8082/file/bot{0}/{1}"
+#
+# getFile / file downloads serve synthetic JPEGs (distinct per file_id, so they
+# don't collide in the perceptual-hash cache); sendMessage, editMessageText and
+# the other send methods are answered with plausible Message objects. Every
+# reply is recorded per chat with a timestamp, which is how loadtest.py
+# measures handler latency. Other scripts import start_server() directly.
+import argparse
+import io
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from PIL import Image
+except ImportError:  # downloads are random bytes then; the bot skips resizing and hashing
+    Image = None
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "CalorieBot", "username": "calorie_test_bot"}
+
+# file ids produced by loadtest.py carry the photo size: "<anything>_<w>x<h>"
+_SIZE_RE = re.compile(r"_(\d+)x(\d+)$")
+
+
+class Reply:
+    __slots__ = ("time", "method", "message_id", "text", "has_markup")
+
+    def __init__(self, method: str, message_id: int | None, text: str | None, has_markup: bool):
+        self.time = time.perf_counter()
+        self.method = method
+        self.message_id = message_id
+        self.text = text
+        self.has_markup = has_markup
+
+
+class FakeTelegramState:
+    def __init__(self, photo_bytes: int = 0):
+        self.photo_bytes = photo_bytes  # size of the random payload when Pillow is missing
+        self.cond = threading.Condition()
+        self.replies = {}   # chat_id -> [Reply]
+        self.counts = {}    # method -> calls
+        self.next_message_id = 1000
+        self._files = {}
+        self._files_lock = threading.Lock()
+
+    def record(self, method: str, chat_id, message_id, text, has_markup: bool):
+        with self.cond:
+            self.counts[method] = self.counts.get(method, 0) + 1
+            if chat_id is not None:
+                self.replies.setdefault(chat_id, []).append(Reply(method, message_id, text, has_markup))
+                self.cond.notify_all()
+
+    def new_message_id(self) -> int:
+        with self.cond:
+            self.next_message_id += 1
+            return self.next_message_id
+
+    def wait_for(self, chat_id: int, since: float, predicate, timeout: float):
+        """First reply to chat_id after `since` (perf_counter) matching predicate, or None on timeout."""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            seen = 0
+            while True:
+                replies = self.replies.get(chat_id, [])
+                for reply in replies[seen:]:
+                    if reply.time >= since and predicate(reply):
+                        return reply
+                seen = len(replies)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+
+    def file(self, file_path: str) -> bytes:
+        with self._files_lock:
+            data = self._files.get(file_path)
+        if data is None:
+            data = self._make_file(file_path)
+            with self._files_lock:
+                self._files[file_path] = data
+        return data
+
+    def _make_file(self, file_path: str) -> bytes:
+        name = file_path.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+        rng = random.Random(name.rsplit("_", 1)[0])  # every size of one photo shows the same picture
+        if Image is None:
+            return rng.randbytes(self.photo_bytes or 150_000)
+        match = _SIZE_RE.search(name)
+        width, height = (int(match.group(1)), int(match.group(2))) if match else (1280, 960)
+        # random 8x6 colour blocks, smoothly upscaled: cheap to encode, distinct dHash
+        tiny = Image.new("RGB", (8, 6))
+        tiny.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(48)])
+        out = io.BytesIO()
+        tiny.resize((width, height), Image.BICUBIC).save(out, format="JPEG", quality=85)
+        return out.getvalue()
+
+
+def _message(state: FakeTelegramState, chat_id, text, message_id=None) -> dict:
+    return {
+        "message_id": message_id or state.new_message_id(),
+        "from": BOT_USER,
+        "chat": {"id": int(chat_id), "type": "private"},
+        "date": int(time.time()),
+        "text": text or "",
+    }
+
+
+def make_handler(state: FakeTelegramState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body: bytes, content_type: str):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _result(self, result):
+            self._send(200, json.dumps({"ok": True, "result": result}).encode(), "application/json")
+
+        def _params(self) -> dict:
+            url = urllib.parse.urlsplit(self.path)
+            params = dict(urllib.parse.parse_qsl(url.query))
+            length = int(self.headers.get("Content-Length", 0))
+            if length:
+                body = self.rfile.read(length)
+                content_type = self.headers.get("Content-Type", "")
+                if content_type.startswith("application/json"):
+                    params.update(json.loads(body))
+                elif content_type.startswith("application/x-www-form-urlencoded"):
+                    params.update(urllib.parse.parse_qsl(body.decode()))
+            return params
+
+        def do_GET(self):
+            path = urllib.parse.urlsplit(self.path).path
+            if path.startswith("/file/"):
+                # /file/bot<token>/<file_path>
+                file_path = path.split("/", 3)[3]
+                return self._send(200, state.file(file_path), "image/jpeg")
+            self.do_POST()
+
+        def do_POST(self):
+            method = urllib.parse.urlsplit(self.path).path.rsplit("/", 1)[-1]
+            params = self._params()
+            chat_id = params.get("chat_id")
+            chat_id = int(chat_id) if chat_id is not None else None
+            has_markup = bool(params.get("reply_markup"))
+
+            if method == "getFile":
+                file_id = params["file_id"]
+                return self._result({"file_id": file_id, "file_unique_id": file_id,
+                                     "file_path": f"photos/{file_id}.jpg"})
+            if method == "getMe":
+                return self._result(BOT_USER)
+            if method in ("sendMessage", "sendDocument", "sendPhoto"):
+                message = _message(state, chat_id, params.get("text") or params.get("caption"))
+                state.record(method, chat_id, message["message_id"], message["text"], has_markup)
+                return self._result(message)
+            if method == "editMessageText":
+                message_id = int(params.get("message_id", 0))
+                message = _message(state, chat_id, params.get("text"), message_id)
+                state.record(method, chat_id, message_id, message["text"], has_markup)
+                return self._result(message)
+
+            # answerCallbackQuery, setWebhook, deleteWebhook, sendChatAction, ...
+            state.record(method, chat_id, None, None, has_markup)
+            return self._result(True)
+
+    return Handler
+
+
+def start_server(port: int = 0, **kwargs):
+    """Start in a background thread. Returns (server, state); base URL http://127.0.0.1:<port>."""
+    state = FakeTelegramState(**kwargs)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8082)
+    args = parser.parse_args()
+    server, _ = start_server(args.port)
+    print(f"Fake Telegram Bot API on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# Property-based fuzzing of ai_parser.parse_meal.
+#
+#   python benchmarks/fuzz_parser.py [--iterations 20000] [--seed N]
+#
+# Two properties are checked on randomly generated answers:
+#   1. round trip – values rendered in any of the format variants the model is
+#      known to produce (emoji or not, markdown, separators, labels, ranges,
+#      thousands separators, calories on the macro line or above it, chatty
+#      intro, tips containing numbers, album answers with a line per photo and a
+#      total line, a "Total:" line of its own or none) are extracted exactly;
+#   2. robustness – random mutations and random unicode never raise and always
+#      give non-negative numbers and string fields.
+# A failing case is printed with its seed so it can be replayed.
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai_parser import ParsedMeal, parse_meal  # noqa: E402
+
+DISHES = ["Nasi lemak with fried chicken", "Beef pho", "Char siu rice", "Protein bar and black coffee",
+          "Egg tart (2 pieces)", "Wonton noodle soup", "Chicken caesar salad", "Low-fat yoghurt with berries",
+          "Sugar-free jelly", "Bubble tea, 50% sugar", "Dim sum: har gow & siu mai"]
+TIPS = ["Drink water with your meal.", "A 30-minute walk burns about 150 kcal.",
+        "Swap the soda for tea to save 140 kcal.", "Ask for less oil; it saves 10g of fat.",
+        "Great source of protein!", "Add 1 cup of vegetables for fibre.",
+        "Saturated fat: 9g of it comes from the cheese."]
+INTROS = ["Here's my analysis of your meal:", "Sure! Based on the photo:", "Nutrition estimate below."]
+EMOJI = {"recognized": "🍽️", "protein": "💪", "carbs": "🥔", "fat": "🧈", "sugar": "🍬", "calories": "🔥"}
+LABELS = {"protein": ["Protein"], "carbs": ["Carbs", "Carbohydrates", "Carb"], "fat": ["Fat", "Fats"],
+          "sugar": ["Sugar", "Sugars"], "calories": ["Calories", "Energy"]}
+
+
+def render_number(value, thousands):
+    return f"{value:,g}" if thousands else f"{value:g}"
+
+
+def random_value(rng, high):
+    if rng.random() < 0.3:
+        return round(rng.uniform(0, high), 1)
+    return float(rng.randrange(0, int(high)))
+
+
+def render(rng):
+    expected = {
+        "recognized": rng.choice(DISHES),
+        "protein": random_value(rng, 120),
+        "carbs": random_value(rng, 300),
+        "fat": random_value(rng, 120),
+        "sugar": random_value(rng, 100),
+        "calories": random_value(rng, 3000),
+    }
+    emoji = rng.random() < 0.7
+    bold = rng.random() < 0.2
+    colon = rng.choice([":", ":", "：", " ="])
+    approx = rng.choice(["", "", "~", "about "])
+    unit = rng.choice(["g", " g", "g", ""])
+    sep = rng.choice([" ", "  ", " | ", ", ", "\n"])
+
+    def label(field):
+        text = rng.choice(LABELS[field])
+        text = f"**{text}{colon}**" if bold else f"{text}{colon}"
+        return (EMOJI[field] if emoji else "") + text
+
+    lines = []
+    if rng.random() < 0.2:
+        lines.append(rng.choice(INTROS))
+    name_label = "**Recognized:**" if bold else "Recognized:"
+    lines.append((EMOJI["recognized"] if emoji else "") + name_label + " " + expected["recognized"])
+
+    macros = [f"{label(f)} {approx}{render_number(expected[f], False)}{unit}"
+              for f in ("protein", "carbs", "fat", "sugar")]
+    calories = expected["calories"]
+    if rng.random() < 0.15 and calories >= 50:
+        # a range around the value; the parser should take the middle
+        spread = float(rng.randrange(1, 10)) * 5
+        cal_text = f"{render_number(calories - spread, True)}-{render_number(calories + spread, True)}"
+    else:
+        cal_text = render_number(calories, rng.random() < 0.5)
+    calorie_part = f"{label('calories')} {approx}{cal_text} kcal"
+
+    layout = rng.random()
+    if layout < 0.1:
+        lines.extend(render_album(rng, expected, label, approx, unit, sep))
+    elif layout < 0.2:
+        lines.append(sep.join(macros) + sep + calorie_part)
+    elif layout < 0.3:
+        lines.append(calorie_part)
+        lines.extend(sep.join(macros).split("\n"))
+    else:
+        lines.extend(sep.join(macros).split("\n"))
+        lines.append(calorie_part)
+
+    tips = [rng.choice(TIPS) for _ in range(rng.randrange(0, 4))]
+    lines.extend(tips)
+    text = "\n".join(lines)
+    if rng.random() < 0.1:
+        text = text.replace(" ", "​ ", 1)
+    return text, expected, " ".join(tips)
+
+
+def render_album(rng, expected, label, approx, unit, sep):
+    """A line per photo and a total; expected becomes the photos' sum unless a complete total line is kept."""
+    fields = ("protein", "carbs", "fat", "sugar", "calories")
+    photos = [{field: random_value(rng, 3000 if field == "calories" else 100) for field in fields}
+              for _ in range(rng.randrange(2, 5))]
+
+    def values(meal):
+        macros = [f"{label(f)} {approx}{render_number(meal[f], False)}{unit}" for f in fields[:4]]
+        return macros, f"{label('calories')} {approx}{render_number(meal['calories'], rng.random() < 0.5)} kcal"
+
+    lines = []
+    for i, photo in enumerate(photos, 1):
+        macros, calorie_part = values(photo)
+        if rng.random() < 0.8:
+            lines.append(f"📷{i} {rng.choice(DISHES)}: " + " ".join(macros) + " " + calorie_part)
+        else:
+            lines.append(f"📷{i} {rng.choice(DISHES)}:")
+            lines.extend(sep.join(macros).split("\n"))
+            lines.append(calorie_part)
+    total = rng.random()
+    if total < 0.4:
+        # the model's own total wins over the photos
+        macros, calorie_part = values(expected)
+        lines.append("🧮Total: " + " ".join(macros) + " " + calorie_part)
+        return lines
+    for field in fields:
+        expected[field] = 0.0
+        for photo in photos:
+            expected[field] += photo[field]
+    if total < 0.7:
+        macros, calorie_part = values(expected)
+        lines.append(rng.choice(["🧮**Total:**", "Total:", "**Total**"]))
+        lines.extend(sep.join(macros).split("\n"))
+        lines.append(calorie_part)
+    if rng.random() < 0.5:
+        lines.append("")
+    return lines
+
+
+def mutate(rng, text):
+    chars = list(text)
+    for _ in range(rng.randrange(1, 8)):
+        op = rng.random()
+        pos = rng.randrange(len(chars) + 1)
+        if op < 0.4 and chars:
+            del chars[min(pos, len(chars) - 1)]
+        elif op < 0.8:
+            chars.insert(pos, chr(rng.choice([rng.randrange(32, 127), rng.randrange(0x80, 0x2FFF),
+                                                rng.randrange(0x1F300, 0x1FAFF), 10])))
+        else:
+            chars[pos:pos] = rng.choice(["Calories:", "Protein:", "Total", "kcal", "1,", "-", "\n\n", "**"])
+    return "".join(chars)
+
+
+def check_types(parsed: ParsedMeal):
+    assert isinstance(parsed.recognized, str) and parsed.recognized
+    assert isinstance(parsed.tips, str)
+    for field in ("calories", "protein", "carbs", "fat", "sugar"):
+        value = getattr(parsed, field)
+        assert isinstance(value, float) and value >= 0, (field, value)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    seed = args.seed if args.seed is not None else random.randrange(1 << 30)
+    rng = random.Random(seed)
+
+    for i in range(args.iterations):
+        text, expected, tips = render(rng)
+        parsed = parse_meal(text)
+        try:
+            check_types(parsed)
+            for field, value in expected.items():
+                got = getattr(parsed, field)
+                assert got == value or (field == "calories" and abs(got - value) < 1e-6), (field, got, value)
+            assert parsed.tips == tips, ("tips", parsed.tips, tips)
+
+            garbage = mutate(rng, text) if rng.random() < 0.8 else "".join(
+                chr(rng.randrange(1, 0x1FAFF)) for _ in range(rng.randrange(0, 200)))
+            check_types(parse_meal(garbage))
+        except AssertionError as e:
+            print(f"FAIL at iteration {i} (seed {seed}): {e}\n---\n{text}\n---")
+            sys.exit(1)
+
+    print(f"ok: {args.iterations} generated answers, seed {seed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+# End-to-end load test of the webhook bot, fully offline.
+#
+#   python benchmarks/loadtest.py [--sessions 200] [--concurrency 20] [--latency lognormal:1.5:0.4]
+#
+# Starts fake_telegram_api.py and fake_inference_server.py, loads
+# "telegram bot v7.2.py" against them (own temporary database) and posts
+# synthetic Telegram updates to its telegram_webhook route, the way Telegram
+# would. Each simulated user runs one session:
+#   photo    - a food photo, then "Yes, save this"
+#   album    - --album-size photos sent as one album, then "Yes, save this"
+#   command  - /start, /history or /bmr
+#   profile  - /setprofile, sex button, age, height, weight
+# The time from posting an update to the bot's answer in the fake Bot API is
+# that handler's latency. Bot settings (HF_RATE_LIMIT, UPDATE_WORKERS,
+# STREAM_RESPONSES, ...) are read from the environment as usual.
+#
+# With --wsgi-workers N the bot runs under gunicorn (wsgi.py, gunicorn.conf.py)
+# with N worker processes and updates are posted over HTTP instead, so
+# throughput can be compared across worker counts.
+import argparse
+import http.client
+import importlib.util
+import itertools
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_inference_server  # noqa: E402
+import fake_telegram_api  # noqa: E402
+
+BOT_SCRIPT = os.path.join(ROOT, "telegram bot v7.2.py")
+TOKEN = "123456:LOADTEST"
+PHOTO_SIZES = [(90, 68), (320, 240), (800, 600), (1280, 960)]
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}"}
+
+
+def message_update(user_id: int, text: str | None = None, photo_key: str | None = None,
+                   media_group_id: str | None = None) -> dict:
+    message = {
+        "message_id": next(_message_ids),
+        "from": _user(user_id),
+        "chat": {"id": user_id, "type": "private"},
+        "date": int(time.time()),
+    }
+    if photo_key is not None:
+        message["photo"] = [{"file_id": f"{photo_key}_{w}x{h}", "file_unique_id": f"{photo_key}_{w}x{h}",
+                             "width": w, "height": h, "file_size": w * h // 8} for w, h in PHOTO_SIZES]
+        if media_group_id is not None:
+            message["media_group_id"] = media_group_id
+    else:
+        message["text"] = text
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": next(_update_ids), "message": message}
+
+
+def callback_update(user_id: int, data: str, message_id: int) -> dict:
+    return {"update_id": next(_update_ids), "callback_query": {
+        "id": str(next(_update_ids)),
+        "from": _user(user_id),
+        "chat_instance": str(user_id),
+        "data": data,
+        "message": {"message_id": message_id, "from": fake_telegram_api.BOT_USER,
+                    "chat": {"id": user_id, "type": "private"}, "date": int(time.time()), "text": "..."},
+    }}
+
+
+class InProcessWebhook:
+    """Calls the bot's Flask app directly (Flask test client)."""
+
+    def __init__(self, bot):
+        self.client = bot.app.test_client()
+        self.path = bot.WEBHOOK_PATH
+
+    def post(self, body: str) -> int:
+        return self.client.post(self.path, data=body, content_type="application/json").status_code
+
+
+class HttpWebhook:
+    """Posts to a bot served by a WSGI server, one keep-alive connection per thread."""
+
+    def __init__(self, port: int, path: str):
+        self.port = port
+        self.path = path
+        self.local = threading.local()
+
+    def post(self, body: str) -> int:
+        for attempt in range(2):
+            conn = getattr(self.local, "conn", None)
+            if conn is None:
+                conn = self.local.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+            try:
+                conn.request("POST", self.path, body=body.encode(), headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, OSError):
+                # the server closed the kept-alive connection; reconnect once
+                conn.close()
+                self.local.conn = None
+                if attempt:
+                    raise
+
+
+class LoadTest:
+    def __init__(self, webhook, telegram_state, args):
+        self.webhook = webhook
+        self.telegram = telegram_state
+        self.args = args
+        self.lock = threading.Lock()
+        self.latencies = {}  # handler -> [seconds]
+        self.failures = {}   # handler -> count
+        self.rejected = 0    # 503 from the webhook (queue full), retried like Telegram does
+        self.photo_keys = []
+        # with ALBUM_WINDOW=0 the bot answers every photo of an album on its own
+        self.album_answers = 1 if float(os.getenv("ALBUM_WINDOW", "1.0")) > 0 else args.album_size
+
+    def post(self, update: dict):
+        body = json.dumps(update)
+        while True:
+            if self.webhook.post(body) != 503:
+                return
+            with self.lock:
+                self.rejected += 1
+            time.sleep(0.5)
+
+    def step(self, name: str, user_id: int, update: dict, done=lambda reply: True):
+        """Post one update and wait for the reply that completes it. Returns the reply or None."""
+        start = time.perf_counter()
+        self.post(update)
+        reply = self.telegram.wait_for(user_id, start, done, self.args.timeout)
+        with self.lock:
+            if reply is None:
+                self.failures[name] = self.failures.get(name, 0) + 1
+            else:
+                self.latencies.setdefault(name, []).append(reply.time - start)
+        return reply
+
+    def photo_key(self, user_id: int) -> str:
+        # a re-sent earlier photo should be answered from the inference cache
+        with self.lock:
+            if self.photo_keys and random.random() < self.args.duplicate_rate:
+                return random.choice(self.photo_keys)
+            key = f"photo{user_id}"
+            self.photo_keys.append(key)
+            return key
+
+    @staticmethod
+    def answered(reply) -> bool:
+        # finished once the answer carries the save keyboard; with streaming
+        # the first replies are the placeholder and partial edits
+        return reply.has_markup or (reply.method == "sendMessage" and not reply.text.startswith("🔍"))
+
+    def photo_session(self, user_id: int):
+        reply = self.step("photo", user_id, message_update(user_id, photo_key=self.photo_key(user_id)),
+                          done=self.answered)
+        self.save(user_id, reply)
+
+    def album_session(self, user_id: int):
+        # the photos arrive back to back, as Telegram delivers an album; timed from the first
+        # one until the whole album is answered
+        answers = []
+
+        def done(reply):
+            if self.answered(reply):
+                answers.append(reply)
+            return len(answers) >= self.album_answers
+
+        start = time.perf_counter()
+        for i in range(self.args.album_size):
+            self.post(message_update(user_id, photo_key=f"album{user_id}_{i}", media_group_id=f"group{user_id}"))
+        reply = self.telegram.wait_for(user_id, start, done, self.args.timeout)
+        with self.lock:
+            if reply is None:
+                self.failures["album"] = self.failures.get("album", 0) + 1
+            else:
+                self.latencies.setdefault("album", []).append(reply.time - start)
+        self.save(user_id, reply)
+
+    def save(self, user_id: int, reply):
+        if reply is not None and reply.has_markup:
+            self.step("save_callback", user_id, callback_update(user_id, f"save_yes_{user_id}", reply.message_id),
+                      done=lambda r: r.method == "editMessageText")
+
+    def command_session(self, user_id: int):
+        command = random.choice(["/start", "/history", "/bmr"])
+        self.step(command, user_id, message_update(user_id, command))
+
+    def profile_session(self, user_id: int):
+        reply = self.step("/setprofile", user_id, message_update(user_id, "/setprofile"))
+        if reply is None:
+            return
+        self.step("profile_sex", user_id, callback_update(user_id, "profile_sex_f", reply.message_id))
+        for name, value in (("profile_age", "34"), ("profile_height", "168"), ("profile_weight", "61.5")):
+            self.step(name, user_id, message_update(user_id, value))
+
+    def run(self):
+        kinds, weights = zip(*self.args.mix.items())
+        sessions = {"photo": self.photo_session, "album": self.album_session, "command": self.command_session,
+                    "profile": self.profile_session}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.args.concurrency) as pool:
+            futures = [pool.submit(sessions[random.choices(kinds, weights)[0]], 100_000 + i)
+                       for i in range(self.args.sessions)]
+            for future in futures:
+                future.result()
+        return time.perf_counter() - start
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def report(test: LoadTest, elapsed: float):
+    total = sum(len(v) for v in test.latencies.values())
+    print(f"\n{total} updates answered in {elapsed:.1f}s: {total / elapsed:.1f} updates/s, "
+          f"{len(test.latencies.get('photo', [])) / elapsed:.2f} photos/s")
+    print(f"{'handler':<16}{'count':>7}{'failed':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name in sorted(set(test.latencies) | set(test.failures)):
+        values = sorted(test.latencies.get(name, [])) or [0.0]
+        print(f"{name:<16}{len(test.latencies.get(name, [])):>7}{test.failures.get(name, 0):>8}"
+              f"{statistics.median(values) * 1000:>10.0f}{percentile(values, 95) * 1000:>10.0f}"
+              f"{percentile(values, 99) * 1000:>10.0f}{values[-1] * 1000:>10.0f}")
+    if test.rejected:
+        print(f"webhook answered 503 (update queue full) {test.rejected} times")
+
+
+def bot_environment(telegram_port: int, inference_port: int, db_file: str) -> dict:
+    return {
+        "TELEGRAM_TOKEN": TOKEN,
+        "HF_TOKEN": "hf_loadtest",
+        "RENDER_EXTERNAL_HOSTNAME": "loadtest.invalid",
+        "DB_FILE": db_file,
+        "INFERENCE_BASE_URL": f"http://127.0.0.1:{inference_port}",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{telegram_port}",
+    }
+
+
+def load_bot(environment: dict):
+    os.environ.update(environment)
+    spec = importlib.util.spec_from_file_location("calorie_bot", BOT_SCRIPT)
+    bot = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bot)
+    return bot
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(workers: int, environment: dict):
+    """Run wsgi:app under gunicorn; returns (process, port) once it answers on /."""
+    port = free_port()
+    env = dict(os.environ, **environment, SET_WEBHOOK="0", STATE_BACKEND="sqlite")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+         "--workers", str(workers), "--bind", f"127.0.0.1:{port}", "wsgi:app"],
+        cwd=ROOT, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit("gunicorn exited during startup")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                # every worker boots on its own; give the others a moment to finish
+                time.sleep(2)
+                return process, port
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    sys.exit("gunicorn did not start within 60s")
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        kind, weight = part.split("=")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20, help="users active at the same time")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("photo=0.6,command=0.3,profile=0.1"))
+    parser.add_argument("--latency", default="lognormal:1.5:0.4", help="model latency, see fake_inference_server")
+    parser.add_argument("--server-rps", type=float, default=0.0, help="model endpoint rate limit, 0 = none")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of model calls answered 503")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="fraction of photos that are re-sends")
+    parser.add_argument("--album-size", type=int, default=3, help="photos per album session")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for one answer")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--wsgi-workers", type=int, default=0,
+                        help="run the bot under gunicorn with this many worker processes (0 = in-process)")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    inference_server, inference_state = fake_inference_server.start_server(
+        latency=args.latency, rate_limit=args.server_rps, fail_rate=args.fail_rate)
+    telegram_server, telegram_state = fake_telegram_api.start_server()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        environment = bot_environment(telegram_server.server_port, inference_server.server_port,
+                                      os.path.join(tmp, "loadtest.db"))
+        if args.wsgi_workers:
+            process, port = start_gunicorn(args.wsgi_workers, environment)
+            try:
+                test = LoadTest(HttpWebhook(port, f"/{TOKEN}/"), telegram_state, args)
+                elapsed = test.run()
+            finally:
+                process.terminate()
+                process.wait(30)
+            print(f"\ngunicorn, {args.wsgi_workers} worker processes")
+            report(test, elapsed)
+            print("model endpoint:", inference_state.counts, f"{inference_state.images} images")
+        else:
+            bot = load_bot(environment)
+            test = LoadTest(InProcessWebhook(bot), telegram_state, args)
+            elapsed = test.run()
+            report(test, elapsed)
+            print("model endpoint:", inference_state.counts, f"{inference_state.images} images")
+            print("inference cache:", bot.inference_cache.stats())
+            print("rate limiter:", bot.inference_limiter.stats())
+            print("update queue dropped:", bot.update_queue.dropped)
+            bot.update_queue.stop()
+            bot.db.close_all()
+
+    inference_server.shutdown()
+    telegram_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
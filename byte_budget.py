@@ -0,0 +1,88 @@
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Admission control for memory-heavy work (photos in flight to the model).
+# Every photo reserves the bytes it will hold (the download and its request
+# body) before it is downloaded. Reservations that don't fit in the budget
+# wait first come, first served, so one large photo isn't starved by a stream
+# of small ones; a reservation larger than the whole budget is admitted when
+# nothing else is in flight. Waiting too long raises ByteBudgetTimeout.
+
+
+class ByteBudgetTimeout(Exception):
+    pass
+
+
+class ByteBudget:
+    def __init__(self, max_bytes: int, max_wait: float = 60.0):
+        self.max_bytes = max_bytes  # 0 = unlimited
+        self.max_wait = max_wait
+
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._waiters = deque()
+        self._seq = itertools.count()
+
+        self.admitted = 0
+        self.timeouts = 0
+        self.peak = 0
+        self.total_wait = 0.0
+
+    def _fits(self, nbytes: int) -> bool:
+        return not self.max_bytes or self._in_use == 0 or self._in_use + nbytes <= self.max_bytes
+
+    def acquire(self, nbytes: int, timeout: float | None = None):
+        """Block until this caller is first in line and nbytes fit in the budget."""
+        timeout = self.max_wait if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            ticket = next(self._seq)
+            self._waiters.append(ticket)
+            try:
+                while not (self._waiters[0] == ticket and self._fits(nbytes)):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise ByteBudgetTimeout(f"Timed out waiting for {nbytes} bytes of the image budget")
+                    self._cond.wait(remaining)
+                self._waiters.popleft()
+                ticket = None
+                self._in_use += nbytes
+                self.peak = max(self.peak, self._in_use)
+                self.admitted += 1
+                self.total_wait += time.monotonic() - start
+                self._cond.notify_all()
+            finally:
+                if ticket is not None:
+                    # gave up: leave the line, let the next one in
+                    self._waiters.remove(ticket)
+                    self._cond.notify_all()
+
+    def release(self, nbytes: int):
+        with self._cond:
+            self._in_use -= nbytes
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes: int):
+        self.acquire(nbytes)
+        try:
+            yield
+        finally:
+            self.release(nbytes)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "in_use": self._in_use,
+                "peak": self.peak,
+                "max_bytes": self.max_bytes,
+                "admitted": self.admitted,
+                "timeouts": self.timeouts,
+                "waiting": len(self._waiters),
+                "avg_wait": self.total_wait / self.admitted if self.admitted else 0.0,
+            }
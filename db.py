@@ -0,0 +1,158 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Shared SQLite access layer.
+# Each thread keeps one open connection (webhook workers are long lived), the
+# database runs in WAL mode so readers never block the writer, and sqlite3's
+# per-connection statement cache keeps every query below prepared.
+
+DB_FILE = "calorie_history.db"
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+_all_conns = []
+_all_conns_lock = threading.Lock()
+# bumped by close_all() so other threads notice their connection was closed
+_generation = 0
+# optional fn(operation, seconds) called after every query and transaction (metrics)
+_observer = None
+
+
+def configure(path: str, busy_timeout_ms: int = BUSY_TIMEOUT_MS):
+    global DB_FILE, BUSY_TIMEOUT_MS
+    close_all()
+    DB_FILE = path
+    BUSY_TIMEOUT_MS = busy_timeout_ms
+
+
+def set_observer(fn):
+    global _observer
+    _observer = fn
+
+
+def _connect() -> sqlite3.Connection:
+    # isolation_level=None: statements autocommit unless wrapped in transaction()
+    conn = sqlite3.connect(
+        DB_FILE,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT_MS)}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    # WAL + NORMAL is durable against app crashes, only an OS crash can lose the last commit
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def get_conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "generation", None) != _generation:
+        conn = _connect()
+        _local.conn = conn
+        _local.generation = _generation
+        _local.depth = 0
+        with _all_conns_lock:
+            _all_conns.append(conn)
+    return conn
+
+
+@contextmanager
+def transaction():
+    """BEGIN IMMEDIATE ... COMMIT on this thread's connection. Nested calls join the outer one."""
+    conn = get_conn()
+    if _local.depth:
+        _local.depth += 1
+        try:
+            yield conn
+        finally:
+            _local.depth -= 1
+        return
+
+    # IMMEDIATE takes the write lock up front, so two writers wait on busy_timeout
+    # instead of failing with "database is locked" when upgrading a read lock
+    start = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    _local.depth = 1
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+    finally:
+        _local.depth = 0
+        if _observer is not None:
+            _observer("transaction", time.perf_counter() - start)
+
+
+def execute(sql: str, params=()) -> sqlite3.Cursor:
+    if _observer is None:
+        return get_conn().execute(sql, params)
+    start = time.perf_counter()
+    cursor = get_conn().execute(sql, params)
+    _observer("execute", time.perf_counter() - start)
+    return cursor
+
+
+def query_one(sql: str, params=()):
+    if _observer is None:
+        return get_conn().execute(sql, params).fetchone()
+    start = time.perf_counter()
+    row = get_conn().execute(sql, params).fetchone()
+    _observer("query_one", time.perf_counter() - start)
+    return row
+
+
+def query_all(sql: str, params=()) -> list:
+    if _observer is None:
+        return get_conn().execute(sql, params).fetchall()
+    start = time.perf_counter()
+    rows = get_conn().execute(sql, params).fetchall()
+    _observer("query_all", time.perf_counter() - start)
+    return rows
+
+
+def data_version() -> int:
+    """Changes whenever another connection commits to the database (not for this thread's own commits)."""
+    return get_conn().execute("PRAGMA data_version").fetchone()[0]
+
+
+def iterate(sql: str, params=(), batch: int = 500):
+    """Yield rows one at a time, fetching `batch` rows per step, for results too big for fetchall()."""
+    # a cursor of its own: the thread's connection stays usable while the rows are consumed
+    cursor = get_conn().execute(sql, params)
+    try:
+        while rows := cursor.fetchmany(batch):
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def close():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        with _all_conns_lock:
+            if conn in _all_conns:
+                _all_conns.remove(conn)
+        conn.close()
+        _local.conn = None
+
+
+def close_all():
+    global _generation
+    with _all_conns_lock:
+        conns = list(_all_conns)
+        _all_conns.clear()
+        _generation += 1
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.ProgrammingError:
+            pass
+    _local.conn = None
@@ -0,0 +1,106 @@
+import re
+
+import db
+import text_codec
+
+# "Log again" buttons for the meals a user keeps eating.
+#
+# meal_frequency has one row per user and distinct meal, keyed by the
+# normalized recognized text ("Tonkotsu Ramen, egg" == "tonkotsu ramen egg"):
+# how many times it was saved and the history row of the latest save, whose
+# macros and texts a tap copies into a new meal. add_history_record bumps the
+# row in the meal's own transaction and /clear drops the user's rows, so the
+# keyboard is one small indexed read and nothing is ever recounted.
+
+MIN_MEALS = 2  # saved at least this often to get a button
+_WORD_RE = re.compile(r"\w+")
+_NOT_A_MEAL = {"", "unknown"}
+
+
+def meal_key(recognized: str | None) -> str:
+    """Normalized meal name: lower case, words only; "" for no meal."""
+    key = " ".join(_WORD_RE.findall(recognized.lower())) if recognized else ""
+    return "" if key in _NOT_A_MEAL else key
+
+
+def create_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS meal_frequency (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            meal_key TEXT NOT NULL,
+            meals INTEGER NOT NULL,
+            last_history_id INTEGER NOT NULL,
+            UNIQUE (user_id, meal_key)
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_meal_frequency_top
+        ON meal_frequency (user_id, meals DESC, last_history_id DESC)
+    """)
+
+
+def backfill(cursor):
+    # meal_key is Python, so the meals are grouped here rather than in SQL
+    meals = {}
+    for user_id, history_id, recognized in cursor.execute("SELECT user_id, id, recognized FROM history ORDER BY id"):
+        key = meal_key(recognized)
+        if key:
+            count, _ = meals.get((user_id, key), (0, 0))
+            meals[(user_id, key)] = (count + 1, history_id)
+    cursor.executemany("""
+        INSERT INTO meal_frequency (user_id, meal_key, meals, last_history_id) VALUES (?, ?, ?, ?)
+    """, [(user_id, key, count, history_id) for (user_id, key), (count, history_id) in meals.items()])
+
+
+def record(conn, user_id: int, recognized: str, history_id: int):
+    """Count one more save of the meal; call inside the transaction that inserts it."""
+    key = meal_key(recognized)
+    if not key:
+        return
+    conn.execute("""
+        INSERT INTO meal_frequency (user_id, meal_key, meals, last_history_id)
+        VALUES (?, ?, 1, ?)
+        ON CONFLICT(user_id, meal_key) DO UPDATE SET
+            meals = meals + 1,
+            last_history_id = excluded.last_history_id
+    """, (user_id, key, history_id))
+
+
+def clear(conn, user_id: int):
+    conn.execute("DELETE FROM meal_frequency WHERE user_id = ?", (user_id,))
+
+
+def top(user_id: int, limit: int) -> list:
+    """The user's most saved meals, most recent first among equals: (id, meals, recognized, calories)."""
+    return db.query_all("""
+        SELECT f.id, f.meals, h.recognized, h.calories
+        FROM meal_frequency f JOIN history h ON h.id = f.last_history_id
+        WHERE f.user_id = ? AND f.meals >= ?
+        ORDER BY f.meals DESC, f.last_history_id DESC
+        LIMIT ?
+    """, (user_id, MIN_MEALS, limit))
+
+
+def latest(user_id: int, meal_id: int):
+    """(parsed dict, full answer text) of the meal's latest save, or None if it is not the user's."""
+    row = db.query_one("""
+        SELECT h.recognized, h.calories, h.protein, h.carbs, h.fat, h.sugar, t.tips, t.full_text
+        FROM meal_frequency f
+        JOIN history h ON h.id = f.last_history_id
+        LEFT JOIN history_text t ON t.history_id = h.id
+        WHERE f.id = ? AND f.user_id = ?
+    """, (meal_id, user_id))
+    if row is None:
+        return None
+    recognized, calories, protein, carbs, fat, sugar, tips, full_text = row
+    parsed = {
+        "recognized": recognized,
+        "calories": calories or 0,
+        "protein": protein or 0,
+        "carbs": carbs or 0,
+        "fat": fat or 0,
+        "sugar": sugar or 0,
+        "tips": text_codec.decompress(tips) or "",
+    }
+    return parsed, text_codec.decompress(full_text) or recognized
@@ -0,0 +1,20 @@
+# gunicorn settings for the webhook bot:  gunicorn -c gunicorn.conf.py wsgi:app
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+# Render and Heroku set WEB_CONCURRENCY; each worker is a full bot process
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# the webhook view only queues the update, a few threads per worker are plenty
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+# the model call can take a while, but that runs on the bot's own update workers
+timeout = 60
+graceful_timeout = 30
+# each worker starts its own update/sweeper threads, so the app must not be loaded before the fork
+preload_app = False
+
+
+def on_starting(server):
+    if os.getenv("SET_WEBHOOK", "1") == "1":
+        import wsgi
+        wsgi.set_webhook()
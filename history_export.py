@@ -0,0 +1,98 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+
+import db
+import text_codec
+
+# /export: a user's whole meal history as CSV or NDJSON.
+# Rows come from a SQLite cursor a batch at a time and go straight through
+# generators into a temporary file, so memory use doesn't depend on how many
+# meals a user has. Only the finished file is handed to Telegram.
+
+FORMATS = ("csv", "json")
+COLUMNS = ("timestamp", "recognized", "calories", "protein", "carbs", "fat", "sugar", "tips")
+BATCH_ROWS = 500
+# Telegram bots can upload at most 50 MB; bigger exports are sent gzip-compressed
+MAX_UPLOAD_BYTES = 45 * 1024 * 1024
+
+
+def iter_rows(user_id: int):
+    # tips live compressed in history_text
+    for row in db.iterate("""
+        SELECT h.timestamp, h.recognized, h.calories, h.protein, h.carbs, h.fat, h.sugar, t.tips
+        FROM history h
+        LEFT JOIN history_text t ON t.history_id = h.id
+        WHERE h.user_id = ?
+        ORDER BY h.id
+    """, (user_id,), batch=BATCH_ROWS):
+        yield row[:-1] + (text_codec.decompress(row[-1]),)
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    batch = 0
+    for row in rows:
+        writer.writerow(row)
+        batch += 1
+        if batch == BATCH_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            batch = 0
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows):
+    # one JSON object per line; readable with pandas.read_json(lines=True) or jq
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    chunk = []
+    for row in rows:
+        chunk.append(encode(dict(zip(COLUMNS, row))))
+        if len(chunk) == BATCH_ROWS:
+            yield "\n".join(chunk) + "\n"
+            chunk.clear()
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
+def write_export(user_id: int, fmt: str = "csv", directory: str | None = None) -> tuple[str, str, int]:
+    """Write the export to a temporary file. Returns (path, file name for the user, row count).
+    The caller deletes the file; if writing it fails, nothing is left behind."""
+    encode = iter_ndjson if fmt == "json" else iter_csv
+    extension = "ndjson" if fmt == "json" else "csv"
+    rows = 0
+
+    def counted():
+        nonlocal rows
+        for row in iter_rows(user_id):
+            rows += 1
+            yield row
+
+    fd, path = tempfile.mkstemp(prefix="export-", suffix="." + extension, dir=directory)
+    compressed = None
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            for chunk in encode(counted()):
+                f.write(chunk)
+
+        name = f"meals-{user_id}.{extension}"
+        if os.path.getsize(path) > MAX_UPLOAD_BYTES:
+            compressed = path + ".gz"
+            with open(path, "rb") as src, gzip.open(compressed, "wb", compresslevel=6) as dst:
+                while block := src.read(1 << 20):
+                    dst.write(block)
+            os.remove(path)
+            path, name = compressed, name + ".gz"
+    except BaseException:
+        # a failed export (database error, full disk) doesn't leave its partial files behind
+        for leftover in (path, compressed):
+            if leftover is not None and os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    return path, name, rows
@@ -0,0 +1,120 @@
+import re
+
+import db
+import text_codec
+
+# Full-text search over a user's own meals (/search ramen).
+#
+# history_fts is a contentless FTS5 table (the text already lives in history
+# and, compressed, in history_text) with one row per meal: recognized and the
+# decompressed tips. Every word is indexed with its owner in front of it,
+# "Tonkotsu ramen" of user 42 as "42_tonkotsu 42_ramen" (search_terms), so a
+# word's doclist holds only that user's meals: a search reads the user's
+# matches, not every user's "rice" filtered down to one of them.
+#
+# add_history_record indexes a meal in the transaction that saves it and
+# clear_user_history removes the user's meals in the one that deletes them
+# (index, unindex_user); meals are never updated. The terms are computed here
+# rather than in SQL triggers, so the database needs no Python functions and
+# any SQLite client can read and write it. Anything else that inserts or
+# deletes history rows has to call these too. A contentless row can only be
+# removed by repeating exactly the values it was indexed with, which
+# unindex_user rebuilds from history and history_text.
+
+MAX_TERMS = 8
+_WORD_RE = re.compile(r"\w+")
+_INSERT_SQL = "INSERT INTO history_fts (rowid, recognized, tips) VALUES (?, ?, ?)"
+_DELETE_SQL = "INSERT INTO history_fts (history_fts, rowid, recognized, tips) VALUES ('delete', ?, ?, ?)"
+
+
+def search_terms(user_id: int, text: str | None) -> str | None:
+    """Indexed form of a meal's text: each word prefixed with its owner."""
+    if text is None:
+        return None
+    return " ".join(f"{user_id}_{word}" for word in _WORD_RE.findall(text))
+
+
+def _terms(rows) -> list:
+    """(id, recognized terms, tips terms) of (id, user_id, recognized, compressed tips) rows."""
+    return [(history_id, search_terms(user_id, recognized), search_terms(user_id, text_codec.decompress(tips)))
+            for history_id, user_id, recognized, tips in rows]
+
+
+def create_table(cursor):
+    # '_' is part of a token, so "42_ramen" stays one term (stemmed and folded like any word)
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+            recognized, tips, content='',
+            tokenize="porter unicode61 remove_diacritics 2 tokenchars '_'"
+        )
+    """)
+
+
+def backfill(cursor):
+    last_id = 0
+    while True:
+        rows = cursor.execute("""
+            SELECT h.id, h.user_id, h.recognized, t.tips
+            FROM history h JOIN history_text t ON t.history_id = h.id
+            WHERE h.id > ?
+            ORDER BY h.id
+            LIMIT 1000
+        """, (last_id,)).fetchall()
+        if not rows:
+            break
+        cursor.executemany(_INSERT_SQL, _terms(rows))
+        last_id = rows[-1][0]
+
+
+def index(conn, history_id: int, user_id: int, recognized: str | None, tips: str | None):
+    """Index a meal; call inside the transaction that inserts it."""
+    conn.execute(_INSERT_SQL, (history_id, search_terms(user_id, recognized), search_terms(user_id, tips)))
+
+
+def unindex_user(conn, user_id: int):
+    """Remove all of the user's meals from the index; call inside the transaction that deletes them, before the delete."""
+    rows = conn.execute("""
+        SELECT h.id, h.user_id, h.recognized, t.tips
+        FROM history h JOIN history_text t ON t.history_id = h.id
+        WHERE h.user_id = ?
+    """, (user_id,)).fetchall()
+    conn.executemany(_DELETE_SQL, _terms(rows))
+
+
+def match_expression(user_id: int, text: str) -> str | None:
+    """FTS5 query for the user's words (each a prefix, all required), or None without any word."""
+    words = _WORD_RE.findall(text.lower())[:MAX_TERMS]
+    if not words:
+        return None
+    # quoted, so words like AND/NOT/NEAR are never operators; one-letter prefixes would match everything
+    return " ".join(f'"{user_id}_{word}"' + ("*" if len(word) > 1 else "") for word in words)
+
+
+def search(user_id: int, text: str, limit: int = 10, since: str | None = None) -> dict | None:
+    """Meals matching text: count and calories overall and since `since` (a timestamp prefix),
+    plus the newest `limit` matches as (id, timestamp, recognized, calories). None without any word."""
+    expression = match_expression(user_id, text)
+    if expression is None:
+        return None
+    # CROSS JOIN keeps history_fts the outer loop, otherwise SQLite walks the user's
+    # meals and re-runs the MATCH per meal; the user_id check is only a safety net
+    summary = db.query_one("""
+        SELECT COUNT(*), TOTAL(h.calories),
+               COUNT(CASE WHEN h.timestamp >= ? THEN 1 END), TOTAL(CASE WHEN h.timestamp >= ? THEN h.calories END)
+        FROM history_fts CROSS JOIN history h ON h.id = history_fts.rowid
+        WHERE history_fts MATCH ? AND h.user_id = ?
+    """, (since or "", since or "", expression, user_id))
+    rows = db.query_all("""
+        SELECT h.id, h.timestamp, h.recognized, h.calories
+        FROM history_fts CROSS JOIN history h ON h.id = history_fts.rowid
+        WHERE history_fts MATCH ? AND h.user_id = ?
+        ORDER BY history_fts.rowid DESC
+        LIMIT ?
+    """, (expression, user_id, limit))
+    return {
+        "matches": summary[0],
+        "calories": summary[1],
+        "since_matches": summary[2],
+        "since_calories": summary[3],
+        "rows": rows,
+    }
@@ -0,0 +1,84 @@
+import io
+import math
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Image preparation before upload to the vision model.
+# Telegram already offers every photo in several sizes, so the cheapest option
+# is the largest PhotoSize that fits the pixel budget: it is downloaded and sent
+# as is. Only when no size fits, or the one that does is much smaller than the
+# budget (e.g. documents, or a budget between two sizes), the next size up is
+# re-encoded, on a small thread pool: Pillow releases the GIL while
+# decoding/resizing/encoding, so this keeps CPU work off the update workers and
+# bounds how many resizes run at once.
+
+# Telegram's 800px size of a 4:3 photo (800x600): the usual photo is downloaded at that
+# size and sent as is. A budget above it means downloading the 1280px size and re-encoding.
+DEFAULT_PIXEL_BUDGET = 480_000
+# don't bother re-encoding when the image is only slightly above the budget
+REENCODE_SLACK = 1.25
+# a size that fits is sent as is only with at least this share of the budget's pixels;
+# a smaller one would lose more detail than downscaling the next size up
+MIN_BUDGET_SHARE = 0.5
+JPEG_QUALITY = 85
+
+_pil_image = False  # not imported yet
+
+
+def load_pillow():
+    """PIL.Image, imported on first use (it is slow to import), or None if Pillow is missing."""
+    global _pil_image
+    if _pil_image is False:
+        try:
+            from PIL import Image
+        except ImportError:  # without Pillow photos are sent as downloaded
+            Image = None
+        _pil_image = Image
+    return _pil_image
+
+
+_pool = ThreadPoolExecutor(max_workers=int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1)))),
+                           thread_name_prefix="image-prep")
+
+
+def choose_photo_size(sizes: list, pixel_budget: int):
+    """Largest PhotoSize that fits pixel_budget without re-encoding; if none does or it has less than
+    MIN_BUDGET_SHARE of the budget, the smallest one above the budget, or the largest one."""
+    ordered = sorted(sizes, key=lambda s: s.width * s.height)
+    fitting = 0
+    while fitting < len(ordered) and ordered[fitting].width * ordered[fitting].height <= pixel_budget * REENCODE_SLACK:
+        fitting += 1
+    if fitting == len(ordered):
+        return ordered[-1]
+    if fitting and ordered[fitting - 1].width * ordered[fitting - 1].height >= pixel_budget * MIN_BUDGET_SHARE:
+        return ordered[fitting - 1]
+    return ordered[fitting]
+
+
+def fit_to_budget(data: bytes, pixel_budget: int, quality: int = JPEG_QUALITY) -> bytes:
+    """Downscale a JPEG/PNG so width*height <= pixel_budget. Returns data untouched when it already fits."""
+    Image = load_pillow()
+    if Image is None or not pixel_budget:
+        return data
+    with Image.open(io.BytesIO(data)) as img:
+        width, height = img.size
+        if width * height <= pixel_budget * REENCODE_SLACK:
+            return data
+        scale = math.sqrt(pixel_budget / (width * height))
+        target = (max(1, int(width * scale)), max(1, int(height * scale)))
+        # JPEG draft mode decodes straight at 1/2, 1/4 or 1/8 scale
+        img.draft("RGB", target)
+        resized = img.convert("RGB").resize(target, Image.BICUBIC)
+
+    out = io.BytesIO()
+    resized.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+
+def prepare_image_async(data: bytes, pixel_budget: int) -> Future:
+    return _pool.submit(fit_to_budget, data, pixel_budget)
+
+
+def estimated_visual_tokens(width: int, height: int) -> int:
+    # Qwen2.5-VL turns every 28x28 pixel patch into one visual token
+    return math.ceil(width / 28) * math.ceil(height / 28)
@@ -0,0 +1,144 @@
+import io
+import json
+import threading
+import time
+
+import db
+from image_prep import load_pillow
+
+# Persistent cache of model answers for food photos, stored in the bot's SQLite
+# database. Lookups go by Telegram's file_unique_id first (same file forwarded
+# again) and then by a 64-bit difference hash of the decoded image, so a
+# re-compressed or slightly resized copy of the same photo is a hit as well.
+
+_MASK64 = (1 << 64) - 1
+
+
+def image_hash(data: bytes) -> int | None:
+    """dHash: compare neighbouring pixels of a 9x8 greyscale thumbnail."""
+    # without Pillow only exact file_unique_id hits are possible
+    Image = load_pillow()
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft("L", (64, 64))  # let the JPEG decoder skip most of the work
+            pixels = list(img.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    except Exception:
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def hash_distance(a: int, b: int) -> int:
+    return ((a ^ b) & _MASK64).bit_count()
+
+
+class InferenceCache:
+    def __init__(self, max_entries: int = 2000, ttl_seconds: float = 7 * 86400, max_distance: int = 5):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self.hits_exact = 0
+        self.hits_similar = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def create_table(cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS inference_cache (
+                file_unique_id TEXT PRIMARY KEY,
+                phash INTEGER,
+                parsed TEXT NOT NULL,
+                full_text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_inference_cache_last_used ON inference_cache (last_used)")
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, file_unique_id: str) -> dict | None:
+        row = db.query_one("""
+            SELECT parsed, full_text, created_at FROM inference_cache WHERE file_unique_id = ?
+        """, (file_unique_id,))
+        now = time.time()
+        if row and now - row[2] < self.ttl_seconds:
+            db.execute("UPDATE inference_cache SET last_used = ? WHERE file_unique_id = ?", (now, file_unique_id))
+            self._count("hits_exact")
+            return {"parsed": json.loads(row[0]), "full_text": row[1]}
+        return None
+
+    def get_similar(self, phash: int | None) -> dict | None:
+        """Closest cached photo within max_distance bits. Counts a miss when nothing is close."""
+        best = None
+        if phash is not None:
+            cutoff = time.time() - self.ttl_seconds
+            best_distance = self.max_distance + 1
+            for key, other in db.query_all("""
+                SELECT file_unique_id, phash FROM inference_cache
+                WHERE phash IS NOT NULL AND created_at > ?
+            """, (cutoff,)):
+                distance = hash_distance(phash, other)
+                if distance < best_distance:
+                    best, best_distance = key, distance
+                    if distance == 0:
+                        break
+
+        if best is None:
+            self._count("misses")
+            return None
+
+        row = db.query_one("SELECT parsed, full_text FROM inference_cache WHERE file_unique_id = ?", (best,))
+        if row is None:  # evicted in between
+            self._count("misses")
+            return None
+        db.execute("UPDATE inference_cache SET last_used = ? WHERE file_unique_id = ?", (time.time(), best))
+        self._count("hits_similar")
+        return {"parsed": json.loads(row[0]), "full_text": row[1]}
+
+    def put(self, file_unique_id: str, phash: int | None, parsed: dict, full_text: str):
+        now = time.time()
+        with db.transaction() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO inference_cache
+                (file_unique_id, phash, parsed, full_text, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (file_unique_id, phash, json.dumps(parsed), full_text, now, now))
+            expired = conn.execute("DELETE FROM inference_cache WHERE created_at < ?",
+                                   (now - self.ttl_seconds,)).rowcount
+            # LRU: drop the least recently used rows above max_entries
+            overflow = conn.execute("""
+                DELETE FROM inference_cache WHERE file_unique_id IN (
+                    SELECT file_unique_id FROM inference_cache
+                    ORDER BY last_used DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,)).rowcount
+        if expired or overflow:
+            with self._lock:
+                self.evictions += expired + overflow
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.hits_exact + self.hits_similar
+            lookups = hits + self.misses
+            return {
+                "hits_exact": self.hits_exact,
+                "hits_similar": self.hits_similar,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,301 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limiter import PRIORITY_NORMAL, RETRY_STATUSES, RateLimitTimeout, error_status
+
+# Hedged requests over an ordered list of routes to the vision model: a model
+# at a provider of the Hugging Face router, or any OpenAI-compatible endpoint.
+#
+# A request goes to the first healthy route. If nothing has come back once
+# that route's p95 latency (over its recent answers) has passed, the same body
+# is also sent to the next route and whichever answers first is used; the
+# other request is aborted (send() hands over an abort function once it is
+# connected), so it doesn't keep the body and a pool thread after the caller
+# has moved on. Latency is the time to the first output: the whole answer, or
+# the first streamed chunk, after which the request is no longer hedged. If
+# the route streaming to on_partial fails after another one has answered,
+# that answer is used and given to on_partial whole.
+# A route that fails hands the request straight to the next one, and after
+# `demote_after` failures in a row it is demoted: it is tried after all the
+# healthy routes for a cooldown that doubles with every further failure, and
+# a success restores it.
+#
+# With a limiter every attempt, hedges and failovers included, goes through
+# limiter.call(): it waits for its own token and concurrency slot, and a 429 or
+# 503 is retried on the same route with the limiter's backoff. That is
+# throttling, not a broken route, so it never counts towards demotion. The
+# hedge delay is counted from when the attempt got its slot and was sent.
+
+
+_STARTED = object()  # put on a race's outcomes when an attempt is sent
+
+
+class Route:
+    def __init__(self, name: str, url: str, model: str, window: int = 200):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.latencies = deque(maxlen=window)  # seconds to the first output of recent successes
+        self.requests = 0
+        self.failures = 0
+        self.wins = 0  # answers that were used
+        self.consecutive_failures = 0
+        self.demoted_until = 0.0
+
+    def p95(self) -> float | None:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def parse_routes(spec: str, default_url: str, url_for) -> list:
+    """Routes from "model[@base_url],model[@base_url],…"; base URLs go through url_for()."""
+    routes = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        model, _, base_url = entry.partition("@")
+        routes.append(Route(entry, url_for(base_url) if base_url else default_url, model))
+    return routes
+
+
+class _Race:
+    """The attempts of one request; the first one to produce output owns on_partial."""
+
+    def __init__(self, on_partial):
+        self.on_partial = on_partial
+        self.lock = threading.Lock()
+        self.owner = None
+        self.outcomes = queue.Queue()
+        self.aborts = {}      # route -> abort function of its request
+        self.aborted = set()  # routes whose request was aborted because the race was over
+        self.finished = False
+
+    def connected(self, route, abort):
+        with self.lock:
+            if not self.finished:
+                self.aborts[route] = abort
+                return
+            self.aborted.add(route)
+        abort()
+
+    def finish(self, winner=None):
+        """The answer is in: abort the requests still running."""
+        with self.lock:
+            self.finished = True
+            losers = [(route, abort) for route, abort in self.aborts.items() if route is not winner]
+            self.aborted.update(route for route, _ in losers)
+            self.aborts.clear()
+        for _, abort in losers:
+            abort()
+
+    def claim(self, route) -> bool:
+        with self.lock:
+            if self.owner is None:
+                self.owner = route
+            return self.owner is route
+
+    def release(self, route):
+        with self.lock:
+            if self.owner is route:
+                self.owner = None
+
+
+class InferenceRouter:
+    def __init__(self, routes: list, send, hedge_delay: float = 10.0, min_samples: int = 20,
+                 max_hedges: int = 1, demote_after: int = 3, cooldown: float = 30.0,
+                 max_cooldown: float = 600.0, limiter=None, max_workers: int | None = None):
+        if not routes:
+            raise ValueError("at least one route is needed")
+        self.routes = routes
+        self.send = send  # send(route, body, on_partial, on_connect) -> answer text, see vision_client.complete
+        self.limiter = limiter  # rate_limiter.RateLimiter shared by every attempt, or None
+        self.hedge_delay = hedge_delay  # until a route has min_samples latencies
+        self.min_samples = min_samples
+        self.max_hedges = max_hedges  # extra routes asked because of slowness (failures don't count)
+        self.demote_after = demote_after
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self._lock = threading.Lock()
+        if max_workers is None:
+            # every request the limiter lets in at once can have an attempt on each route
+            max_workers = (limiter.max_concurrency if limiter is not None else 8) * len(routes)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0  # hedged requests answered by a later route
+        self.failovers = 0
+
+    def ordered_routes(self) -> list:
+        """Healthy routes in the configured order, then the demoted ones, soonest back first."""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [r for r in self.routes if r.demoted_until <= now]
+            demoted = sorted((r for r in self.routes if r.demoted_until > now), key=lambda r: r.demoted_until)
+        return healthy + demoted
+
+    def hedge_after(self, route: Route) -> float:
+        with self._lock:
+            if len(route.latencies) < self.min_samples:
+                return self.hedge_delay
+            return route.p95()
+
+    def _record(self, route: Route, latency: float | None, error: Exception | None):
+        with self._lock:
+            route.requests += 1
+            if error is None:
+                if latency is not None:
+                    route.latencies.append(latency)
+                route.consecutive_failures = 0
+                route.demoted_until = 0.0
+                return
+            route.failures += 1
+            route.consecutive_failures += 1
+            extra = route.consecutive_failures - self.demote_after
+            if extra >= 0:
+                route.demoted_until = time.monotonic() + min(self.max_cooldown, self.cooldown * 2 ** extra)
+                if extra == 0:
+                    print(f"Inference route {route.name} demoted after {route.consecutive_failures} failures")
+
+    def _attempt(self, route: Route, body, race: _Race, priority: int):
+        start = None
+        first_output = None
+
+        def partial(text):
+            nonlocal first_output
+            if first_output is None:
+                first_output = time.monotonic() - start
+            if race.claim(route):
+                race.on_partial(text)
+
+        def send():
+            nonlocal start
+            with race.lock:
+                if race.finished:
+                    # answered while this attempt waited for its slot or backed off
+                    race.aborted.add(route)
+                    raise ConnectionAbortedError("request already answered")
+            if start is None:
+                race.outcomes.put((route, _STARTED, None))
+            start = time.monotonic()
+            return self.send(route, body, partial if race.on_partial else None,
+                             lambda abort: race.connected(route, abort))
+
+        try:
+            result = send() if self.limiter is None else self.limiter.call(send, priority=priority)
+        except Exception as e:
+            if route in race.aborted:
+                return  # lost the race, not the route's fault
+            if not (isinstance(e, RateLimitTimeout) or error_status(e) in RETRY_STATUSES):
+                self._record(route, None, e)
+            race.release(route)
+            race.outcomes.put((route, None, e))
+            return
+        self._record(route, first_output if first_output is not None else time.monotonic() - start, None)
+        race.outcomes.put((route, result, None))
+
+    def complete(self, body, on_partial=None, priority: int = PRIORITY_NORMAL) -> str:
+        """Answer from the first route that gets there; raises the last error if every route fails."""
+        race = _Race(on_partial)
+        try:
+            return self._complete(body, race, priority)
+        finally:
+            race.finish(race.owner)
+
+    def _complete(self, body, race: _Race, priority: int) -> str:
+        routes = self.ordered_routes()
+        launched = []
+        pending = 0
+        hedges = 0
+        deadline = None
+        last_error = None
+        answered = None  # (route, answer) that came in while another route owns the stream
+        with self._lock:
+            self.requests += 1
+
+        def won(route):
+            with self._lock:
+                route.wins += 1
+                if hedges and route is not launched[0]:
+                    self.hedge_wins += 1
+
+        def launch():
+            nonlocal pending, deadline
+            route = routes[len(launched)]
+            launched.append(route)
+            pending += 1
+            deadline = None  # set once the attempt has its limiter slot and is sent
+            self._pool.submit(self._attempt, route, body, race, priority)
+
+        launch()
+        while True:
+            timeout = None
+            if (deadline is not None and len(launched) < len(routes) and hedges < self.max_hedges
+                    and race.owner is None):
+                timeout = max(0.0, deadline - time.monotonic())
+            try:
+                route, result, error = race.outcomes.get(timeout=timeout)
+            except queue.Empty:
+                # slower than its p95 and nothing streamed yet: ask the next route too
+                hedges += 1
+                with self._lock:
+                    self.hedged += 1
+                launch()
+                continue
+
+            if result is _STARTED:
+                if route is launched[-1]:
+                    deadline = time.monotonic() + self.hedge_after(route)
+                continue
+            pending -= 1
+            if error is None:
+                if race.claim(route):
+                    won(route)
+                    return result
+                if answered is None:
+                    answered = (route, result)  # used if the route streaming to on_partial fails
+                continue
+            last_error = error
+            if answered is not None and race.claim(answered[0]):
+                route, result = answered
+                won(route)
+                if race.on_partial:
+                    race.on_partial(result)
+                return result
+            if pending == 0:
+                # another route would wait for the same limiter
+                if len(launched) == len(routes) or isinstance(error, RateLimitTimeout):
+                    raise last_error
+                with self._lock:
+                    self.failovers += 1
+                launch()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "failovers": self.failovers,
+            }
+
+    def route_stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                route.name: {
+                    "requests": route.requests,
+                    "failures": route.failures,
+                    "wins": route.wins,
+                    "p95": route.p95(),
+                    "demoted": route.demoted_until > now,
+                }
+                for route in self.routes
+            }
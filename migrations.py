@@ -0,0 +1,248 @@
+import time
+
+import db
+import frequent_meals
+import history_search
+import nutrition
+from album_buffer import SQLiteAlbumBuffer
+import text_codec
+from inference_cache import InferenceCache
+from profile_cache import ProfileCache
+from state_store import SQLiteTTLStore
+
+# Versioned schema migrations.
+# schema_version holds a single row with the version the database is at. A warm
+# boot is one primary-key read; only a database that is behind takes the write
+# lock and runs the missing steps, each in the same transaction as the version
+# bump. Migrations only ever add to the schema or copy data – never drop it
+# (triggers aside: they hold no data).
+# Migrations must be plain SQL plus Python run here, never triggers or SQL
+# functions that only exist in the bot's connections: the database has to stay
+# writable from the sqlite3 shell and any other client.
+# To change the schema, append a new function with the next version number.
+
+MIGRATIONS = []
+# migrations that free a lot of pages; the file only shrinks after a VACUUM
+_VACUUM_AFTER = set()
+
+
+def migration(version: int, description: str, vacuum: bool = False):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        if vacuum:
+            _VACUUM_AFTER.add(version)
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+@migration(1, "history and users tables")
+def _base_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            timestamp TEXT NOT NULL,
+            recognized TEXT,
+            calories REAL,
+            protein REAL,
+            carbs REAL,
+            fat REAL,
+            sugar REAL,
+            tips TEXT,
+            full_text TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            sex TEXT CHECK(sex IN ('male', 'female')),
+            age INTEGER,
+            height_cm REAL,
+            weight_kg REAL,
+            updated_at TEXT
+        )
+    """)
+
+    # databases from the first bot versions lack these columns
+    cursor.execute("PRAGMA table_info(users)")
+    columns = {row[1] for row in cursor.fetchall()}
+    for col_name, col_type in {'height_cm': 'REAL', 'weight_kg': 'REAL', 'updated_at': 'TEXT'}.items():
+        if col_name not in columns:
+            print(f"Adding missing column: {col_name}")
+            cursor.execute(f"ALTER TABLE users ADD COLUMN {col_name} {col_type}")
+
+
+@migration(2, "history (user_id, id) index and user_totals")
+def _user_totals(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_user_id ON history (user_id, id)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_totals (
+            user_id INTEGER PRIMARY KEY,
+            meals INTEGER NOT NULL DEFAULT 0,
+            calories REAL NOT NULL DEFAULT 0,
+            protein REAL NOT NULL DEFAULT 0,
+            carbs REAL NOT NULL DEFAULT 0,
+            fat REAL NOT NULL DEFAULT 0,
+            sugar REAL NOT NULL DEFAULT 0
+        )
+    """)
+    # rebuild from history so the step is safe on databases that already had the table
+    cursor.execute("DELETE FROM user_totals")
+    cursor.execute("""
+        INSERT INTO user_totals (user_id, meals, calories, protein, carbs, fat, sugar)
+        SELECT user_id, COUNT(*), TOTAL(calories), TOTAL(protein),
+               TOTAL(carbs), TOTAL(fat), TOTAL(sugar)
+        FROM history
+        GROUP BY user_id
+    """)
+
+
+@migration(3, "inference_cache table")
+def _inference_cache(cursor):
+    InferenceCache.create_table(cursor)
+
+
+@migration(4, "state_store table")
+def _state_store(cursor):
+    SQLiteTTLStore.create_table(cursor)
+
+
+@migration(5, "daily_totals rollup")
+def _daily_totals(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            meals INTEGER NOT NULL DEFAULT 0,
+            calories REAL NOT NULL DEFAULT 0,
+            protein REAL NOT NULL DEFAULT 0,
+            carbs REAL NOT NULL DEFAULT 0,
+            fat REAL NOT NULL DEFAULT 0,
+            sugar REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+    """)
+    # history timestamps are "YYYY-MM-DD HH:MM:SS", the day is the first 10 characters
+    cursor.execute("DELETE FROM daily_totals")
+    cursor.execute("""
+        INSERT INTO daily_totals (user_id, day, meals, calories, protein, carbs, fat, sugar)
+        SELECT user_id, substr(timestamp, 1, 10), COUNT(*), TOTAL(calories), TOTAL(protein),
+               TOTAL(carbs), TOTAL(fat), TOTAL(sugar)
+        FROM history
+        GROUP BY user_id, substr(timestamp, 1, 10)
+    """)
+
+
+@migration(6, "compressed history_text side table", vacuum=True)
+def _history_text(cursor):
+    # full_text and tips are read only for exports and search; keeping them out of
+    # history keeps the rows /history scans small
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS history_text (
+            history_id INTEGER PRIMARY KEY,
+            full_text BLOB,
+            tips BLOB
+        )
+    """)
+    last_id = 0
+    while True:
+        rows = cursor.execute("""
+            SELECT id, full_text, tips FROM history
+            WHERE id > ? AND (full_text IS NOT NULL OR tips IS NOT NULL)
+            ORDER BY id
+            LIMIT 1000
+        """, (last_id,)).fetchall()
+        if not rows:
+            break
+        cursor.executemany("INSERT OR REPLACE INTO history_text (history_id, full_text, tips) VALUES (?, ?, ?)",
+                           [(row_id, text_codec.compress(full_text), text_codec.compress(tips))
+                            for row_id, full_text, tips in rows])
+        last_id = rows[-1][0]
+    # the old columns stay (migrations never drop), emptied
+    cursor.execute("UPDATE history SET full_text = NULL, tips = NULL WHERE full_text IS NOT NULL OR tips IS NOT NULL")
+
+
+@migration(7, "cache_epochs table")
+def _cache_epochs(cursor):
+    ProfileCache.create_table(cursor)
+
+
+@migration(8, "album_photos table")
+def _album_photos(cursor):
+    SQLiteAlbumBuffer.create_table(cursor)
+
+
+@migration(9, "foods nutrition table and trigram index")
+def _foods(cursor):
+    nutrition.create_table(cursor)
+    nutrition.load_foods(cursor)
+
+
+@migration(10, "history_fts search index")
+def _history_fts(cursor):
+    # a meal is indexed once it has both rows; meals saved without any text get an empty one
+    cursor.execute("""
+        INSERT INTO history_text (history_id)
+        SELECT id FROM history WHERE id NOT IN (SELECT history_id FROM history_text)
+    """)
+    history_search.create_table(cursor)
+    history_search.backfill(cursor)
+
+
+@migration(11, "meal_frequency index of frequent meals")
+def _meal_frequency(cursor):
+    frequent_meals.create_table(cursor)
+    frequent_meals.backfill(cursor)
+
+
+@migration(12, "history_fts kept in sync by the bot instead of triggers")
+def _history_fts_without_triggers(cursor):
+    # the triggers called search_terms() and text_decompress(), Python functions only the
+    # bot's connections had, so any other client failed to insert or delete history rows
+    for trigger in ("history_fts_insert", "history_fts_delete", "history_fts_text_insert", "history_fts_text_delete"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version() -> int:
+    try:
+        row = db.query_one("SELECT version FROM schema_version")
+    except Exception:  # no schema_version table yet
+        return 0
+    return row[0] if row else 0
+
+
+def migrate() -> list:
+    """Bring the database to the latest version. Returns the versions applied."""
+    target = latest_version()
+    if current_version() >= target:
+        return []
+
+    applied = []
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+        # re-read under the write lock: another worker process may have just migrated
+        row = cursor.execute("SELECT version FROM schema_version").fetchone()
+        version = row[0] if row else 0
+        if row is None:
+            cursor.execute("INSERT INTO schema_version (version) VALUES (0)")
+
+        for number, description, fn in MIGRATIONS:
+            if number <= version:
+                continue
+            start = time.perf_counter()
+            fn(cursor)
+            cursor.execute("UPDATE schema_version SET version = ?", (number,))
+            applied.append(number)
+            print(f"Migration {number} ({description}) applied in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if _VACUUM_AFTER.intersection(applied):
+        start = time.perf_counter()
+        db.execute("VACUUM")
+        print(f"VACUUM done in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return applied
@@ -0,0 +1,302 @@
+import csv
+import os
+import re
+from difflib import SequenceMatcher
+from typing import NamedTuple
+
+import db
+from ai_parser import ParsedMeal
+
+# Typed meals ("2 boiled eggs and toast", "200g rice, chicken curry") resolved
+# against the bundled nutrition table in foods.csv (per 100 g, USDA-style
+# averages, plus the size of one typical serving).
+# The table lives in SQLite with an FTS5 trigram index over names and aliases.
+# Every trigram of the typed food name is OR-ed into one MATCH, which finds
+# candidates despite plurals and typos ("ramne"); the few candidates are then
+# scored word by word against the typed text (a typed word has to be a whole
+# word of the name or a typo of one, and words only one side has lower the
+# score) and the best score is the match confidence.
+# To change the data, edit foods.csv and add a migration that calls load_foods().
+
+FOODS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "foods.csv")
+NOTE = "📚 Estimated from the built-in nutrition table – send a photo if the portions look different."
+
+_NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+                 "seven": 7, "eight": 8, "nine": 9, "ten": 10, "half": 0.5, "quarter": 0.25, "couple": 2}
+# grams per unit; any other unit word ("bowl", "slice", "cup", ...) means one serving of that food
+_MASS_UNITS = {"g": 1, "gram": 1, "gr": 1, "kg": 1000, "ml": 1, "l": 1000, "oz": 28.35, "lb": 453.6,
+               "tbsp": 15, "tablespoon": 15, "tsp": 5, "teaspoon": 5}
+_SERVING_UNITS = {"serving", "portion", "bowl", "plate", "cup", "glass", "mug", "can", "bottle", "slice",
+                  "piece", "pc", "scoop", "bar", "stick", "handful", "pack", "packet", "fillet", "cob",
+                  "pat", "box"}
+_FILLER = {"of", "some", "the", "my", "x", "small", "medium", "large", "big", "little", "i", "had", "ate",
+           "for", "breakfast", "lunch", "dinner", "snack"}
+
+# hard separators split items; "and"/"with"/"&" only when the whole phrase isn't a known dish
+_ITEM_SPLIT_RE = re.compile(r"[,;+\n]")
+_SOFT_SPLIT_RE = re.compile(r"\s+(?:and|with|plus|&)\s+|\s*&\s*")
+_TOKEN_RE = re.compile(r"\d+(?:\.\d+)?(?:/\d+)?|[^\W\d_]+")
+# a joined phrase has to beat splitting it by this much ("ham and cheese sandwich")
+_WHOLE_PHRASE_CONFIDENCE = 0.85
+_CANDIDATES = 20
+# a typed word counts for a word of the name when it is that word, or a typo of it at least this similar;
+# words shorter than _MIN_TYPO_LENGTH have to be exact
+_WORD_MATCH = 0.75
+_MIN_TYPO_LENGTH = 4
+
+
+class FoodItem(NamedTuple):
+    text: str          # what the user typed for this item
+    food: str          # matched table entry
+    quantity: float
+    unit: str | None
+    grams: float
+    calories: float
+    protein: float
+    carbs: float
+    fat: float
+    sugar: float
+    confidence: float  # 0..1, how well the typed name matched
+
+
+def create_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS foods (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            aliases TEXT NOT NULL,
+            unit TEXT NOT NULL,
+            serving_g REAL NOT NULL,
+            kcal REAL NOT NULL,
+            protein REAL NOT NULL,
+            carbs REAL NOT NULL,
+            fat REAL NOT NULL,
+            sugar REAL NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS foods_fts USING fts5(
+            name, aliases, content='foods', content_rowid='id', tokenize='trigram'
+        )
+    """)
+
+
+def load_foods(cursor, path: str = FOODS_CSV) -> int:
+    """Replace the table contents with foods.csv and rebuild the index. Returns the number of foods."""
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = [(r["name"], r["aliases"], r["unit"], float(r["serving_g"]), float(r["kcal"]),
+                 float(r["protein"]), float(r["carbs"]), float(r["fat"]), float(r["sugar"]))
+                for r in csv.DictReader(f)]
+    cursor.execute("DELETE FROM foods")
+    cursor.executemany("""
+        INSERT INTO foods (name, aliases, unit, serving_g, kcal, protein, carbs, fat, sugar)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    cursor.execute("INSERT INTO foods_fts (foods_fts) VALUES ('rebuild')")
+    return len(rows)
+
+
+def _singular(word: str) -> str:
+    if len(word) <= 3 or word.endswith("ss"):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def _normalize(name: str) -> str:
+    return " ".join(_singular(w) for w in _TOKEN_RE.findall(name.lower()))
+
+
+def _quantity(token: str) -> float | None:
+    if token in _NUMBER_WORDS:
+        return _NUMBER_WORDS[token]
+    if token[0].isdigit():
+        if "/" in token:
+            top, bottom = token.split("/")
+            return float(top) / float(bottom) if float(bottom) else None
+        return float(token)
+    return None
+
+
+def parse_item(text: str) -> tuple:
+    """(quantity, unit, food words) from one item: "2 slices of toast" -> (2.0, "slice", "toast")."""
+    tokens = _TOKEN_RE.findall(text.lower())
+    while tokens and tokens[0] in _FILLER:  # "I had 2 eggs"
+        tokens.pop(0)
+    quantity = None
+    while tokens and (value := _quantity(tokens[0])) is not None:
+        # "half an avocado", "a couple of eggs": the words multiply
+        if quantity is None:
+            quantity = value
+        elif tokens[0] not in ("a", "an"):
+            quantity *= value
+        tokens.pop(0)
+    while tokens and tokens[0] in _FILLER:  # "a couple of eggs"
+        tokens.pop(0)
+    if len(tokens) > 2 and tokens[-2] == "x" and (value := _quantity(tokens[-1])) is not None:
+        quantity = (1.0 if quantity is None else quantity) * value  # "char siu bao x2"
+        del tokens[-2:]
+    unit = None
+    if tokens:
+        word = _singular(tokens[0])
+        if word in _MASS_UNITS or word in _SERVING_UNITS:
+            unit = word
+            tokens.pop(0)
+    words = [_singular(t) for t in tokens if t not in _FILLER]
+    return (1.0 if quantity is None else quantity), unit, " ".join(words)
+
+
+def _match_query(words: str) -> str:
+    grams = {words[i:i + 3] for word in words.split() for i in range(len(word) - 2)}
+    return " OR ".join('"' + g.replace('"', '""') + '"' for g in sorted(grams))
+
+
+def _word_similarity(matcher: SequenceMatcher, typed: str, word: str) -> float:
+    """0 unless typed is the whole word or a typo of it ("ramne"); a part of a word ("ice" in rice)
+    is not. matcher has typed as its second sequence."""
+    if typed == word:
+        return 1.0
+    shorter, total = min(len(typed), len(word)), len(typed) + len(word)
+    if shorter < _MIN_TYPO_LENGTH or 2 * shorter / total < _WORD_MATCH:
+        return 0.0
+    matcher.set_seq1(word)
+    if matcher.quick_ratio() < _WORD_MATCH:
+        return 0.0
+    score = matcher.ratio()
+    return score if score >= _WORD_MATCH else 0.0
+
+
+def _name_score(typed: list, name: list, similarity) -> float:
+    """Matched words over the words of both sides, so words only one side has count against it
+    ("pineapple" is not "pineapple bun")."""
+    matched = 0.0
+    unused = list(name)
+    for word in typed:
+        scores = [similarity(word, other) for other in unused]
+        best = max(scores, default=0.0)
+        if best:
+            matched += best
+            unused.pop(scores.index(best))
+    return 2 * matched / (len(typed) + len(name))
+
+
+def match_food(words: str):
+    """Best table row for the normalized food words and the match confidence, or (None, 0.0)."""
+    query = _match_query(words)
+    if not query:
+        return None, 0.0
+    rows = db.query_all("""
+        SELECT f.id, f.name, f.aliases, f.unit, f.serving_g, f.kcal, f.protein, f.carbs, f.fat, f.sugar
+        FROM foods_fts JOIN foods f ON f.id = foods_fts.rowid
+        WHERE foods_fts MATCH ? ORDER BY rank LIMIT ?
+    """, (query, _CANDIDATES))
+    typed = words.split()
+    # the typed words are their matchers' second sequence, which a matcher indexes once
+    matchers = {word: SequenceMatcher(None, "", word) for word in typed}
+    similarities = {}  # the candidates' names share most of their words
+
+    def similarity(word, other):
+        key = (word, other)
+        if key not in similarities:
+            similarities[key] = _word_similarity(matchers[word], word, other)
+        return similarities[key]
+
+    best, best_score = None, 0.0
+    for row in rows:
+        for name in [row[1]] + [a for a in row[2].split("|") if a]:
+            name_words = _normalize(name).split()
+            # upper bound when every word of the shorter side matches exactly
+            if 2 * min(len(typed), len(name_words)) / (len(typed) + len(name_words)) <= best_score:
+                continue
+            score = _name_score(typed, name_words, similarity)
+            if score > best_score:
+                best, best_score = row, score
+    return best, best_score
+
+
+def _item(text: str) -> FoodItem | None:
+    quantity, unit, words = parse_item(text)
+    row, confidence = match_food(words)
+    if row is None:
+        return None
+    _, name, _, serving_unit, serving_g, kcal, protein, carbs, fat, sugar = row
+    grams = quantity * (_MASS_UNITS[unit] if unit in _MASS_UNITS else serving_g)
+    factor = grams / 100
+    return FoodItem(text.strip(), name, quantity, unit or serving_unit, grams, kcal * factor,
+                    protein * factor, carbs * factor, fat * factor, sugar * factor, confidence)
+
+
+def resolve_meal(text: str) -> tuple:
+    """(FoodItems in order, the typed items that matched nothing)."""
+    items = []
+    unmatched = []
+    for chunk in _ITEM_SPLIT_RE.split(text):
+        if not chunk.strip():
+            continue
+        parts = [p for p in _SOFT_SPLIT_RE.split(chunk) if p.strip()]
+        if len(parts) > 1:
+            whole = _item(chunk)
+            if whole is not None and whole.confidence >= _WHOLE_PHRASE_CONFIDENCE:
+                items.append(whole)
+                continue
+        for part in parts:
+            item = _item(part)
+            if item is None:
+                unmatched.append(part.strip())
+            else:
+                items.append(item)
+    return items, unmatched
+
+
+def has_food_signal(text: str, items: list) -> bool:
+    """Whether typed text is worth asking the model about: some food of the table in it, or an
+    amount with a unit ("300g", "2 bowls of ...") of something the table doesn't know."""
+    if items:
+        return True
+    tokens = [t for t in _TOKEN_RE.findall(text.lower()) if t not in _FILLER]
+    # "a"/"an" alone are not an amount ("a bar fight")
+    return any(token not in ("a", "an") and _quantity(token) is not None
+               and (_singular(unit) in _MASS_UNITS or _singular(unit) in _SERVING_UNITS)
+               for token, unit in zip(tokens, tokens[1:]))
+
+
+def confidence(items: list, unmatched: list) -> float:
+    """The weakest item decides: one wrong or unknown food spoils the total."""
+    if unmatched:
+        return 0.0
+    return min((item.confidence for item in items), default=0.0)
+
+
+def _label(item: FoodItem) -> str:
+    if item.unit in _MASS_UNITS:
+        return f"{item.quantity:g}{item.unit} {item.food}"
+    return f"{item.quantity:g} × {item.food}"
+
+
+def describe(items: list) -> tuple:
+    """(answer text in the model's format, parsed dict like parse_ai_result)."""
+    labels = [_label(item) for item in items]
+    totals = {field: sum(getattr(item, field) for item in items)
+              for field in ("calories", "protein", "carbs", "fat", "sugar")}
+    breakdown = [f"{label} ({item.grams:.0f} g): {item.calories:.0f} kcal" for label, item in zip(labels, items)]
+    text = "\n".join([
+        f"🍽️Recognized: {', '.join(labels)}",
+        f"💪Protein: {totals['protein']:.0f}g 🥔Carbs: {totals['carbs']:.0f}g "
+        f"🧈Fat: {totals['fat']:.0f}g 🍬Sugar: {totals['sugar']:.0f}g",
+        f"🔥Calories: {totals['calories']:.0f} kcal",
+        "",
+        *("• " + line for line in breakdown),
+        "",
+        NOTE,
+    ])
+    parsed = ParsedMeal(
+        recognized=", ".join(labels),
+        tips="; ".join(breakdown),
+        **{field: round(value, 1) for field, value in totals.items()},
+    )._asdict()
+    return text, parsed
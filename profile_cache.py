@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+
+import db
+
+# Read-through LRU cache of user profiles and the BMR computed from them.
+#
+# Within one process, writers call invalidate() right after their commit. For
+# other processes sharing the database, every write also bumps a per-cache
+# counter in cache_epochs (in the writer's transaction). Readers notice
+# commits from other connections through PRAGMA data_version, which costs no
+# table read, and only then compare the epoch; a changed epoch empties the
+# cache. Profiles change rarely, so dropping everything is cheap.
+
+
+class ProfileCache:
+    def __init__(self, load, derive, name: str = "profiles", max_size: int = 10000, ttl: float = 600.0):
+        self.load = load        # user_id -> profile dict or None
+        self.derive = derive    # profile -> derived value (BMR)
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # user_id -> (profile, derived, expires_at)
+        self._lock = threading.Lock()
+        self._seen = threading.local()  # data_version last seen by this thread's connection
+        self._epoch = None
+        # bumped by every invalidation, so a load that raced with a write isn't cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def create_table(cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS cache_epochs (
+                name TEXT PRIMARY KEY,
+                epoch INTEGER NOT NULL
+            )
+        """)
+
+    def bump_epoch(self, conn) -> int:
+        """Call inside the writer's transaction, after changing a profile."""
+        return conn.execute("""
+            INSERT INTO cache_epochs (name, epoch) VALUES (?, 1)
+            ON CONFLICT(name) DO UPDATE SET epoch = epoch + 1
+            RETURNING epoch
+        """, (self.name,)).fetchone()[0]
+
+    def _check_other_writers(self):
+        version = db.data_version()
+        if getattr(self._seen, "version", None) == version:
+            return
+        self._seen.version = version
+        row = db.query_one("SELECT epoch FROM cache_epochs WHERE name = ?", (self.name,))
+        epoch = row[0] if row else 0
+        with self._lock:
+            if epoch != self._epoch:
+                if self._epoch is not None:
+                    self._data.clear()
+                    self._generation += 1
+                    self.invalidations += 1
+                self._epoch = epoch
+
+    def get(self, user_id: int) -> tuple:
+        """(profile, derived) for user_id; profile is None when the user has none. Treat as read-only."""
+        self._check_other_writers()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is not None and entry[2] > now:
+                self._data.move_to_end(user_id)
+                self.hits += 1
+                return entry[0], entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        profile = self.load(user_id)
+        derived = self.derive(profile)
+        with self._lock:
+            if generation == self._generation:
+                self._data[user_id] = (profile, derived, now + self.ttl)
+                self._data.move_to_end(user_id)
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+        return profile, derived
+
+    def invalidate(self, user_id: int, epoch: int | None = None):
+        """Drop one user after a write; epoch is what bump_epoch returned for that write."""
+        with self._lock:
+            self._data.pop(user_id, None)
+            self._generation += 1
+            if epoch is None or self._epoch is not None and epoch <= self._epoch:
+                return  # a later write already moved the epoch past this one
+            if self._epoch is None or epoch != self._epoch + 1:
+                # another process wrote in between, and its users may be cached here
+                self._data.clear()
+                self.invalidations += 1
+            self._epoch = epoch
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
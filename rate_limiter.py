@@ -0,0 +1,147 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+# Client-side limiter for the Hugging Face inference API.
+# A token bucket smooths the request rate, a concurrency cap bounds requests in
+# flight, and callers wait in a priority queue (lower number = served first)
+# instead of failing. Requests answered with 429/503 are retried with
+# exponential backoff and full jitter, honouring Retry-After when present.
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BACKGROUND = 10
+
+RETRY_STATUSES = (429, 503)
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+def error_status(exc: Exception) -> int | None:
+    # huggingface_hub / requests errors carry .response, urllib's HTTPError has .code
+    response = getattr(exc, "response", None)
+    for status in (getattr(response, "status_code", None), getattr(exc, "status_code", None),
+                   getattr(exc, "code", None)):
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def retry_after(exc: Exception) -> float | None:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or getattr(exc, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    def __init__(self, rate: float = 2.0, burst: int = 4, max_concurrency: int = 4,
+                 max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 30.0,
+                 max_wait: float = 120.0):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+
+        self.requests = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self, priority: int = PRIORITY_NORMAL, timeout: float | None = None):
+        """Block until this caller is first in line and a token and a concurrency slot are free."""
+        timeout = self.max_wait if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    wait = None
+                    if self._waiters[0] == entry and self._active < self.max_concurrency:
+                        self._refill()
+                        if self._tokens >= 1:
+                            self._tokens -= 1
+                            self._active += 1
+                            heapq.heappop(self._waiters)
+                            entry = None
+                            self.requests += 1
+                            self.total_wait += time.monotonic() - start
+                            self._cond.notify_all()
+                            return
+                        wait = (1 - self._tokens) / self.rate
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise RateLimitTimeout("Timed out waiting for an inference slot")
+                    self._cond.wait(remaining if wait is None else min(wait, remaining))
+            finally:
+                if entry is not None:
+                    # gave up (timeout or interrupt): leave the queue, let the next one in
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def backoff_delay(self, attempt: int, exc: Exception | None = None) -> float:
+        hinted = retry_after(exc) if exc is not None else None
+        if hinted is not None:
+            return min(self.max_delay, hinted)
+        # full jitter: uniform between 0 and the exponential cap
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, *args, priority: int = PRIORITY_NORMAL, **kwargs):
+        attempt = 0
+        while True:
+            self.acquire(priority)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if error_status(e) not in RETRY_STATUSES or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt, e)
+            finally:
+                self.release()
+            self.retries += 1
+            attempt += 1
+            time.sleep(delay)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "timeouts": self.timeouts,
+                "in_flight": self._active,
+                "waiting": len(self._waiters),
+                "avg_wait": self.total_wait / self.requests if self.requests else 0.0,
+            }
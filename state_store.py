@@ -0,0 +1,211 @@
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import db
+
+# Short-lived conversation state (pending saves, /setprofile steps).
+# Entries expire after a TTL, the store never grows past max_size (oldest
+# entries are evicted first) and a background thread sweeps expired entries.
+# TTLStore keeps everything in this process; SQLiteTTLStore keeps it in the
+# bot database, so it survives restarts and is shared by every worker process.
+# Both behave like a small dict: get / [] / in / pop / del.
+
+_MISSING = object()
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at")
+
+    def __init__(self, value, expires_at: float):
+        self.value = value
+        self.expires_at = expires_at
+
+
+def _deep_size(obj) -> int:
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_deep_size(v) for v in obj)
+    return size
+
+
+class _StoreBase:
+    def __init__(self, name: str, ttl: float, max_size: int = 10000, sweep_interval: float = 60.0):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        self.expired = 0
+        self.evicted = 0
+        self._sweeper = None
+
+    def start_sweeper(self):
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep_loop, name=f"sweep-{self.name}", daemon=True)
+            self._sweeper.start()
+        return self
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"State sweep ({self.name}) failed:", str(e))
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        if self.pop(key, _MISSING) is _MISSING:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+
+class TTLStore(_StoreBase):
+    def __init__(self, name: str, ttl: float, max_size: int = 10000, sweep_interval: float = 60.0):
+        super().__init__(name, ttl, max_size, sweep_interval)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            if entry.expires_at <= time.monotonic():
+                del self._data[key]
+                self.expired += 1
+                return default
+            return entry.value
+
+    def set(self, key, value, ttl: float | None = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = _Entry(value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evicted += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        if entry.expires_at <= time.monotonic():
+            self.expired += 1
+            return default
+        return entry.value
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            dead = [k for k, e in self._data.items() if e.expires_at <= now]
+            for k in dead:
+                del self._data[k]
+            self.expired += len(dead)
+        return len(dead)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            approx_bytes = sys.getsizeof(self._data) + sum(
+                _deep_size(k) + sys.getsizeof(e) + _deep_size(e.value) for k, e in self._data.items())
+            return {
+                "backend": "memory",
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "approx_bytes": approx_bytes,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+
+class SQLiteTTLStore(_StoreBase):
+    """Values must be JSON serialisable. Keys are stored as text."""
+
+    @staticmethod
+    def create_table(cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS state_store (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_state_store_expires ON state_store (namespace, expires_at)")
+
+    def get(self, key, default=None):
+        # wall clock, not monotonic: other processes read these timestamps too
+        row = db.query_one("""
+            SELECT value FROM state_store WHERE namespace = ? AND key = ? AND expires_at > ?
+        """, (self.name, str(key), time.time()))
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value, ttl: float | None = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        db.execute("""
+            INSERT OR REPLACE INTO state_store (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)
+        """, (self.name, str(key), json.dumps(value), expires_at))
+
+    def pop(self, key, default=None):
+        # one statement, so two workers can never both pop the same entry
+        rows = db.query_all("""
+            DELETE FROM state_store WHERE namespace = ? AND key = ? RETURNING value, expires_at
+        """, (self.name, str(key)))
+        if not rows:
+            return default
+        row = rows[0]
+        if row[1] <= time.time():
+            self.expired += 1
+            return default
+        return json.loads(row[0])
+
+    def sweep(self) -> int:
+        with db.transaction() as conn:
+            expired = conn.execute("DELETE FROM state_store WHERE namespace = ? AND expires_at <= ?",
+                                   (self.name, time.time())).rowcount
+            # over capacity: drop the entries closest to expiry
+            evicted = conn.execute("""
+                DELETE FROM state_store WHERE namespace = ? AND key IN (
+                    SELECT key FROM state_store WHERE namespace = ?
+                    ORDER BY expires_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (self.name, self.name, self.max_size)).rowcount
+        self.expired += expired
+        self.evicted += evicted
+        return expired + evicted
+
+    def __len__(self) -> int:
+        return db.query_one("SELECT COUNT(*) FROM state_store WHERE namespace = ?", (self.name,))[0]
+
+    def stats(self) -> dict:
+        size, stored_bytes = db.query_one("""
+            SELECT COUNT(*), TOTAL(LENGTH(key) + LENGTH(value)) FROM state_store WHERE namespace = ?
+        """, (self.name,))
+        return {
+            "backend": "sqlite",
+            "size": size,
+            "max_size": self.max_size,
+            "approx_bytes": int(stored_bytes),
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
@@ -1,18 +1,49 @@
+import time
+
+#startup-time breakdown, printed once the app is ready (cold starts on scale-to-zero hosting)
+_startup_mark = time.perf_counter()
+startup_steps = []
+
+def startup_step(name: str):
+    global _startup_mark
+    now = time.perf_counter()
+    startup_steps.append((name, now - _startup_mark))
+    _startup_mark = now
+
 import telebot
-import base64
 import os
-import sqlite3
-from datetime import datetime
-from huggingface_hub import InferenceClient
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 from flask import Flask, request, abort
 from telebot import types
+from update_queue import UpdateQueue
+import db
+from inference_cache import InferenceCache, image_hash
+from rate_limiter import PRIORITY_INTERACTIVE, PRIORITY_NORMAL, RateLimiter, RateLimitTimeout, error_status
+from state_store import SQLiteTTLStore, TTLStore
+from album_buffer import AlbumBuffer, SQLiteAlbumBuffer
+from byte_budget import ByteBudget, ByteBudgetTimeout
+from ai_parser import parse_ai_result
+from image_prep import DEFAULT_PIXEL_BUDGET, choose_photo_size, prepare_image_async
+from inference_router import InferenceRouter, parse_routes
+import frequent_meals
+import history_export
+import history_search
+import nutrition
+import text_codec
+import vision_client
+from profile_cache import ProfileCache
+import migrations
+import metrics
+import tracing
 
 app = Flask(__name__)
+startup_step("imports")
 
-pending_saves = {}
-user_states = {}
 load_dotenv()  # Uncomment if you use .env; otherwise set env vars directly
 
 # Tokens (move to .env for security!)
@@ -22,128 +53,384 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN") or "8049647620:AAGmBQukfcJ66h68OLnN
 if not HF_TOKEN or not TELEGRAM_TOKEN:
     raise ValueError("Missing API tokens!")
 
-DB_FILE = "calorie_history.db"
-
-conn = sqlite3.connect(DB_FILE)
-cursor = conn.cursor()
-cursor.execute("DROP TABLE IF EXISTS history")
-conn.commit()
-conn.close()
-
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    # Create tables if they don't exist
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            timestamp TEXT NOT NULL,
-            recognized TEXT,
-            calories REAL,
-            protein REAL,
-            carbs REAL,
-            fat REAL,
-            sugar REAL,
-            tips TEXT,
-            full_text TEXT
-        )
-    """)
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            sex TEXT CHECK(sex IN ('male', 'female')),
-            age INTEGER,
-            height_cm REAL,
-            weight_kg REAL,
-            updated_at TEXT
-        )
-    """)
-
-    # ── Add missing columns if they don't exist ──────────────────────────────
-    cursor.execute("PRAGMA table_info(users)")
-    columns = {row[1] for row in cursor.fetchall()}
+DB_FILE = os.getenv("DB_FILE", "calorie_history.db")
+
+# OpenAI-compatible endpoint to use instead of the Hugging Face router
+# (a self-hosted model, or benchmarks/fake_inference_server.py for load tests)
+INFERENCE_BASE_URL = os.getenv("INFERENCE_BASE_URL")
+# Model asked about photos and typed meals ("<model>:<provider>" on the Hugging Face router)
+VISION_MODEL = os.getenv("VISION_MODEL", "Qwen/Qwen2.5-VL-7B-Instruct:hyperbolic")
+# Routes to the model in order of preference: "model" or "model@base_url", comma-separated
+# (e.g. "Qwen/Qwen2.5-VL-7B-Instruct:hyperbolic,Qwen/Qwen2.5-VL-7B-Instruct:nebius").
+# A request slower than its route's p95 is also sent to the next route (the first answer wins)
+# and a route failing INFERENCE_DEMOTE_AFTER times in a row goes to the back for a while
+INFERENCE_ROUTES = os.getenv("INFERENCE_ROUTES", VISION_MODEL)
+INFERENCE_HEDGE_DELAY = float(os.getenv("INFERENCE_HEDGE_DELAY", "10"))  # until a route has latencies
+INFERENCE_DEMOTE_AFTER = int(os.getenv("INFERENCE_DEMOTE_AFTER", "3"))
+
+# Bot API server to use instead of api.telegram.org (a local Bot API server,
+# or benchmarks/fake_telegram_api.py for load tests)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+if TELEGRAM_API_URL:
+    telebot.apihelper.API_URL = TELEGRAM_API_URL.rstrip("/") + "/bot{0}/{1}"
+    telebot.apihelper.FILE_URL = TELEGRAM_API_URL.rstrip("/") + "/file/bot{0}/{1}"
+
+# Webhook work queue: number of handler threads and total queued updates
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "4"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "200"))
+
+# Cached model answers for repeated / near-identical photos
+INFERENCE_CACHE_SIZE = int(os.getenv("INFERENCE_CACHE_SIZE", "2000"))
+INFERENCE_CACHE_TTL = float(os.getenv("INFERENCE_CACHE_TTL", str(7 * 86400)))
+INFERENCE_CACHE_DISTANCE = int(os.getenv("INFERENCE_CACHE_DISTANCE", "5"))
+
+# Max pixels (width*height) of the photo sent to the model, 0 = always the largest size
+IMAGE_PIXEL_BUDGET = int(os.getenv("IMAGE_PIXEL_BUDGET", str(DEFAULT_PIXEL_BUDGET)))
+
+# Bytes that photos in flight to the model (downloads and request bodies) may hold together;
+# further photos wait up to IMAGE_BUDGET_WAIT seconds for their turn. 0 = no limit
+IMAGE_MEMORY_BUDGET = int(os.getenv("IMAGE_MEMORY_BUDGET", str(32 * 1024 * 1024)))
+IMAGE_BUDGET_WAIT = float(os.getenv("IMAGE_BUDGET_WAIT", "60"))
+
+# Stream the model answer into the reply while it is generated.
+# Telegram allows roughly one edit per second per chat, so edits are throttled.
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+STREAM_MAX_EDITS = int(os.getenv("STREAM_MAX_EDITS", "15"))
+
+# Photos sent as one album are collected for ALBUM_WINDOW seconds after the last one
+# and analyzed in a single model call; 0 answers every photo of an album separately
+ALBUM_WINDOW = float(os.getenv("ALBUM_WINDOW", "1.0"))
+
+# "Log again" buttons for the user's most saved meals on /start and after a save, 0 = off
+FREQUENT_MEALS = int(os.getenv("FREQUENT_MEALS", "4"))
+
+# Typed meals are answered from the built-in nutrition table when every item matches
+# at least this well (0..1); otherwise the model estimates them
+TEXT_MATCH_CONFIDENCE = float(os.getenv("TEXT_MATCH_CONFIDENCE", "0.75"))
+
+# Client-side limits for the Hugging Face API (requests/s, burst, requests in flight)
+HF_RATE_LIMIT = float(os.getenv("HF_RATE_LIMIT", "2"))
+HF_BURST = int(os.getenv("HF_BURST", "4"))
+HF_MAX_CONCURRENCY = int(os.getenv("HF_MAX_CONCURRENCY", "4"))
+HF_MAX_RETRIES = int(os.getenv("HF_MAX_RETRIES", "4"))
+
+# Conversation state: "memory" (this process only) or "sqlite" (survives restarts,
+# shared by worker processes). Abandoned entries expire after their TTL.
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+PENDING_SAVE_TTL = float(os.getenv("PENDING_SAVE_TTL", "3600"))
+PROFILE_STATE_TTL = float(os.getenv("PROFILE_STATE_TTL", "900"))
+STATE_MAX_SIZE = int(os.getenv("STATE_MAX_SIZE", "10000"))
+
+# /metrics (Prometheus text format); when set, scrape with /metrics?token=<value>
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Tracing: fraction of updates recorded as Chrome trace spans in TRACE_DIR/trace.json.
+# PROFILE_SECONDS > 0 runs the sampling profiler for that long right after startup;
+# admins (comma separated user ids) can start it any time with /profile <seconds>.
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", "0"))
+# /history page size and how many rendered history rows are kept in memory
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+HISTORY_RENDER_CACHE = int(os.getenv("HISTORY_RENDER_CACHE", "5000"))
+
+# Profiles and their BMR are cached in memory for PROFILE_CACHE_TTL seconds
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "600"))
+
+# /export runs on its own threads so a long export never holds up an update worker
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "1"))
+
+ADMIN_USER_IDS = {int(uid) for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+
+db.configure(DB_FILE)
+
+#schema_version based: a warm boot is one read, existing data is never dropped
+migrations.migrate()
+startup_step("migrations")
+
+def make_state_store(name: str, ttl: float):
+    store_class = SQLiteTTLStore if STATE_BACKEND == "sqlite" else TTLStore
+    return store_class(name, ttl=ttl, max_size=STATE_MAX_SIZE).start_sweeper()
+
+#photo analyses waiting for "save"/"no", and half-finished /setprofile dialogs
+pending_saves = make_state_store("pending_saves", PENDING_SAVE_TTL)
+user_states = make_state_store("user_states", PROFILE_STATE_TTL)
+
+inference_cache = InferenceCache(
+    max_entries=INFERENCE_CACHE_SIZE,
+    ttl_seconds=INFERENCE_CACHE_TTL,
+    max_distance=INFERENCE_CACHE_DISTANCE
+)
 
-    required = {
-        'height_cm': 'REAL',
-        'weight_kg': 'REAL',
-        'updated_at': 'TEXT'
-    }
+#photos reserve their bytes here before they are downloaded
+image_budget = ByteBudget(IMAGE_MEMORY_BUDGET, max_wait=IMAGE_BUDGET_WAIT)
 
-    for col_name, col_type in required.items():
-        if col_name not in columns:
-            print(f"Adding missing column: {col_name}")
-            cursor.execute(f"ALTER TABLE users ADD COLUMN {col_name} {col_type}")
+inference_limiter = RateLimiter(
+    rate=HF_RATE_LIMIT,
+    burst=HF_BURST,
+    max_concurrency=HF_MAX_CONCURRENCY,
+    max_retries=HF_MAX_RETRIES
+)
 
-    conn.commit()
-    conn.close()
+#the ai model (Qwen2.5) behind the Hugging Face router's OpenAI-compatible endpoint,
+#one route per provider; hedged and demoted by inference_router
+#every attempt on a route (hedges and failovers too) takes its own inference_limiter slot
+VISION_URL = vision_client.chat_url(INFERENCE_BASE_URL)
+inference_router = InferenceRouter(
+    parse_routes(INFERENCE_ROUTES, VISION_URL, vision_client.chat_url),
+    lambda route, body, on_partial, on_connect: vision_client.complete(route.url, HF_TOKEN, route.model, body,
+                                                                       on_partial, on_connect=on_connect),
+    hedge_delay=INFERENCE_HEDGE_DELAY,
+    demote_after=INFERENCE_DEMOTE_AFTER,
+    limiter=inference_limiter
+)
 
-init_db()
+# Handlers run on our own update workers (see update_queue), not telebot's pool
+bot = telebot.TeleBot(TELEGRAM_TOKEN, threaded=False)
+
+#metrics served on /metrics
+HANDLER_SECONDS = metrics.Histogram("bot_handler_seconds", "Time spent in each bot handler", ("handler",))
+PHOTO_STAGE_SECONDS = metrics.Histogram("bot_photo_stage_seconds", "handle_photo time by stage", ("stage",))
+DB_SECONDS = metrics.Histogram("bot_db_seconds", "SQLite query and transaction time", ("operation",))
+UPDATES_TOTAL = metrics.Counter("bot_updates_total", "Webhook updates by outcome", ("result",))
+PHOTO_ERRORS = metrics.Counter("bot_photo_errors_total", "Failed photo analyses by cause", ("cause",))
+TEXT_MEALS = metrics.Counter("bot_text_meals_total", "Typed meals by how they were answered", ("source",))
+MEALS_LOGGED_AGAIN = metrics.Counter("bot_meals_logged_again_total", "Meals saved again from the frequent meals buttons")
+tracer = tracing.Tracer(sample_rate=TRACE_SAMPLE_RATE, directory=TRACE_DIR)
+profiler = tracing.SamplingProfiler(directory=TRACE_DIR)
+
+def observe_db(operation: str, seconds: float):
+    DB_SECONDS.observe(seconds, operation)
+    tracing.record("db." + operation, seconds)
+
+db.set_observer(observe_db)
+
+#every Telegram API call the handlers make shows up as its own span
+for _method in ("reply_to", "send_message", "edit_message_text", "answer_callback_query",
+                "get_file", "download_file", "send_document"):
+    setattr(bot, _method, tracing.traced("telegram." + _method)(getattr(bot, _method)))
+
+#record the handler's run time under its function name (and as a trace span)
+def timed_handler(fn):
+    return HANDLER_SECONDS.time(fn.__name__)(tracing.traced()(fn))
+
+startup_step("state stores and clients")
+#rendered text of one history row; rows never change once saved and ids are never
+#reused (AUTOINCREMENT), so a cached entry stays valid until the row is deleted
+_row_text_cache = OrderedDict()
+_row_text_lock = threading.Lock()
+
+def render_history_row(row) -> str:
+    row_id = row[0]
+    with _row_text_lock:
+        text = _row_text_cache.get(row_id)
+        if text is not None:
+            _row_text_cache.move_to_end(row_id)
+            return text
+
+    _, ts, recog, cal, prot, carb, fat, sug = row
+    text = (
+        f"📅 {ts}\n"
+        f"🍽️ {recog}\n"
+        f"💪 Protein: {prot}g   🥔 Carbs: {carb}g\n"
+        f"🧈 Fat: {fat}g   🍬 Sugar: {sug}g\n"
+        f"🔥 {cal} kcal\n"
+        "───\n"
+    )
+    with _row_text_lock:
+        _row_text_cache[row_id] = text
+        while len(_row_text_cache) > HISTORY_RENDER_CACHE:
+            _row_text_cache.popitem(last=False)
+    return text
 
-#find the ai model(Qwen2.5)
-client = InferenceClient(
-    model="Qwen/Qwen2.5-VL-7B-Instruct:hyperbolic",
-    token=HF_TOKEN
-)
+#one page of history, newest first, keyed on id instead of OFFSET so every page is
+#a single range scan on idx_history_user_id however long the history is.
+#before_id: the page older than that row, after_id: the page newer than it
+#returns (rows, has_older, has_newer)
+@tracing.traced()
+def get_history_page(user_id: int, limit: int, before_id: int | None = None, after_id: int | None = None):
+    if after_id is not None:
+        rows = db.query_all("""
+            SELECT id, timestamp, recognized, calories, protein, carbs, fat, sugar
+            FROM history
+            WHERE user_id = ? AND id > ?
+            ORDER BY id ASC
+            LIMIT ?
+        """, (user_id, after_id, limit + 1))
+        if len(rows) > limit:
+            return rows[limit - 1::-1], True, True
+        # reached the newest rows: show the first page instead of a short one
+        before_id = None
+
+    if before_id is None:
+        rows = db.query_all("""
+            SELECT id, timestamp, recognized, calories, protein, carbs, fat, sugar
+            FROM history
+            WHERE user_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (user_id, limit + 1))
+    else:
+        rows = db.query_all("""
+            SELECT id, timestamp, recognized, calories, protein, carbs, fat, sugar
+            FROM history
+            WHERE user_id = ? AND id < ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (user_id, before_id, limit + 1))
+    return rows[:limit], len(rows) > limit, before_id is not None
+
+#"log again" buttons for the user's most saved meals, None until a meal was saved MIN_MEALS times
+def frequent_meals_markup(user_id: int):
+    if FREQUENT_MEALS <= 0:
+        return None
+    meals = frequent_meals.top(user_id, FREQUENT_MEALS)
+    if not meals:
+        return None
+    markup = InlineKeyboardMarkup(row_width=1)
+    for meal_id, _, recognized, calories in meals:
+        name = recognized if len(recognized) <= 40 else recognized[:39] + "…"
+        markup.add(InlineKeyboardButton(f"🔁 {name} · {calories or 0:.0f} kcal", callback_data=f"again_{meal_id}"))
+    return markup
 
-bot = telebot.TeleBot(TELEGRAM_TOKEN)
 #find user search history, show the records if it have records
-def get_user_history(user_id: int, limit: int = 10) -> str:
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # Get limited records for display
-    cursor.execute("""
-        SELECT timestamp, recognized, calories, protein, carbs, fat, sugar
-        FROM history 
-        WHERE user_id = ? 
-        ORDER BY id DESC 
-        LIMIT ?
-    """, (user_id, limit))
-    records = cursor.fetchall()
-    
-    # Get total calories (all time)
-    cursor.execute("""
-        SELECT SUM(calories) 
-        FROM history 
-        WHERE user_id = ?
-    """, (user_id,))
-    total_calories = cursor.fetchone()[0] or 0.0
-    
-    conn.close()
+#returns the page text and its Older/Newer buttons (None when everything fits on one page)
+def render_history_page(user_id: int, limit: int, before_id: int | None = None, after_id: int | None = None):
+    rows, has_older, has_newer = get_history_page(user_id, limit, before_id, after_id)
+    if not rows:
+        return "No history yet. Send a food photo to start! 📸", None
 
-    if not records:
-        return "No history yet. Send a food photo to start! 📸"
+    # Get total calories (all time)
+    total_calories = get_user_totals(user_id)["calories"]
 
     text = f"📊 **Your calorie summary**\n"
     text += f"Total calories (all records): **{total_calories:.0f} kcal**\n\n"
-    text += f"Recent {len(records)} records:\n\n"
-
-    for row in records:
-        ts, recog, cal, prot, carb, fat, sug = row
-        text += (
-            f"📅 {ts}\n"
-            f"🍽️ {recog}\n"
-            f"💪 Protein: {prot}g   🥔 Carbs: {carb}g\n"
-            f"🧈 Fat: {fat}g   🍬 Sugar: {sug}g\n"
-            f"🔥 {cal} kcal\n"
-            "───\n"
-        )
-    
-    return text
+    if has_newer:
+        text += f"{len(rows)} records, {rows[-1][1]} – {rows[0][1]}:\n\n"
+    else:
+        text += f"Recent {len(rows)} records:\n\n"
+    text += "".join(render_history_row(row) for row in rows)
+
+    if not (has_older or has_newer):
+        return text, None
+    markup = InlineKeyboardMarkup(row_width=2)
+    buttons = []
+    if has_older:
+        buttons.append(InlineKeyboardButton("⬅️ Older", callback_data=f"hist_older_{rows[-1][0]}"))
+    if has_newer:
+        buttons.append(InlineKeyboardButton("Newer ➡️", callback_data=f"hist_newer_{rows[0][0]}"))
+    markup.add(*buttons)
+    return text, markup
+
+@tracing.traced()
+def get_user_totals(user_id: int) -> dict:
+    row = db.query_one("""
+        SELECT meals, calories, protein, carbs, fat, sugar
+        FROM user_totals
+        WHERE user_id = ?
+    """, (user_id,))
+    keys = ("meals", "calories", "protein", "carbs", "fat", "sugar")
+    return dict(zip(keys, row)) if row else dict.fromkeys(keys, 0)
+
 
-def get_user_profile(user_id: int) -> dict | None:
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
+#save one meal; history, history_text (compressed answer), the history_fts search index,
+#user_totals, daily_totals and meal_frequency change in the same transaction
+@tracing.traced()
+def add_history_record(user_id: int, timestamp: str, parsed: dict, full_text: str) -> int:
+    with db.transaction() as conn:
+        cursor = conn.execute("""
+            INSERT INTO history 
+            (user_id, timestamp, recognized, calories, protein, carbs, fat, sugar)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            user_id,
+            timestamp,
+            parsed["recognized"],
+            parsed["calories"],
+            parsed["protein"],
+            parsed["carbs"],
+            parsed["fat"],
+            parsed["sugar"]
+        ))
+        conn.execute("""
+            INSERT INTO history_text (history_id, full_text, tips) VALUES (?, ?, ?)
+        """, (cursor.lastrowid, text_codec.compress(full_text), text_codec.compress(parsed["tips"])))
+        history_search.index(conn, cursor.lastrowid, user_id, parsed["recognized"], parsed["tips"])
+        frequent_meals.record(conn, user_id, parsed["recognized"], cursor.lastrowid)
+        conn.execute("""
+            INSERT INTO user_totals (user_id, meals, calories, protein, carbs, fat, sugar)
+            VALUES (?, 1, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                meals = meals + 1,
+                calories = calories + excluded.calories,
+                protein = protein + excluded.protein,
+                carbs = carbs + excluded.carbs,
+                fat = fat + excluded.fat,
+                sugar = sugar + excluded.sugar
+        """, (
+            user_id,
+            parsed["calories"],
+            parsed["protein"],
+            parsed["carbs"],
+            parsed["fat"],
+            parsed["sugar"]
+        ))
+        conn.execute("""
+            INSERT INTO daily_totals (user_id, day, meals, calories, protein, carbs, fat, sugar)
+            VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, day) DO UPDATE SET
+                meals = meals + 1,
+                calories = calories + excluded.calories,
+                protein = protein + excluded.protein,
+                carbs = carbs + excluded.carbs,
+                fat = fat + excluded.fat,
+                sugar = sugar + excluded.sugar
+        """, (
+            user_id,
+            timestamp[:10],
+            parsed["calories"],
+            parsed["protein"],
+            parsed["carbs"],
+            parsed["fat"],
+            parsed["sugar"]
+        ))
+        return cursor.lastrowid
+
+
+@tracing.traced()
+def clear_user_history(user_id: int):
+    with db.transaction() as conn:
+        history_search.unindex_user(conn, user_id)
+        conn.execute("""
+            DELETE FROM history_text WHERE history_id IN (SELECT id FROM history WHERE user_id = ?)
+        """, (user_id,))
+        conn.execute("DELETE FROM history WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM user_totals WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM daily_totals WHERE user_id = ?", (user_id,))
+        frequent_meals.clear(conn, user_id)
+
+
+#per-day intake from the daily_totals rollup, {"YYYY-MM-DD": {...}} for days with meals
+@tracing.traced()
+def get_daily_totals(user_id: int, first_day: str, last_day: str) -> dict:
+    rows = db.query_all("""
+        SELECT day, meals, calories, protein, carbs, fat, sugar
+        FROM daily_totals
+        WHERE user_id = ? AND day BETWEEN ? AND ?
+    """, (user_id, first_day, last_day))
+    keys = ("meals", "calories", "protein", "carbs", "fat", "sugar")
+    return {row[0]: dict(zip(keys, row[1:])) for row in rows}
+
+
+@tracing.traced()
+def load_user_profile(user_id: int) -> dict | None:
+    row = db.query_one("""
         SELECT sex, age, height_cm, weight_kg 
         FROM users 
         WHERE user_id = ?
     """, (user_id,))
-    row = cursor.fetchone()
-    conn.close()
     
     if not row:
         return None
@@ -156,24 +443,30 @@ def get_user_profile(user_id: int) -> dict | None:
     }
 
 
+#cached BMR, None without a complete profile (profile_cache.get gives the profile too)
+def get_user_bmr(user_id: int) -> float | None:
+    return profile_cache.get(user_id)[1]
+
+
+#profile writes bump the cache epoch in the same transaction, so other worker processes drop their copies
+@tracing.traced()
 def save_user_profile(user_id: int, sex: str, age: int, height: float, weight: float):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT OR REPLACE INTO users 
-        (user_id, sex, age, height_cm, weight_kg, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (user_id, sex.lower(), age, height, weight, datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+    with db.transaction() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO users 
+            (user_id, sex, age, height_cm, weight_kg, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (user_id, sex.lower(), age, height, weight, datetime.now().isoformat()))
+        epoch = profile_cache.bump_epoch(conn)
+    profile_cache.invalidate(user_id, epoch)
 
 
+@tracing.traced()
 def delete_user_profile(user_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+        epoch = profile_cache.bump_epoch(conn)
+    profile_cache.invalidate(user_id, epoch)
 
 
 def calculate_bmr(profile: dict) -> float | None:
@@ -199,7 +492,20 @@ def calculate_bmr(profile: dict) -> float | None:
         return 10 * kg + 6.25 * cm - 5 * age - 161
     return None
 
+profile_cache = ProfileCache(
+    load=load_user_profile,
+    derive=calculate_bmr,
+    max_size=PROFILE_CACHE_SIZE,
+    ttl=PROFILE_CACHE_TTL
+)
+
+#current /setprofile step of a user, None if not setting up a profile
+def profile_step(user_id: int) -> str | None:
+    state = user_states.get(user_id)
+    return state["step"] if state else None
+
 @bot.message_handler(commands=['setprofile'])
+@timed_handler
 def start_profile_setup(message):
     user_id = message.from_user.id
     user_states[user_id] = {"step": "sex", "data": {}}
@@ -213,15 +519,19 @@ def start_profile_setup(message):
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("profile_sex_"))
+@timed_handler
 def handle_sex_selection(call):
     user_id = call.from_user.id
-    if user_id not in user_states or user_states[user_id]["step"] != "sex":
+    state = user_states.get(user_id)
+    if state is None or state["step"] != "sex":
         bot.answer_callback_query(call.id, "Session expired.")
         return
     
     sex = "male" if call.data.endswith("_m") else "female"
-    user_states[user_id]["data"]["sex"] = sex
-    user_states[user_id]["step"] = "age"
+    state["data"]["sex"] = sex
+    state["step"] = "age"
+    # write back: the store may not be in this process's memory
+    user_states[user_id] = state
     
     bot.edit_message_text(
         chat_id=call.message.chat.id,
@@ -231,35 +541,42 @@ def handle_sex_selection(call):
     bot.answer_callback_query(call.id)
 
 
-@bot.message_handler(func=lambda m: m.from_user.id in user_states and user_states[m.from_user.id]["step"] == "age")
+@bot.message_handler(func=lambda m: profile_step(m.from_user.id) == "age")
+@timed_handler
 def handle_age(message):
     user_id = message.from_user.id
     try:
         age = int(message.text.strip())
         if not 10 <= age <= 120:
             raise ValueError
-        user_states[user_id]["data"]["age"] = age
-        user_states[user_id]["step"] = "height"
+        state = user_states[user_id]
+        state["data"]["age"] = age
+        state["step"] = "height"
+        user_states[user_id] = state
         bot.reply_to(message, "Enter your height in cm (e.g. 168):")
     except:
         bot.reply_to(message, "Please enter a realistic age (10–120). Try again:")
 
 
-@bot.message_handler(func=lambda m: m.from_user.id in user_states and user_states[m.from_user.id]["step"] == "height")
+@bot.message_handler(func=lambda m: profile_step(m.from_user.id) == "height")
+@timed_handler
 def handle_height(message):
     user_id = message.from_user.id
     try:
         height = float(message.text.strip())
         if not 100 <= height <= 250:
             raise ValueError
-        user_states[user_id]["data"]["height_cm"] = height
-        user_states[user_id]["step"] = "weight"
+        state = user_states[user_id]
+        state["data"]["height_cm"] = height
+        state["step"] = "weight"
+        user_states[user_id] = state
         bot.reply_to(message, "Enter your weight in kg (e.g. 65.5):")
     except:
         bot.reply_to(message, "Please enter height in cm (100–250). Try again:")
 
 
-@bot.message_handler(func=lambda m: m.from_user.id in user_states and user_states[m.from_user.id]["step"] == "weight")
+@bot.message_handler(func=lambda m: profile_step(m.from_user.id) == "weight")
+@timed_handler
 def handle_weight(message):
     user_id = message.from_user.id
     try:
@@ -294,25 +611,26 @@ def handle_weight(message):
         bot.reply_to(message, summary)
         
         # Clean up
-        del user_states[user_id]
+        user_states.pop(user_id, None)
         
     except:
         bot.reply_to(message, "Please enter weight in kg (30–300). Try again:")
 
 
 @bot.message_handler(commands=['clearprofile'])
+@timed_handler
 def clear_profile(message):
     user_id = message.from_user.id
     delete_user_profile(user_id)
-    if user_id in user_states:
-        del user_states[user_id]
+    user_states.pop(user_id, None)
     bot.reply_to(message, "🗑️ Your profile and BMR data have been cleared.")
 
 
 @bot.message_handler(commands=['bmr'])
+@timed_handler
 def show_bmr(message):
     user_id = message.from_user.id
-    profile = get_user_profile(user_id)
+    profile, bmr = profile_cache.get(user_id)
     
     if not profile:
         bot.reply_to(message,
@@ -320,7 +638,6 @@ def show_bmr(message):
             "Use /setprofile to enter sex, age, height & weight.")
         return
     
-    bmr = calculate_bmr(profile)
     if bmr is None:
         bot.reply_to(message, "Profile data incomplete. Please use /setprofile again.")
         return
@@ -336,51 +653,172 @@ def show_bmr(message):
     )
     bot.reply_to(message, text)
 
+#intake compared with BMR, "N kcal (x% of BMR)"
+def intake_vs_bmr(calories: float, bmr: float | None) -> str:
+    if not bmr:
+        return f"{calories:.0f} kcal"
+    return f"{calories:.0f} kcal ({calories / bmr * 100:.0f}% of BMR)"
+
+def bmr_note(bmr: float | None) -> str:
+    if bmr is None:
+        return "\nSet your profile with /setprofile to compare with your BMR"
+    return f"\nYour BMR: ≈{bmr:.0f} kcal/day"
+
+#today's intake against BMR
+@bot.message_handler(commands=['today'])
+@timed_handler
+def show_today(message):
+    user_id = message.from_user.id
+    today = datetime.now().strftime("%Y-%m-%d")
+    day = get_daily_totals(user_id, today, today).get(today)
+    bmr = get_user_bmr(user_id)
+
+    if day is None:
+        bot.reply_to(message, "No meals saved today yet. Send a food photo to start! 📸" + bmr_note(bmr))
+        return
+
+    text = (
+        f"📅 Today ({today}): {day['meals']} meals\n"
+        f"🔥 {intake_vs_bmr(day['calories'], bmr)}\n"
+        f"💪 Protein: {day['protein']:.0f}g   🥔 Carbs: {day['carbs']:.0f}g\n"
+        f"🧈 Fat: {day['fat']:.0f}g   🍬 Sugar: {day['sugar']:.0f}g\n"
+    )
+    if bmr:
+        remaining = bmr - day["calories"]
+        text += f"\n{'Below' if remaining >= 0 else 'Above'} BMR by {abs(remaining):.0f} kcal"
+    text += bmr_note(bmr)
+    bot.reply_to(message, text)
+
+#last 7 days, one line per day
+@bot.message_handler(commands=['week'])
+@timed_handler
+def show_week(message):
+    user_id = message.from_user.id
+    today = datetime.now().date()
+    days = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(6, -1, -1)]
+    totals = get_daily_totals(user_id, days[0], days[-1])
+    bmr = get_user_bmr(user_id)
+
+    if not totals:
+        bot.reply_to(message, "No meals saved in the last 7 days. Send a food photo to start! 📸" + bmr_note(bmr))
+        return
+
+    text = "📊 Last 7 days:\n\n"
+    for day in days:
+        total = totals.get(day)
+        text += f"{day[5:]}  " + (intake_vs_bmr(total["calories"], bmr) if total else "–") + "\n"
+
+    week_calories = sum(t["calories"] for t in totals.values())
+    text += f"\nAverage on days with meals: {week_calories / len(totals):.0f} kcal"
+    text += bmr_note(bmr)
+    bot.reply_to(message, text)
+
+#find saved meals by words in the dish or the tips: /search ramen
+@bot.message_handler(commands=['search'])
+@timed_handler
+def search_history(message):
+    user_id = message.from_user.id
+    query = message.text.partition(" ")[2].strip()
+    month_start = datetime.now().strftime("%Y-%m-01")
+    result = history_search.search(user_id, query, limit=10, since=month_start) if query else None
+    if result is None:
+        bot.reply_to(message, "Usage: /search <words>, e.g. /search ramen")
+        return
+    if not result["matches"]:
+        bot.reply_to(message, f"No saved meals match \"{query}\" 🔍")
+        return
+
+    text = f"🔍 \"{query}\": {result['matches']} meals, {result['calories']:.0f} kcal in total\n"
+    text += f"📅 This month: {result['since_matches']} meals, {result['since_calories']:.0f} kcal\n\n"
+    for _, timestamp, recognized, calories in result["rows"]:
+        text += f"{timestamp[:10]}  {recognized} – {calories or 0:.0f} kcal\n"
+    if result["matches"] > len(result["rows"]):
+        text += f"\n…and {result['matches'] - len(result['rows'])} older"
+    bot.reply_to(message, text)
+
 #command that let user find records
 @bot.message_handler(commands=['history'])
+@timed_handler
 def show_history(message):
-    history_text = get_user_history(message.from_user.id, limit=10)
-    bot.reply_to(message, history_text)
+    history_text, markup = render_history_page(message.from_user.id, HISTORY_PAGE_SIZE)
+    bot.reply_to(message, history_text, reply_markup=markup)
+
+#Older / Newer buttons under a history page: edit the same message in place
+@bot.callback_query_handler(func=lambda call: call.data.startswith(("hist_older_", "hist_newer_")))
+@timed_handler
+def handle_history_page(call):
+    direction, _, cursor = call.data[len("hist_"):].partition("_")
+    if not cursor.isdigit():
+        bot.answer_callback_query(call.id, "Invalid action")
+        return
+
+    if direction == "older":
+        history_text, markup = render_history_page(call.from_user.id, HISTORY_PAGE_SIZE, before_id=int(cursor))
+    else:
+        history_text, markup = render_history_page(call.from_user.id, HISTORY_PAGE_SIZE, after_id=int(cursor))
+
+    try:
+        bot.edit_message_text(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            text=history_text,
+            reply_markup=markup
+        )
+    except Exception as e:
+        # double taps re-send the same page, which Telegram rejects as "not modified"
+        if "not modified" not in str(e):
+            raise
+    bot.answer_callback_query(call.id)
+
+#one tap on a frequent meal saves it again with the stored macros: no photo, no model call
+@bot.callback_query_handler(func=lambda call: call.data.startswith("again_"))
+@timed_handler
+def handle_log_again(call):
+    meal_id = call.data[len("again_"):]
+    if not meal_id.isdigit():
+        bot.answer_callback_query(call.id, "Invalid action")
+        return
+
+    user_id = call.from_user.id
+    meal = frequent_meals.latest(user_id, int(meal_id))
+    if meal is None:
+        bot.answer_callback_query(call.id, "This meal is no longer in your history")
+        return
+
+    parsed, full_text = meal
+    now = datetime.now()
+    add_history_record(user_id, now.strftime("%Y-%m-%d %H:%M:%S"), parsed, full_text)
+    MEALS_LOGGED_AGAIN.inc()
+    bot.answer_callback_query(call.id, "Saved ✅")
+
+    today = now.strftime("%Y-%m-%d")
+    day = get_daily_totals(user_id, today, today)[today]
+    bot.send_message(
+        call.message.chat.id,
+        f"✅ Logged again: {parsed['recognized']} – {parsed['calories']:.0f} kcal\n"
+        f"📅 Today: {day['meals']} meals, {intake_vs_bmr(day['calories'], get_user_bmr(user_id))}"
+    )
 
 #let user choose save or not save the records
 @bot.callback_query_handler(func=lambda call: True)
+@timed_handler
 def handle_callback(call):
     user_id = call.from_user.id
     data = call.data
 
-    if user_id not in pending_saves:
+    saved_data = pending_saves.pop(user_id, None)  # remove after handling
+    if saved_data is None:
         bot.answer_callback_query(call.id, "Session expired. Please send photo again.")
         return
 
-    saved_data = pending_saves.pop(user_id)  # remove after handling
-
     if data.startswith("save_yes_"):
-        p = saved_data["parsed"]
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO history 
-            (user_id, timestamp, recognized, calories, protein, carbs, fat, sugar, tips, full_text)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            user_id,
-            saved_data["timestamp"],
-            p["recognized"],
-            p["calories"],
-            p["protein"],
-            p["carbs"],
-            p["fat"],
-            p["sugar"],
-            p["tips"],
-            saved_data["full_text"]
-        ))
-        conn.commit()
-        conn.close()
+        add_history_record(user_id, saved_data["timestamp"], saved_data["parsed"], saved_data["full_text"])
 
         bot.edit_message_text(
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
-            text = saved_data["full_text"] + "\n\n✅ Saved!"
+            text = saved_data["full_text"] + "\n\n✅ Saved!",
+            reply_markup=frequent_meals_markup(user_id)
         )
 
     elif data.startswith("save_no_"):
@@ -396,12 +834,12 @@ def handle_callback(call):
 
 #welcome user
 @bot.message_handler(commands=['start'])
+@timed_handler
 def send_welcome(message):
     user_id = message.from_user.id
-    profile = get_user_profile(user_id)
+    profile, bmr = profile_cache.get(user_id)
     
     if profile:
-        bmr = calculate_bmr(profile)
         if bmr is not None:
             bmr_line = f"Your BMR: ≈{bmr:.0f} kcal/day\n"
         else:
@@ -410,27 +848,50 @@ def send_welcome(message):
         bmr_line = "Set your profile with /setprofile to see your BMR\n"
     
     welcome = (
-        f"Hi! 👋 Send me a photo of food to estimate calories.\n\n"
+        f"Hi! 👋 Send me a photo of food, or type what you ate (e.g. 2 boiled eggs and toast), to estimate calories.\n\n"
         f"{bmr_line}\n"
-        "Commands: /history • /bmr • /setprofile • /clearprofile • /clear (meals)"
+        "Commands: /history • /search • /today • /week • /bmr • /export • /setprofile • /clearprofile • /clear (meals)"
     )
-    bot.reply_to(message, welcome)
+    bot.reply_to(message, welcome, reply_markup=frequent_meals_markup(user_id))
     
-    history_text = get_user_history(user_id, limit=8)
-    bot.reply_to(message, history_text)
+    history_text, markup = render_history_page(user_id, 8)
+    bot.reply_to(message, history_text, reply_markup=markup)
+
+#placeholder reply that is edited as the model answer streams in
+class ProgressiveReply:
+    def __init__(self, message, placeholder: str):
+        self.sent = bot.reply_to(message, placeholder)
+        self.last_text = placeholder
+        self.last_edit = time.monotonic()
+        self.edits = 0
+
+    def _edit(self, text: str, reply_markup=None):
+        bot.edit_message_text(
+            chat_id=self.sent.chat.id,
+            message_id=self.sent.message_id,
+            text=text,
+            reply_markup=reply_markup
+        )
+        self.last_text = text
+        self.last_edit = time.monotonic()
+        self.edits += 1
+
+    def update(self, text: str):
+        text = text.strip()
+        if (not text or text == self.last_text or self.edits >= STREAM_MAX_EDITS
+                or time.monotonic() - self.last_edit < STREAM_EDIT_INTERVAL):
+            return
+        try:
+            self._edit(text + " ▌")
+        except Exception as e:
+            # a dropped intermediate edit is harmless, the final one carries everything
+            print("Stream edit skipped:", str(e))
 
-#if user send photo, the chatbot will send the photo via API to AI and ask nutritional data.
-@bot.message_handler(content_types=['photo'])
-def handle_photo(message):
-    try:
-        user_id = message.from_user.id
-        file_id = message.photo[-1].file_id
-        file_info = bot.get_file(file_id)
-        downloaded_file = bot.download_file(file_info.file_path)
+    def finish(self, text: str, reply_markup=None):
+        self._edit(text, reply_markup=reply_markup)
 
-        base64_image = base64.b64encode(downloaded_file).decode('utf-8')
 
-        prompt = """Analyze this food image carefully.
+PHOTO_PROMPT = """Analyze this food image carefully.
 Describe visible food items, approximate portion sizes (small/medium/large or rough grams if possible),
 cooking method if visible, and estimate total calories.
 Use realistic nutritional knowledge (USDA-style averages). Break down by item if multiple foods are present.
@@ -441,162 +902,354 @@ The output style should be:
 🔥Calories: 850 kcal
 and provide some tips at the end for the user."""
 
-        response = client.chat.completions.create(
-            messages=[{
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                ]
-            }],
-            max_tokens=450,
-            temperature=0.35,
-        )
-
-        result = response.choices[0].message.content.strip()
-
-        if not result:
-            bot.reply_to(message, "Couldn't analyze – try a clearer photo!")
-            return
-
-        # After getting result
-        parsed = parse_ai_result(result)
+#the per-photo lines come before the total; the parser keeps a complete "Total" line, else adds up the photos
+ALBUM_PROMPT = """These {count} photos are one meal (for example starter, main course and dessert).
+Analyze each photo carefully: visible food items, approximate portion sizes and cooking method.
+Use realistic nutritional knowledge (USDA-style averages). Be conservative and realistic in your estimates.
+Count food that appears in more than one photo only once.
+The output style should be:
+🍽️Recognized: Caesar salad, grilled salmon with rice & chocolate mousse
+📷1 Caesar salad: 💪Protein: 8g 🥔Carbs: 10g 🧈Fat: 15g 🍬Sugar: 3g 🔥Calories: 210 kcal
+📷2 Grilled salmon with rice: 💪Protein: 40g 🥔Carbs: 60g 🧈Fat: 20g 🍬Sugar: 2g 🔥Calories: 580 kcal
+📷3 Chocolate mousse: 💪Protein: 5g 🥔Carbs: 30g 🧈Fat: 18g 🍬Sugar: 25g 🔥Calories: 300 kcal
+🧮Total: 💪Protein: 53g 🥔Carbs: 100g 🧈Fat: 53g 🍬Sugar: 30g 🔥Calories: 1090 kcal
+with one 📷 line per photo, then provide some tips at the end for the user."""
+
+TEXT_MEAL_PROMPT = """The user describes what they ate: "{text}"
+Estimate realistic portion sizes where none are given and the nutrition of the whole meal.
+Use realistic nutritional knowledge (USDA-style averages). Be conservative and realistic in your estimates.
+The output style should be:
+🍽️Recognized: 2 boiled eggs & 1 slice of buttered toast
+💪Protein: 15g 🥔Carbs: 17g 🧈Fat: 17g 🍬Sugar: 3g
+🔥Calories: 300 kcal
+and provide some tips at the end for the user.
+If the message is not about food or drink, answer only: NOT_FOOD"""
+
+#send the photos to the vision model in one request and return its answer text
+#with on_partial the answer is streamed and on_partial gets the text so far
+def ask_vision_model(prompt: str, images: list, max_tokens: int, on_partial=None,
+                     priority: int = PRIORITY_INTERACTIVE) -> str:
+    # the images are base64-encoded straight into the one request body, which retries and routes reuse
+    body = vision_client.chat_body(prompt, images, max_tokens, 0.35, stream=on_partial is not None)
+
+    # each attempt holds a limiter slot until its stream is fully read; 429/503 are retried with backoff
+    with tracing.span("model_request"):
+        return inference_router.complete(body, on_partial, priority)
+
+@tracing.traced()
+def analyze_photo(image_bytes: bytes, on_partial=None, priority: int = PRIORITY_INTERACTIVE) -> str:
+    return ask_vision_model(PHOTO_PROMPT, [image_bytes], 450, on_partial, priority)
+
+@tracing.traced()
+def analyze_album(images: list, on_partial=None, priority: int = PRIORITY_INTERACTIVE) -> str:
+    # room for one breakdown line per photo on top of the single-photo answer
+    max_tokens = min(450 + 60 * (len(images) - 1), 1200)
+    return ask_vision_model(ALBUM_PROMPT.format(count=len(images)), images, max_tokens, on_partial, priority)
+
+#typed meals the local table isn't sure about; behind photos in the limiter queue
+@tracing.traced()
+def analyze_meal_text(text: str, on_partial=None, priority: int = PRIORITY_NORMAL) -> str:
+    return ask_vision_model(TEXT_MEAL_PROMPT.format(text=text[:500]), [], 450, on_partial, priority)
+
+#the largest Telegram photo size that fits the pixel budget, or the next one up to re-encode
+def photo_upload_size(sizes: list):
+    return choose_photo_size(sizes, IMAGE_PIXEL_BUDGET) if IMAGE_PIXEL_BUDGET else sizes[-1]
+
+#image budget bytes for photos not downloaded yet: each file plus its base64 in the request body
+def photo_reservation(uploads: list) -> int:
+    # Telegram nearly always sends file_size; otherwise assume a JPEG of 2 bits per pixel
+    return vision_client.request_bytes([u.file_size or u.width * u.height // 4 for u in uploads])
+
+def download_photo(upload) -> bytes:
+    file_info = bot.get_file(upload.file_id)
+    return bot.download_file(file_info.file_path)
+
+#show the answer with the save keyboard and keep it until the user decides
+def offer_save(message, progress, result: str, parsed: dict):
+    user_id = message.from_user.id
+    markup = InlineKeyboardMarkup(row_width=2)
+    markup.add(
+        InlineKeyboardButton("Yes, save this", callback_data=f"save_yes_{user_id}"),
+        InlineKeyboardButton("No, thanks", callback_data=f"save_no_{user_id}")
+    )
 
-        # Show result to user (full original text)
-        markup = InlineKeyboardMarkup(row_width=2)
-        markup.add(
-            InlineKeyboardButton("Yes, save this", callback_data=f"save_yes_{user_id}"),
-            InlineKeyboardButton("No, thanks", callback_data=f"save_no_{user_id}")
-        )
+    # Store parsed + full for later, before the buttons can be pressed (the
+    # callback may reach another worker process as soon as they are shown)
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    pending_saves[user_id] = {
+        "parsed": parsed,
+        "full_text": result,
+        "timestamp": timestamp
+    }
 
+    if progress:
+        progress.finish(result + "\n\nWould you like to save this record?", reply_markup=markup)
+    else:
         bot.reply_to(
             message,
             result + "\n\nWould you like to save this record?",
             reply_markup=markup
         )
 
-        # Store parsed + full for later
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        pending_saves[user_id] = {
-            "parsed": parsed,
-            "full_text": result,
-            "timestamp": timestamp
-        }
+#the error replaces the "Analyzing..." placeholder when there is one, so it doesn't stay up
+def reply_photo_error(message, e: Exception, progress=None):
+    error_msg = str(e).lower()
+    print("Full error:", str(e))
+
+    if isinstance(e, (RateLimitTimeout, ByteBudgetTimeout)):
+        PHOTO_ERRORS.inc("busy")
+        text = "The bot is very busy right now – please send the photo again in a minute ⏳"
+    elif error_status(e) == 429 or "rate limit" in error_msg or "quota" in error_msg:
+        PHOTO_ERRORS.inc("rate_limit")
+        text = "Rate limit – wait 1–2 min ⏳"
+    elif "unavailable" in error_msg or "bad request" in error_msg:
+        PHOTO_ERRORS.inc("unavailable")
+        text = "Model temporarily unavailable – try again soon"
+    else:
+        PHOTO_ERRORS.inc("other")
+        text = f"Error: {str(e)[:180]}..."
+
+    if progress:
+        try:
+            progress.finish(text)
+            return
+        except Exception as edit_error:
+            print("Placeholder edit failed:", str(edit_error))
+    bot.reply_to(message, text)
+
+
+#if user send photo, the chatbot will send the photo via API to AI and ask nutritional data.
+@bot.message_handler(content_types=['photo'])
+@timed_handler
+def handle_photo(message):
+    stages = PHOTO_STAGE_SECONDS.stopwatch()
+    progress = None
+    try:
+        # part of an album: answered together once the other photos are in (handle_album)
+        if message.media_group_id and ALBUM_WINDOW > 0:
+            album_buffer.add(message)
+            return
+
+        # Cache key is always the largest size, so it doesn't change with the budget
+        photo = message.photo[-1]
+
+        # Same file seen before → no download and no model call
+        cached = inference_cache.get(photo.file_unique_id)
+        stages.mark("cache_lookup")
+        if cached is None:
+            if STREAM_RESPONSES:
+                # answer right away, the placeholder is filled in as tokens arrive
+                progress = ProgressiveReply(message, "🔍 Analyzing your meal...")
+
+            # Smallest Telegram size that still covers the pixel budget; the photo waits
+            # for its share of the image budget and keeps it until the answer is in
+            upload = photo_upload_size(message.photo)
+            with image_budget.reserve(photo_reservation([upload])):
+                stages.mark("budget_wait")
+                downloaded_file = download_photo(upload)
+                stages.mark("download")
+
+                # Re-encoding (if still too big) runs on the image pool while we hash
+                prepared = prepare_image_async(downloaded_file, IMAGE_PIXEL_BUDGET)
+
+                # Near-duplicate (re-sent / re-compressed) photo
+                phash = image_hash(downloaded_file)
+                cached = inference_cache.get_similar(phash)
+                stages.mark("hash_lookup")
+                if cached is not None:
+                    prepared.cancel()
+                    inference_cache.put(photo.file_unique_id, phash, cached["parsed"], cached["full_text"])
+                else:
+                    image = prepared.result()
+                    stages.mark("resize")
+                    result = analyze_photo(image, on_partial=progress.update if progress else None)
+                    stages.mark("inference")
+
+        if cached is not None:
+            result = cached["full_text"]
+            parsed = cached["parsed"]
+        else:
+            if not result:
+                if progress:
+                    progress.finish("Couldn't analyze – try a clearer photo!")
+                else:
+                    bot.reply_to(message, "Couldn't analyze – try a clearer photo!")
+                return
+
+            parsed = parse_ai_result(result)
+            stages.mark("parse")
+            inference_cache.put(photo.file_unique_id, phash, parsed, result)
+            stages.mark("cache_store")
+
+        # Show result to user (full original text)
+        offer_save(message, progress, result, parsed)
+        stages.mark("reply")
 
     except Exception as e:
-        error_msg = str(e).lower()
-        print("Full error:", str(e))
+        reply_photo_error(message, e, progress)
+
 
-        if "rate limit" in error_msg or "quota" in error_msg:
-            bot.reply_to(message, "Rate limit – wait 1–2 min ⏳")
-        elif "unavailable" in error_msg or "bad request" in error_msg:
-            bot.reply_to(message, "Model temporarily unavailable – try again soon")
+#all photos of an album in one model call, answered with one breakdown per photo and the total
+@timed_handler
+def handle_album(messages: list):
+    stages = PHOTO_STAGE_SECONDS.stopwatch()
+    message = messages[0]
+    progress = None
+    try:
+        # the same album forwarded again is answered from the cache
+        cache_key = "album:" + ",".join(m.photo[-1].file_unique_id for m in messages)
+        cached = inference_cache.get(cache_key)
+        stages.mark("cache_lookup")
+        if cached is not None:
+            result = cached["full_text"]
+            parsed = cached["parsed"]
         else:
-            bot.reply_to(message, f"Error: {str(e)[:180]}...")
+            if STREAM_RESPONSES:
+                progress = ProgressiveReply(message, f"🔍 Analyzing your {len(messages)} photos...")
+
+            uploads = [photo_upload_size(m.photo) for m in messages]
+            with image_budget.reserve(photo_reservation(uploads)):
+                stages.mark("budget_wait")
+                # each photo is re-encoded on the image pool while the next one downloads
+                prepared = [prepare_image_async(download_photo(upload), IMAGE_PIXEL_BUDGET) for upload in uploads]
+                stages.mark("download")
+                images = [p.result() for p in prepared]
+                stages.mark("resize")
+                result = analyze_album(images, on_partial=progress.update if progress else None)
+                stages.mark("inference")
+
+            if not result:
+                if progress:
+                    progress.finish("Couldn't analyze – try clearer photos!")
+                else:
+                    bot.reply_to(message, "Couldn't analyze – try clearer photos!")
+                return
+
+            parsed = parse_ai_result(result)
+            stages.mark("parse")
+            inference_cache.put(cache_key, None, parsed, result)
+            stages.mark("cache_store")
+
+        offer_save(message, progress, result, parsed)
+        stages.mark("reply")
+
+    except Exception as e:
+        reply_photo_error(message, e, progress)
+
+#a complete album goes back through the update queue, behind the user's earlier updates
+def queue_album(messages: list):
+    if not update_queue.submit(messages[0].from_user.id, messages):
+        UPDATES_TOTAL.inc("rejected")
+        bot.reply_to(messages[0], "The bot is very busy right now – please send the photos again in a minute ⏳")
+
+album_buffer = (SQLiteAlbumBuffer if STATE_BACKEND == "sqlite" else AlbumBuffer)(
+    queue_album, window=ALBUM_WINDOW).start()
+
+
+#admin: sample every thread's stack for N seconds and send back the hottest frames
+@bot.message_handler(commands=['profile'], func=lambda m: m.from_user.id in ADMIN_USER_IDS)
+@timed_handler
+def start_profile(message):
+    parts = message.text.split()
+    seconds = float(parts[1]) if len(parts) > 1 and parts[1].replace(".", "", 1).isdigit() else 30.0
+    seconds = min(seconds, 600.0)
+    chat_id = message.chat.id
+
+    def done(path, top):
+        bot.send_message(chat_id, f"Profile saved to {path}\n\n" + ("\n".join(top) or "No busy threads sampled."))
+
+    if profiler.start(seconds, on_done=done):
+        bot.reply_to(message, f"Profiling for {seconds:g} s...")
+    else:
+        bot.reply_to(message, "A profile is already running.")
+
+
+export_pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+_exports_running = set()
+_exports_lock = threading.Lock()
+
+def run_export(chat_id: int, user_id: int, fmt: str):
+    path = None
+    try:
+        path, name, rows = history_export.write_export(user_id, fmt)
+        if rows == 0:
+            bot.send_message(chat_id, "No history yet. Send a food photo to start! 📸")
+            return
+        with open(path, "rb") as f:
+            bot.send_document(chat_id, f, visible_file_name=name, caption=f"📦 {rows} meals")
+    except Exception as e:
+        print("Export failed:", str(e))
+        bot.send_message(chat_id, "Export failed – please try again later.")
+    finally:
+        if path is not None:
+            os.remove(path)
+        with _exports_lock:
+            _exports_running.discard(user_id)
+
+#send the user all their meals as a file: /export (CSV) or /export json (NDJSON)
+@bot.message_handler(commands=['export'])
+@timed_handler
+def export_history(message):
+    user_id = message.from_user.id
+    parts = message.text.split()
+    fmt = parts[1].lower() if len(parts) > 1 else "csv"
+    if fmt not in history_export.FORMATS:
+        bot.reply_to(message, "Usage: /export or /export json")
+        return
+
+    with _exports_lock:
+        if user_id in _exports_running:
+            bot.reply_to(message, "Your export is already being prepared ⏳")
+            return
+        _exports_running.add(user_id)
+    bot.reply_to(message, "Preparing your export... 📦")
+    export_pool.submit(run_export, message.chat.id, user_id, fmt)
 
 
 #clear records
 @bot.message_handler(commands=['clear'])
+@timed_handler
 def clear_history(message):
     user_id = message.from_user.id
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM history WHERE user_id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+    clear_user_history(user_id)
     bot.reply_to(message, "🗑️ Your history has been cleared!")
 
 
-#extract the data from exact pattern
-def parse_ai_result(text: str) -> dict:
-    """
-    Designed for this exact pattern:
-    🍽️Recognized: [description]
-    💪Protein: 38g 🥔Carbs: 92g 🧈Fat: 45g 🍬Sugar: 10g
-    🔥Calories: 850 kcal
-    [tips...]
-    """
-    result = {
-        "recognized": "Unknown",
-        "calories": 0.0,
-        "protein": 0.0,
-        "carbs": 0.0,
-        "fat": 0.0,
-        "sugar": 0.0,
-        "tips": ""
-    }
+#typed meal ("2 boiled eggs and toast"): looked up in the local nutrition table in a few
+#milliseconds, the model is only asked when an item is unknown or a poor match, and only
+#when the text names a food of the table or an amount with a unit; chat gets the hint.
+#Registered last, so commands and the /setprofile steps get their text first.
+@bot.message_handler(content_types=['text'], func=lambda m: not m.text.startswith("/"))
+@timed_handler
+def handle_meal_text(message):
+    progress = None
+    hint = "Send me a food photo, or describe a meal like \"2 boiled eggs and toast\" 🍳"
+    try:
+        items, unmatched = nutrition.resolve_meal(message.text)
+        if nutrition.confidence(items, unmatched) >= TEXT_MATCH_CONFIDENCE:
+            TEXT_MEALS.inc("local")
+            result, parsed = nutrition.describe(items)
+            offer_save(message, None, result, parsed)
+            return
+        if not nutrition.has_food_signal(message.text, items):
+            TEXT_MEALS.inc("no_food_signal")
+            bot.reply_to(message, hint)
+            return
+
+        progress = ProgressiveReply(message, "🔍 Estimating your meal...") if STREAM_RESPONSES else None
+        result = analyze_meal_text(message.text, on_partial=progress.update if progress else None)
+        if not result or "NOT_FOOD" in result:
+            TEXT_MEALS.inc("not_food")
+            if progress:
+                progress.finish(hint)
+            else:
+                bot.reply_to(message, hint)
+            return
+        TEXT_MEALS.inc("model")
+        offer_save(message, progress, result, parse_ai_result(result))
+    except Exception as e:
+        reply_photo_error(message, e, progress)
 
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
-
-    if not lines:
-        return result
-
-    # 1. Recognized (usually first line)
-    if "Recognized:" in lines[0]:
-        result["recognized"] = lines[0].split("Recognized:", 1)[1].strip()
-
-    # 2. Find macro line (contains Protein/Carbs/Fat/Sugar)
-    macro_line = None
-    calories_line = None
-
-    for line in lines:
-        if "Protein:" in line and ("Carbs:" in line or "Fat:" in line):
-            macro_line = line
-        if "Calories:" in line:
-            calories_line = line
-
-    # 3. Parse macro line (all on one line with emojis)
-    if macro_line:
-        # Remove emojis and zero-width spaces
-        clean = macro_line
-        for char in ['💪', '🥔', '🧈', '🍬', '🔥', '\u200b']:
-            clean = clean.replace(char, '')
-
-        # Now clean looks like: "Protein: 38g Carbs: 92g Fat: 45g Sugar: 10g"
-        # Use regex to find "Key: numberg"
-        import re
-        matches = re.findall(r'(\w+):\s*([\d.]+)g?', clean)
-
-        for key, value in matches:
-            try:
-                num = float(value)
-                key_lower = key.lower()
-                if "protein" in key_lower:
-                    result["protein"] = num
-                elif "carb" in key_lower:
-                    result["carbs"] = num
-                elif "fat" in key_lower:
-                    result["fat"] = num
-                elif "sugar" in key_lower:
-                    result["sugar"] = num
-            except ValueError:
-                pass
-
-    # 4. Parse calories line
-    if calories_line:
-        try:
-            # Get number after "Calories:"
-            after = calories_line.split("Calories:", 1)[1].strip()
-            # Extract first number (handles "850 kcal" or "850")
-            num_match = re.search(r'\d+\.?\d*', after)
-            if num_match:
-                result["calories"] = float(num_match.group())
-        except:
-            pass
-
-    # 5. Collect tips (lines after calories)
-    tips = []
-    tips_started = False
-    for line in lines:
-        if "Calories:" in line:
-            tips_started = True
-            continue
-        if tips_started:
-            tips.append(line.strip())
-
-    result["tips"] = ' '.join(tips).strip() if tips else ""
-
-    return result
 
 # Render gives you https://your-app-name.onrender.com
 render_hostname = os.environ.get("RENDER_EXTERNAL_HOSTNAME")
@@ -611,13 +1264,92 @@ WEBHOOK_URL = f"https://{render_hostname}{WEBHOOK_PATH}"
 def index():
     return "Calorie bot webhook is running 🚀", 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if METRICS_TOKEN and request.args.get("token") != METRICS_TOKEN:
+        abort(403)
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+def update_kind(update) -> str:
+    if update.callback_query is not None:
+        return "callback"
+    message = update.message or update.edited_message
+    if message is None:
+        return "other"
+    if message.photo:
+        return "photo"
+    text = message.text or ""
+    return text.split()[0].split("@")[0] if text.startswith("/") else "text"
+
+def process_update(update):
+    if isinstance(update, list):  # a complete album from album_buffer
+        with tracer.trace("album", photos=len(update)):
+            handle_album(update)
+        return
+    with tracer.trace(update_kind(update), update_id=update.update_id):
+        bot.process_new_updates([update])
+
+update_queue = UpdateQueue(process_update, workers=UPDATE_WORKERS, maxsize=UPDATE_QUEUE_SIZE)
+update_queue.start()
+
+if PROFILE_SECONDS > 0:
+    profiler.start(PROFILE_SECONDS)
+
+metrics.GaugeCallback("bot_update_queue_depth", "Updates waiting for a worker", update_queue.qsize)
+metrics.GaugeCallback("bot_update_queue_dropped", "Updates refused because the queue was full",
+                      lambda: update_queue.dropped)
+metrics.GaugeCallback("bot_inference_cache_hit_ratio", "Share of photo lookups answered from the cache",
+                      lambda: inference_cache.stats()["hit_rate"])
+metrics.GaugeCallback("bot_inference_cache_events", "Inference cache lookups and evictions",
+                      lambda: {k: v for k, v in inference_cache.stats().items() if k != "hit_rate"}, "event")
+metrics.GaugeCallback("bot_inference_limiter", "Hugging Face client-side limiter state",
+                      inference_limiter.stats, "field")
+metrics.GaugeCallback("bot_inference_router", "Model requests, hedged requests, hedges that won and failovers",
+                      inference_router.stats, "field")
+metrics.GaugeCallback("bot_inference_route_p95_seconds", "p95 time to first output of each model route",
+                      lambda: {name: r["p95"] for name, r in inference_router.route_stats().items()
+                               if r["p95"] is not None}, "route")
+metrics.GaugeCallback("bot_inference_route_demoted", "1 while a model route is demoted after failures",
+                      lambda: {name: int(r["demoted"]) for name, r in inference_router.route_stats().items()}, "route")
+metrics.GaugeCallback("bot_profile_cache", "Profile/BMR cache size, hits, misses and invalidations",
+                      lambda: {k: v for k, v in profile_cache.stats().items() if k != "hit_rate"}, "field")
+metrics.GaugeCallback("bot_profile_cache_hit_ratio", "Share of profile lookups answered from memory",
+                      lambda: profile_cache.stats()["hit_rate"])
+metrics.GaugeCallback("bot_image_budget", "Image memory budget: bytes in use and peak, photos admitted, waiting and timed out",
+                      image_budget.stats, "field")
+metrics.GaugeCallback("bot_album_buffer", "Albums answered, photos buffered and albums still collecting",
+                      album_buffer.stats, "field")
+metrics.GaugeCallback("bot_state_store_size", "Entries in the conversation state stores",
+                      lambda: {"pending_saves": len(pending_saves), "user_states": len(user_states)}, "store")
+for stat, help in (("approx_bytes", "Approximate bytes held by each conversation state store"),
+                   ("expired", "Entries the conversation state stores dropped after their TTL"),
+                   ("evicted", "Entries the conversation state stores dropped to stay under STATE_MAX_SIZE")):
+    metrics.GaugeCallback(f"bot_state_store_{stat}", help,
+                          lambda stat=stat: {store.name: store.stats()[stat] for store in (pending_saves, user_states)},
+                          "store")
+startup_step("handlers and update workers")
+print("Startup: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in startup_steps)
+      + f" (total {sum(seconds for _, seconds in startup_steps) * 1000:.0f} ms)")
+
+#updates from the same user always go to the same worker, so they stay in order
+def update_user_id(update) -> int:
+    for item in (update.message, update.edited_message, update.callback_query):
+        if item is not None and item.from_user is not None:
+            return item.from_user.id
+    return update.update_id
+
 @app.route(WEBHOOK_PATH, methods=['POST'])
 def telegram_webhook():
     if request.headers.get('content-type') == 'application/json':
         json_string = request.get_data().decode('utf-8')
         update = telebot.types.Update.de_json(json_string)
         if update:
-            bot.process_new_updates([update])
+            if not update_queue.submit(update_user_id(update), update):
+                # Queue is full: a non-2xx makes Telegram redeliver the update later
+                print("Update queue full, asking Telegram to retry")
+                UPDATES_TOTAL.inc("rejected")
+                return '', 503
+            UPDATES_TOTAL.inc("queued")
         return '', 200
     else:
         abort(403)
@@ -0,0 +1,87 @@
+import re
+import zlib
+from collections import Counter
+
+# Compression for the stored model answers (history_text.full_text / tips).
+# Each answer is only a few hundred bytes, too short for zlib to find much to
+# reuse on its own, but they all share the same format and vocabulary. A
+# preset dictionary (zlib's zdict) primes the compressor with that text.
+#
+# A stored value is one version byte followed by the raw deflate stream:
+#   0 = no dictionary, 1.. = DICTIONARIES[version].
+# Dictionaries are append-only: old rows stay readable after a new one is
+# added and CURRENT_VERSION is moved to it.
+
+_DEFAULT_DICTIONARY = (
+    "Break down by item. Portion size: small, medium, large. Cooking method: fried, grilled, "
+    "steamed, boiled, stir-fried, baked, deep-fried, roasted, curry, soup, noodles, rice, "
+    "bread, salad, dessert, drink, sauce, oil, butter, cheese, cream, sugar, coconut milk. "
+    "Estimated portion: about 100g 150g 200g 250g 300g, 1 cup, 1 bowl, 1 plate, 1 slice, 2 pieces. "
+    "chicken, pork, beef, fish, egg, tofu, prawn, shrimp, vegetables, cucumber, tomato, onion, "
+    "potato, fries, noodle soup, fried rice, white rice, brown rice, whole grain, sambal, chilli. "
+    "Tips: This meal is high in fat and sodium. Consider a smaller portion, "
+    "choose grilled instead of fried, skip the sauce, add more vegetables for fibre, "
+    "drink water instead of sugary drinks, and balance it with lighter meals later in the day. "
+    "It is a good source of protein. To reduce calories, ask for less oil and rice. "
+    "Total: Calories approximately, estimated total calories for the whole meal. "
+    "🍽️Recognized: \n💪Protein: g 🥔Carbs: g 🧈Fat: g 🍬Sugar: g\n🔥Calories: kcal\n"
+    "Tips: \n- **Recognized**: \n- **Protein**: g\n- **Carbs**: g\n- **Fat**: g\n"
+    "- **Sugar**: g\n- **Calories**: kcal\n"
+    "🍽️Recognized: with \n💪Protein: g 🥔Carbs: g 🧈Fat: g 🍬Sugar: g\n🔥Calories:  kcal\nTips: "
+).encode("utf-8")
+
+DICTIONARIES = {1: _DEFAULT_DICTIONARY}
+CURRENT_VERSION = 1
+LEVEL = 9
+
+
+def compress(text: str | None, version: int = CURRENT_VERSION) -> bytes | None:
+    if text is None:
+        return None
+    if version:
+        compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, -15, zdict=DICTIONARIES[version])
+    else:
+        compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, -15)
+    return bytes((version,)) + compressor.compress(text.encode("utf-8")) + compressor.flush()
+
+
+def decompress(blob: bytes | None) -> str | None:
+    if blob is None:
+        return None
+    version = blob[0]
+    if version:
+        decompressor = zlib.decompressobj(-15, zdict=DICTIONARIES[version])
+    else:
+        decompressor = zlib.decompressobj(-15)
+    return (decompressor.decompress(blob[1:]) + decompressor.flush()).decode("utf-8")
+
+
+def train_dictionary(samples, size: int = 16 * 1024) -> bytes:
+    """Build a zdict from sample answers: the most common lines and phrases, most useful last
+    (deflate reaches back 32 KB, and matches close to the data are encoded cheapest)."""
+    counts = Counter()
+    for text in samples:
+        for line in text.splitlines():
+            line = line.strip()
+            if line:
+                counts[line + "\n"] += 1
+            # runs of up to 4 words, so phrases inside differing lines are picked up too
+            words = re.findall(r"\S+\s*", line)
+            for n in (2, 3, 4):
+                for i in range(len(words) - n + 1):
+                    counts["".join(words[i:i + n])] += 1
+
+    # a phrase seen once is noise; weigh the rest by the bytes they would save
+    scored = sorted(((count * len(phrase.encode("utf-8")), phrase) for phrase, count in counts.items()
+                     if count > 1), reverse=True)
+    chosen = []
+    used = 0
+    for _, phrase in scored:
+        data = phrase.encode("utf-8")
+        if used + len(data) > size:
+            continue
+        if any(phrase in other for other in chosen):
+            continue
+        chosen.append(phrase)
+        used += len(data)
+    return "".join(reversed(chosen)).encode("utf-8")
@@ -0,0 +1,251 @@
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+# Opt-in request tracing and a sampling CPU profiler.
+#
+# trace(name) starts a trace for a sampled fraction of updates; span(name) and
+# @traced nested inside it record timed spans, and cost one thread-local lookup
+# when the update isn't sampled. A finished trace is appended to a rotating
+# file in the Chrome trace event format, which chrome://tracing, Perfetto
+# (ui.perfetto.dev) and speedscope open directly.
+#
+# The profiler samples every thread's stack with sys._current_frames() and
+# writes collapsed stacks ("a;b;c 12"), the input of flamegraph.pl/speedscope.
+
+_local = threading.local()
+
+# a sampled thread blocked in one of these is idle, not using CPU
+_IDLE_FILES = ("(threading.py:", "(queue.py:", "(selectors.py:", "(socketserver.py:")
+
+
+class TraceWriter:
+    """Appends trace events to <directory>/trace.json, rotating to trace.1.json ... when full."""
+
+    def __init__(self, directory: str, max_bytes: int = 5_000_000, backups: int = 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.path = os.path.join(directory, "trace.json")
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._file.tell() == 0:
+            # the array may stay unterminated, trace viewers accept that
+            self._file.write("[\n")
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            older = os.path.join(self.directory, f"trace.{i}.json")
+            if os.path.exists(older):
+                os.replace(older, os.path.join(self.directory, f"trace.{i + 1}.json"))
+        if self.backups:
+            os.replace(self.path, os.path.join(self.directory, "trace.1.json"))
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def write(self, events: list):
+        chunk = "".join(json.dumps(event, separators=(",", ":")) + ",\n" for event in events)
+        with self._lock:
+            if self._file is None:
+                self._open()
+            self._file.write(chunk)
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = 0.0, directory: str = "traces",
+                 max_bytes: int = 5_000_000, backups: int = 3):
+        self.sample_rate = sample_rate
+        self.writer = TraceWriter(directory, max_bytes, backups)
+        self.pid = os.getpid()
+        self.traces = 0
+
+    def trace(self, name: str, **args):
+        """Root span of one update. Only a sample_rate fraction of calls is recorded."""
+        if getattr(_local, "events", None) is not None or not self.sample_rate \
+                or random.random() >= self.sample_rate:
+            return _NOOP
+        return _RootSpan(self, name, args)
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name: str, args: dict | None):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        events = getattr(_local, "events", None)
+        if events is not None:
+            end = time.perf_counter()
+            event = {"name": self.name, "ph": "X", "ts": _local.ts(self.start),
+                     "dur": round((end - self.start) * 1e6, 1), "pid": _local.pid, "tid": _local.tid}
+            if exc_type is not None:
+                event["args"] = dict(self.args or {}, error=exc_type.__name__)
+            elif self.args:
+                event["args"] = self.args
+            events.append(event)
+        return False
+
+
+class _RootSpan(_Span):
+    __slots__ = ("tracer",)
+
+    def __init__(self, tracer: Tracer, name: str, args: dict):
+        super().__init__(name, args)
+        self.tracer = tracer
+
+    def __enter__(self):
+        # perf_counter is monotonic but has no epoch; anchor it to wall time once per trace
+        offset = time.time() - time.perf_counter()
+        _local.ts = lambda t: round((t + offset) * 1e6, 1)
+        _local.pid = self.tracer.pid
+        _local.tid = threading.get_native_id()
+        _local.events = []
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        events, _local.events = _local.events, None
+        try:
+            self.tracer.writer.write(events)
+            self.tracer.traces += 1
+        except OSError as e:
+            print("Trace write failed:", str(e))
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, **args):
+    """Child span of the current trace; a no-op when this update isn't traced."""
+    if getattr(_local, "events", None) is None:
+        return _NOOP
+    return _Span(name, args or None)
+
+
+def record(name: str, seconds: float, **args):
+    """Add a span that just ended and took `seconds` (for timings measured elsewhere)."""
+    events = getattr(_local, "events", None)
+    if events is not None:
+        end = time.perf_counter()
+        event = {"name": name, "ph": "X", "ts": _local.ts(end - seconds), "dur": round(seconds * 1e6, 1),
+                 "pid": _local.pid, "tid": _local.tid}
+        if args:
+            event["args"] = args
+        events.append(event)
+
+
+def traced(name: str | None = None):
+    """Decorator: run the function inside span(name or its __name__)."""
+    def decorate(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, "events", None) is None:
+                return fn(*args, **kwargs)
+            with _Span(span_name, None):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class SamplingProfiler:
+    """Statistical profiler: samples all thread stacks every `interval` seconds for a while.
+
+    The .folded file has every sample (wall-clock view); the summary passed to
+    on_done leaves out threads that were idle in a lock, queue or socket wait.
+    """
+
+    def __init__(self, directory: str = "traces", interval: float = 0.005):
+        self.directory = directory
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, on_done=None) -> bool:
+        """Profile for `seconds` in the background. on_done(path, top) gets the output file
+        and the most frequent leaf frames. Returns False if a profile is already running."""
+        with self._lock:
+            if self.running:
+                return False
+            self._thread = threading.Thread(target=self._run, args=(seconds, on_done),
+                                            name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, seconds: float, on_done):
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(stack))] += 1
+            samples += 1
+            time.sleep(self.interval)
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            if not any(name in leaf for name in _IDLE_FILES):
+                leaves[leaf] += count
+        total = sum(leaves.values()) or 1
+        top = [f"{count * 100 / total:5.1f}% {frame}" for frame, count in leaves.most_common(10)]
+        print(f"Profile written to {path} ({samples} samples)")
+        if on_done is not None:
+            try:
+                on_done(path, top)
+            except Exception as e:
+                print("Profile callback failed:", str(e))
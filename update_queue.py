@@ -0,0 +1,61 @@
+import queue
+import threading
+import zlib
+
+
+# Bounded work queue that sits between the Flask webhook and the bot handlers.
+# Every worker owns its own queue and an update is always routed to the worker
+# picked by its key (the Telegram user id), so one user's updates are handled
+# in the order they arrived while different users run in parallel.
+class UpdateQueue:
+    def __init__(self, handler, workers: int = 4, maxsize: int = 100):
+        self.handler = handler
+        self.workers = max(1, workers)
+        # maxsize is the total capacity, split evenly between the workers
+        per_worker = max(1, maxsize // self.workers)
+        self._queues = [queue.Queue(maxsize=per_worker) for _ in range(self.workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+        self.dropped = 0  # updates refused because their worker was full, from any webhook thread
+
+    def start(self):
+        if self._threads:
+            return
+        for i, q in enumerate(self._queues):
+            t = threading.Thread(target=self._run, args=(q,), name=f"update-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, key, item) -> bool:
+        """Queue item for the worker owning key. Returns False when that worker is full."""
+        # crc32 instead of hash() so the routing is stable between processes
+        index = zlib.crc32(str(key).encode()) % self.workers
+        try:
+            self._queues[index].put_nowait(item)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def qsize(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def stop(self, timeout: float = 5.0):
+        for q in self._queues:
+            q.put(None)
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _run(self, q: queue.Queue):
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            try:
+                self.handler(item)
+            except Exception as e:
+                print("Update worker error:", str(e))
+            finally:
+                q.task_done()
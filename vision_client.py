@@ -0,0 +1,139 @@
+import binascii
+import json
+import socket
+import urllib.request
+
+# Chat completion requests to the OpenAI-compatible vision endpoint (the
+# Hugging Face router, a self-hosted model or the fake inference server).
+#
+# huggingface_hub takes the messages as Python objects, so every photo was
+# held as raw bytes, a base64 str in the message and the JSON-encoded body at
+# the same time (and a JSON str on top while encoding). Here the request body
+# is one bytearray of its exact final size: the JSON around the images is
+# encoded once and each image is base64-encoded straight into its place, one
+# small chunk at a time. The body leaves out the model: complete() sends
+# {"model": ..., in front of it, so retries and every route of
+# inference_router share the same bytes.
+#
+# HTTP errors are urllib's HTTPError (.code, .headers), which rate_limiter's
+# error_status() / retry_after() understand.
+#
+# A request can be aborted from another thread (inference_router does it to a
+# hedged request that lost): on_connect gets a function that shuts the socket
+# down, which makes the blocked send or read in complete() raise right away.
+
+DEFAULT_BASE_URL = "https://router.huggingface.co/v1"
+REQUEST_TIMEOUT = 120.0
+# a multiple of 3, so no chunk but the last one ends in base64 padding
+_CHUNK = 3 * 16 * 1024
+_DATA_URL_PREFIX = "data:image/jpeg;base64,"
+# stands in for each image while the JSON around them is encoded (a prompt containing it is refused)
+_PLACEHOLDER = "\x00image\x00"
+_PLACEHOLDER_JSON = json.dumps(_PLACEHOLDER)[1:-1].encode()
+
+
+def chat_url(base_url: str | None) -> str:
+    """…/v1/chat/completions for a base URL given with or without /v1."""
+    base = (base_url or DEFAULT_BASE_URL).rstrip("/")
+    if not base.endswith("/v1"):
+        base += "/v1"
+    return base + "/chat/completions"
+
+
+def encoded_length(nbytes: int) -> int:
+    return 4 * ((nbytes + 2) // 3)
+
+
+def request_bytes(image_sizes: list) -> int:
+    """Memory one request holds for its images: the images themselves and their base64 in the body."""
+    return sum(size + encoded_length(size) for size in image_sizes)
+
+
+def chat_body(prompt: str, images: list, max_tokens: int, temperature: float, stream: bool) -> bytearray:
+    """JSON body (without "model") of a one-message chat request with the images as base64 data URLs."""
+    content = [{"type": "text", "text": prompt}]
+    content += [{"type": "image_url", "image_url": {"url": _DATA_URL_PREFIX + _PLACEHOLDER}} for _ in images]
+    payload = {
+        "messages": [{"role": "user", "content": content}],
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": stream,
+    }
+    parts = json.dumps(payload).encode().split(_PLACEHOLDER_JSON)
+    if len(parts) != len(images) + 1:
+        raise ValueError("prompt contains the image placeholder")
+
+    body = bytearray(sum(map(len, parts)) + sum(encoded_length(len(image)) for image in images))
+    pos = 0
+    for part, image in zip(parts, list(images) + [None]):
+        body[pos:pos + len(part)] = part
+        pos += len(part)
+        if image is None:
+            break
+        data = memoryview(image)
+        for start in range(0, len(data), _CHUNK):
+            encoded = binascii.b2a_base64(data[start:start + _CHUNK], newline=False)
+            body[pos:pos + len(encoded)] = encoded
+            pos += len(encoded)
+    return body
+
+
+class _AbortableHandler(urllib.request.HTTPHandler, urllib.request.HTTPSHandler):
+    """Hands every connection's abort function to on_connect once it is connected."""
+
+    def __init__(self, on_connect):
+        super().__init__()
+        self.on_connect = on_connect
+
+    def do_open(self, http_class, req, **http_conn_args):
+        on_connect = self.on_connect
+
+        class Connection(http_class):
+            def connect(self):
+                super().connect()
+                # urllib drops self.sock once the headers are in; the response reads on from it
+                sock = self.sock
+                on_connect(lambda: _shutdown(sock))
+
+        return super().do_open(Connection, req, **http_conn_args)
+
+
+def _shutdown(sock):
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass  # closed already
+
+
+def complete(url: str, token: str | None, model: str, body: bytearray, on_partial=None,
+             timeout: float = REQUEST_TIMEOUT, on_connect=None) -> str:
+    """POST a chat_body for model and return the answer text. With on_partial the body must
+    ask for stream=True; on_partial then gets the text so far after every chunk. on_connect
+    gets a function that aborts the request from another thread."""
+    # '{"model": "…", ' + the body after its opening brace, sent as two pieces without a copy
+    head = json.dumps({"model": model})[:-1].encode() + b", "
+    rest = memoryview(body)[1:]
+    headers = {"Content-Type": "application/json", "Content-Length": str(len(head) + len(rest))}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    request = urllib.request.Request(url, data=[head, rest], headers=headers, method="POST")
+    opener = urllib.request.build_opener(_AbortableHandler(on_connect)) if on_connect else None
+    with (opener.open if opener else urllib.request.urlopen)(request, timeout=timeout) as response:
+        if on_partial is None:
+            return json.load(response)["choices"][0]["message"]["content"].strip()
+
+        parts = []
+        for line in response:
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                break
+            choices = json.loads(data).get("choices")
+            if not choices:
+                continue
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                parts.append(delta)
+                on_partial("".join(parts))
+        return "".join(parts).strip()
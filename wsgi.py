@@ -0,0 +1,69 @@
+import importlib.util
+import os
+import sys
+import threading
+
+# WSGI entry point for running the webhook bot under gunicorn (or any WSGI server)
+# with several worker processes:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Every worker loads "telegram bot v7.2.py" once and serves its Flask app.
+# Conversation state then has to be shared, so STATE_BACKEND defaults to
+# "sqlite" here; everything else the bot keeps (history, inference cache,
+# profile cache epochs) already lives in the shared SQLite database.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BOT_SCRIPT = os.path.join(ROOT, "telegram bot v7.2.py")
+
+_bot_module = None
+_load_lock = threading.Lock()
+
+
+def load_bot():
+    """Import the bot script once per process and return the module."""
+    global _bot_module
+    with _load_lock:
+        if _bot_module is None:
+            # any worker may get any update, so the per-user dialog state can't stay in memory
+            os.environ.setdefault("STATE_BACKEND", "sqlite")
+            if ROOT not in sys.path:
+                sys.path.insert(0, ROOT)
+            spec = importlib.util.spec_from_file_location("calorie_bot", BOT_SCRIPT)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[spec.name] = module
+            spec.loader.exec_module(module)
+            _bot_module = module
+    return _bot_module
+
+
+def create_app():
+    """Application factory: gunicorn 'wsgi:create_app()'."""
+    return load_bot().app
+
+
+def set_webhook():
+    """Point Telegram at this deployment. Run once (gunicorn master), not in every worker."""
+    from dotenv import load_dotenv
+    import telebot
+
+    load_dotenv()
+    token = os.getenv("TELEGRAM_TOKEN")
+    hostname = os.getenv("RENDER_EXTERNAL_HOSTNAME")
+    if not token or not hostname:
+        print("TELEGRAM_TOKEN or RENDER_EXTERNAL_HOSTNAME not set, webhook left unchanged")
+        return False
+    url = f"https://{hostname}/{token}/"
+    if not telebot.TeleBot(token, threaded=False).set_webhook(url=url):
+        print("Webhook set failed!")
+        return False
+    print(f"Webhook set → https://{hostname}/<token>/")
+    return True
+
+
+def __getattr__(name):
+    # "wsgi:app" loads the bot on first access, so importing wsgi (e.g. from
+    # gunicorn.conf.py in the master process) doesn't start any bot threads
+    if name == "app":
+        return create_app()
+    raise AttributeError(name)